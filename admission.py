@@ -0,0 +1,216 @@
+"""エンドポイントの種類ごとの同時実行数の制御（アドミッション制御）
+
+リクエストをエンドポイントの種類（クラス）に分け、クラスごとに同時実行数の上限と短い待ち行列を設ける。
+プロセス全体の同時実行数は ADMISSION_CAPACITY（既定は接続プールの大きさ DB_POOL_SIZE + DB_MAX_OVERFLOW）までとし、
+優先度の低いクラスほど多くの枠を上位のクラスのために残す（reserve）。
+負荷が高まると、接続プールが埋まって接続待ちになる前に、優先度の低いリクエストから 503 で断る。
+
+- write: 書き込み（GET/HEAD/OPTIONS 以外の既定）
+- read: 受注一覧などの軽い参照（GET の既定）
+- heavy: 利益集計などの重い参照（@admission_class('heavy')）
+  同じ条件の集計をシングルフライトでまとめるエンドポイントは @admission_class('heavy', single_flight=True) とし、
+  ビューで admitted() を通して実行する。枠を使うのは実際に集計する先頭のリクエストだけで、
+  その結果を待つリクエストは断らない
+- export: 一括出力（@admission_class('export')。最も優先度が低い）
+
+1つのリクエストが追加の接続を使う場合（利益の並列集計など）は、acquire_extra で全体の枠からその分を確保する。
+
+クラスの設定は ADMISSION_CLASSES で上書きできる（limit: 同時実行数、queue: 待ち行列の長さ、
+wait: 待ち時間の上限（秒）、reserve: 上位のクラスのために残す枠の数）。
+"""
+import os
+import threading
+
+from flask import current_app, g, request
+from werkzeug.exceptions import ServiceUnavailable
+
+from metrics import get_metrics
+from replicas import SAFE_METHODS
+
+DEFAULT_CLASSES = {
+    'write': {'limit': 4, 'queue': 8, 'wait': 2.0, 'reserve': 0},
+    'read': {'limit': 6, 'queue': 8, 'wait': 1.0, 'reserve': 1},
+    'heavy': {'limit': 2, 'queue': 2, 'wait': 0.5, 'reserve': 3},
+    'export': {'limit': 1, 'queue': 0, 'wait': 0, 'reserve': 5},
+}
+
+# DBを使わないため制御の対象外とするエンドポイント
+DEFAULT_EXEMPT_ENDPOINTS = ('static', 'health_check')
+
+
+class AdmissionRejected(Exception):
+    """クラスの枠を確保できなかった（シングルフライトの結果を待つリクエストにも共有される）"""
+
+
+def admission_class(name, single_flight=False):
+    """エンドポイントのクラスを指定する（@main_bp.route の直下に付ける。None は制御の対象外）
+
+    single_flight=True の場合はリクエストの開始時に枠を確保せず、ビューが admitted() で確保する。
+    """
+    def decorator(view):
+        view.admission_class = name
+        view.admission_single_flight = single_flight
+        return view
+    return decorator
+
+
+class AdmissionController:
+    """クラスごとの実行中・待機中のリクエスト数を数え、受け付けるかどうかを決める"""
+
+    def __init__(self, classes, capacity, metrics):
+        self.classes = classes
+        self.capacity = capacity
+        self.metrics = metrics
+        self._condition = threading.Condition()
+        self._in_flight = {name: 0 for name in classes}
+        self._waiting = {name: 0 for name in classes}
+        self._total = 0
+
+    def _can_admit(self, name):
+        settings = self.classes[name]
+        return self._in_flight[name] < settings['limit'] \
+            and self._total < self.capacity - settings['reserve']
+
+    def _admit(self, name):
+        self._in_flight[name] += 1
+        self._total += 1
+        self.metrics.increment(f'admission.{name}.admitted')
+
+    def acquire(self, name):
+        """受け付ければ True、待ち行列が満杯か待ち時間を超えた場合は False"""
+        settings = self.classes[name]
+        with self._condition:
+            if self._can_admit(name):
+                self._admit(name)
+                return True
+            if self._waiting[name] >= settings['queue'] or settings['wait'] <= 0:
+                self.metrics.increment(f'admission.{name}.shed')
+                return False
+
+            self._waiting[name] += 1
+            self.metrics.increment(f'admission.{name}.queued')
+            try:
+                admitted = self._condition.wait_for(lambda: self._can_admit(name), timeout=settings['wait'])
+            finally:
+                self._waiting[name] -= 1
+            if not admitted:
+                self.metrics.increment(f'admission.{name}.shed')
+                return False
+            self._admit(name)
+            return True
+
+    def release(self, name):
+        with self._condition:
+            self._in_flight[name] -= 1
+            self._total -= 1
+            self._condition.notify_all()
+
+    def acquire_extra(self, name, count):
+        """クラス name の実行中のリクエストが追加で使う接続の枠を、空いている分だけ（最大 count）確保して数を返す
+
+        待たずに返すため、確保できた数に合わせて並列度を下げること。
+        """
+        with self._condition:
+            available = self.capacity - self.classes[name]['reserve'] - self._total
+            granted = max(0, min(count, available))
+            self._total += granted
+            if granted < count:
+                self.metrics.increment(f'admission.{name}.extra_denied')
+            return granted
+
+    def release_extra(self, count):
+        if count <= 0:
+            return
+        with self._condition:
+            self._total -= count
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                name: {'in_flight': self._in_flight[name], 'waiting': self._waiting[name]}
+                for name in self.classes
+            }
+
+
+def get_admission(app=None):
+    return (app or current_app).extensions.get('admission')
+
+
+def classify(endpoint, method):
+    """リクエストのクラス（制御の対象外は None）"""
+    if endpoint is None or endpoint in current_app.config['ADMISSION_EXEMPT_ENDPOINTS']:
+        return None
+    view = current_app.view_functions.get(endpoint)
+    if hasattr(view, 'admission_class'):
+        return view.admission_class
+    return 'read' if method in SAFE_METHODS else 'write'
+
+
+def current_class():
+    """実行中のリクエストのクラス（制御の対象外は None）"""
+    return g.get('admission_class') or g.get('admission_deferred')
+
+
+def admitted(func):
+    """クラスの枠を確保してから func を実行する関数を返す（確保できなければ AdmissionRejected）
+
+    シングルフライトに渡し、実際に実行する先頭のリクエストだけが枠を使うようにする。
+    """
+    name = g.get('admission_deferred')
+
+    def run():
+        if name is None:
+            return func()
+        admission = get_admission()
+        if not admission.acquire(name):
+            raise AdmissionRejected(f"Admission rejected for class {name}")
+        try:
+            return func()
+        finally:
+            admission.release(name)
+    return run
+
+
+def rejected_response():
+    """混雑のため断る 503 応答（Retry-After 付き）"""
+    error = ServiceUnavailable(description='現在混み合っています。しばらくしてから再度お試しください。')
+    response = current_app.make_response(current_app.handle_http_exception(error))
+    response.headers['Retry-After'] = str(current_app.config['ADMISSION_RETRY_AFTER'])
+    return response
+
+
+def _admit_request():
+    name = classify(request.endpoint, request.method)
+    if name is None:
+        return None
+    if getattr(current_app.view_functions.get(request.endpoint), 'admission_single_flight', False):
+        # 枠はビューが admitted() で確保する
+        g.admission_deferred = name
+        return None
+    if not get_admission().acquire(name):
+        return rejected_response()
+    g.admission_class = name
+    return None
+
+
+def _release_request(exception=None):
+    g.pop('admission_deferred', None)
+    name = g.pop('admission_class', None)
+    if name is not None:
+        get_admission().release(name)
+
+
+def init_app(app):
+    pool_capacity = int(os.environ.get('DB_POOL_SIZE', 5)) + int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    app.config.setdefault('ADMISSION_CAPACITY', int(os.environ.get('ADMISSION_CAPACITY', pool_capacity)))
+    app.config.setdefault('ADMISSION_RETRY_AFTER', int(os.environ.get('ADMISSION_RETRY_AFTER', 2)))
+    app.config.setdefault('ADMISSION_EXEMPT_ENDPOINTS', DEFAULT_EXEMPT_ENDPOINTS)
+    classes = {name: dict(settings) for name, settings in DEFAULT_CLASSES.items()}
+    for name, settings in app.config.get('ADMISSION_CLASSES', {}).items():
+        classes[name] = {**classes.get(name, DEFAULT_CLASSES['read']), **settings}
+    app.config['ADMISSION_CLASSES'] = classes
+
+    app.extensions['admission'] = AdmissionController(classes, app.config['ADMISSION_CAPACITY'], get_metrics(app))
+    app.before_request(_admit_request)
+    app.teardown_request(_release_request)
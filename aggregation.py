@@ -0,0 +1,161 @@
+"""受注金額の集計
+
+利益集計は、ホットな受注・アーカイブ明細・月次集計を重複なく合算して求める。
+PROFIT_AGGREGATION_SHARDS が 2 以上のときは期間を分割し、各区間を別の接続で並列に集計して
+Decimal で合算する（TiDB では、大きな1本の集計より複数の範囲検索を並列に流すほうが速いことがある）。
+
+並列集計の接続は、リクエストが使う接続とは別にプールから取られる。
+DB_MAX_OVERFLOW を PROFIT_AGGREGATION_WORKERS 以上にしておくこと。
+追加の接続はアドミッション制御の枠から確保し（空きがなければ並列度を下げるか、分割せずに集計する）、
+各接続のクエリにはリクエストのクエリの実行予算を引き継ぐ。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import false, func, or_, select, union_all
+
+from admission import current_class, get_admission
+from archive import add_months, covered_months, month_start
+from budgets import current_budget, using_budget
+from models import Order, OrderArchive, OrderMonthlyRollup
+
+AMOUNT_FIELDS = ('sales_amount', 'order_amount', 'invoiced_amount')
+
+
+def order_amount_sources(start_date, end_date, project_ids=None):
+    """期間内の受注金額を、ホットな受注・アーカイブ明細・月次集計から重複なく集めるサブクエリ
+
+    アーカイブは月単位で行うため、期間に丸ごと含まれる月は月次集計を、
+    期間の端にかかる月はアーカイブの明細を使う。
+    """
+    def amount_columns(model):
+        return (model.project_id, model.sales_amount, model.order_amount, model.invoiced_amount)
+
+    hot = select(*amount_columns(Order)).where(Order.order_date.between(start_date, end_date))
+    archived = select(*amount_columns(OrderArchive)).where(OrderArchive.order_date.between(start_date, end_date))
+    sources = [hot, archived]
+
+    months = covered_months(start_date, end_date)
+    if months is not None:
+        months_from, months_to = months
+        archived = archived.where(or_(OrderArchive.order_date < months_from, OrderArchive.order_date >= months_to))
+        rollups = select(*amount_columns(OrderMonthlyRollup))\
+            .where(OrderMonthlyRollup.month >= months_from, OrderMonthlyRollup.month < months_to)
+        sources = [hot, archived, rollups]
+
+    if project_ids is not None:
+        sources = [
+            source.where(source.selected_columns.project_id.in_(project_ids) if project_ids else false())
+            for source in sources
+        ]
+    return union_all(*sources).subquery()
+
+
+def amount_totals_columns(amounts):
+    """集計サブクエリから売上・受注・請求の合計を取り出す列"""
+    return [func.coalesce(func.sum(amounts.c[field]), 0) for field in AMOUNT_FIELDS]
+
+
+def split_date_range(start_date, end_date, shards):
+    """期間を最大 shards 個の連続した区間に分ける
+
+    月数が分割数以上あれば月初で区切り、月次集計をそのまま使えるようにする。
+    """
+    if start_date > end_date:
+        return [(start_date, end_date)]
+
+    months = []
+    month = month_start(start_date)
+    while month <= end_date:
+        months.append(month)
+        month = add_months(month, 1)
+
+    if len(months) >= shards:
+        size, extra = divmod(len(months), shards)
+        boundaries = []
+        index = 0
+        for shard in range(shards):
+            index += size + (1 if shard < extra else 0)
+            boundaries.append(months[index] if index < len(months) else None)
+    else:
+        days = (end_date - start_date).days + 1
+        shards = min(shards, days)
+        boundaries = [start_date + timedelta(days=days * (shard + 1) // shards) for shard in range(shards - 1)]
+        boundaries.append(None)
+
+    ranges = []
+    shard_start = start_date
+    for boundary in boundaries:
+        shard_end = end_date if boundary is None else boundary - timedelta(days=1)
+        ranges.append((shard_start, shard_end))
+        if boundary is None:
+            break
+        shard_start = boundary
+    return ranges
+
+
+_executor_lock = threading.Lock()
+
+
+def _executor():
+    """アプリケーションで共有する集計用スレッドプール（同時に使う接続数の上限になる）"""
+    with _executor_lock:
+        executor = current_app.extensions.get('profit_aggregation_executor')
+        if executor is None:
+            executor = current_app.extensions['profit_aggregation_executor'] = ThreadPoolExecutor(
+                max_workers=current_app.config['PROFIT_AGGREGATION_WORKERS'],
+                thread_name_prefix='profit-aggregation'
+            )
+        return executor
+
+
+def _to_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def _add_totals(totals, values):
+    return [total + _to_decimal(value) for total, value in zip(totals, values)]
+
+
+def _run_totals(engine, statements, budget):
+    """1つの接続で区間の集計を順に実行する（リクエストの予算を引き継ぐ）"""
+    totals = [Decimal(0)] * len(AMOUNT_FIELDS)
+    with using_budget(budget), engine.connect() as connection:
+        for statement in statements:
+            totals = _add_totals(totals, connection.execute(statement).one())
+    return totals
+
+
+def sum_amounts_sharded(engine, start_date, end_date, project_ids, shards):
+    """期間を分割して並列に集計し、(売上, 受注, 請求) の合計を Decimal で返す
+
+    追加の接続をアドミッション制御の枠から1つも確保できない場合は None を返す（呼び出し側で分割せずに集計する）。
+    """
+    statements = [
+        select(*amount_totals_columns(order_amount_sources(shard_start, shard_end, project_ids)))
+        for shard_start, shard_end in split_date_range(start_date, end_date, shards)
+    ]
+    connections = min(len(statements), current_app.config['PROFIT_AGGREGATION_WORKERS'])
+    admission = get_admission()
+    admission_class = current_class() or 'heavy'
+    if admission is not None:
+        connections = admission.acquire_extra(admission_class, connections)
+        if connections == 0:
+            return None
+
+    try:
+        budget = current_budget()
+        futures = [
+            _executor().submit(_run_totals, engine, statements[index::connections], budget)
+            for index in range(connections)
+        ]
+        totals = [Decimal(0)] * len(AMOUNT_FIELDS)
+        for future in futures:
+            totals = _add_totals(totals, future.result())
+        return tuple(totals)
+    finally:
+        if admission is not None:
+            admission.release_extra(connections)
@@ -12,6 +12,9 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
 
+import replicas
+import sqlite_mode
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
@@ -20,6 +23,15 @@ if not os.environ.get('VERCEL'):
     load_dotenv()
 
 def register_error_handlers(app):
+    # エラーコードごとに使うテンプレート名（初回に解決して以降は使い回す）
+    error_templates = {}
+
+    def error_template(code):
+        if code not in error_templates:
+            # エラーコードに対応するテンプレートがなければ汎用エラーページを使用
+            error_templates[code] = app.jinja_env.select_template([f'{code}.html', 'error.html']).name
+        return error_templates[code]
+
     @app.errorhandler(HTTPException)
     def handle_http_error(error):
         """HTTPエラーのハンドリング"""
@@ -38,12 +50,7 @@ def register_error_handlers(app):
             return jsonify(response), error.code
         
         # HTMLリクエストの場合はエラーページを返す
-        try:
-            # エラーコードに対応するテンプレートがある場合はそれを使用
-            return render_template(f'{error.code}.html'), error.code
-        except:
-            # テンプレートがない場合は汎用エラーページを使用
-            return render_template('error.html', error=error), error.code
+        return render_template(error_template(error.code), error=error), error.code
 
     @app.errorhandler(Exception)
     def handle_exception(error):
@@ -81,7 +88,7 @@ def register_error_handlers(app):
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': replicas.RoutingSession})
 
 # グローバルなlimiterインスタンスは保持（init_appでアプリケーションにアタッチ）
 limiter = Limiter(
@@ -113,16 +120,22 @@ def create_app(test_config=None):
         app.config["TESTING"] = False
 
     # データベース設定
-    if app.config.get("TESTING", False):
-        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    # 単一サーバー構成ではネットワーク越しのDBを使わず、ファイルのSQLiteを使う（sqlite_mode.py）
+    if not app.config.get("TESTING", False):
+        app.config.setdefault("SQLITE_PATH", os.environ.get("SQLITE_PATH"))
+    if app.config.get("SQLITE_PATH"):
+        sqlite_mode.configure(app)
+    elif app.config.get("TESTING", False):
+        app.config.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite:///:memory:")
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     else:
         # SQLAlchemy エンジンオプションを先に設定
+        # 接続プールはワーカープロセスごとに作られる（gunicorn.conf.py のスレッド数と合わせる）
         app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
             "pool_recycle": 300,
             "pool_pre_ping": True,
-            "pool_size": 5,
-            "max_overflow": 2,
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 2)),
             "connect_args": {
                 "connect_timeout": 10,
                 "ssl": {
@@ -142,6 +155,13 @@ def create_app(test_config=None):
         if all([MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_DATABASE]):
             MYSQL_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
             app.config["SQLALCHEMY_DATABASE_URI"] = MYSQL_URI
+
+            # 読み取りレプリカ（カンマ区切りのホスト名。認証情報とデータベース名はプライマリと同じ）
+            MYSQL_REPLICA_HOSTS = [host.strip() for host in os.environ.get("MYSQL_REPLICA_HOSTS", "").split(",") if host.strip()]
+            app.config["SQLALCHEMY_REPLICA_URIS"] = [
+                f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{host}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+                for host in MYSQL_REPLICA_HOSTS
+            ]
         else:
             # テスト環境でない場合のみエラーを発生させる
             missing_vars = [var for var, value in {
@@ -157,8 +177,34 @@ def create_app(test_config=None):
                 app.logger.warning(f"Using SQLite for testing. {error_msg}")
                 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
 
+    # 参照専用エンドポイントの読み取りレプリカへの振り分け（バインドはdbの初期化前に設定する）
+    app.config.setdefault("REPLICA_STICKY_SECONDS", int(os.environ.get('REPLICA_STICKY_SECONDS', 5)))
+    replicas.init_app(app)
+
     # このアプリインスタンス用のdbインスタンスを、設定が完了した後に作成
     db.init_app(app)
+    sqlite_mode.init_app(app, db)
+
+    # 受注変更のリアルタイム配信（サーバーレスでは接続を保持できないためポーリングに切り替える）
+    from events import OrderEventBroker
+    app.config.setdefault("ORDER_EVENTS_MODE", "poll" if os.environ.get('VERCEL') else "stream")
+    app.config.setdefault("ORDER_EVENTS_QUEUE_SIZE", 100)
+    # 配信の接続は1件につき1スレッドを占有するため、プロセスあたりの購読者数を制限する（超えた分はポーリング）
+    app.config.setdefault("ORDER_STREAM_MAX_SUBSCRIBERS", int(os.environ.get('ORDER_STREAM_MAX_SUBSCRIBERS', 4)))
+    app.extensions['order_events'] = OrderEventBroker(
+        queue_size=app.config["ORDER_EVENTS_QUEUE_SIZE"],
+        max_subscribers=app.config["ORDER_STREAM_MAX_SUBSCRIBERS"]
+    )
+
+    # 受注一覧・利益分析の初期データをHTMLに埋め込む（無効にすると画面表示後にAPIから取得する）
+    app.config.setdefault("INLINE_INITIAL_DATA", os.environ.get('INLINE_INITIAL_DATA', 'true') == 'true')
+
+    # ordersに残す直近の月数（これより古い受注は flask archive-orders でアーカイブへ移動する）
+    app.config.setdefault("ORDER_HOT_MONTHS", int(os.environ.get('ORDER_HOT_MONTHS', 24)))
+
+    # 利益集計の並列度（1は1本のクエリで集計する。WORKERSはプロセス内で同時に使う接続数の上限）
+    app.config.setdefault("PROFIT_AGGREGATION_SHARDS", int(os.environ.get('PROFIT_AGGREGATION_SHARDS', 1)))
+    app.config.setdefault("PROFIT_AGGREGATION_WORKERS", int(os.environ.get('PROFIT_AGGREGATION_WORKERS', 4)))
 
     # セキュリティ設定
     app.config['WTF_CSRF_ENABLED'] = True
@@ -166,7 +212,14 @@ def create_app(test_config=None):
     app.config['SESSION_COOKIE_SECURE'] = True
     app.config['SESSION_COOKIE_HTTPONLY'] = True
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    # リクエスト本文の上限（受注フォームとJSONのみを受け付けるため小さく抑える）
+    if app.config.get('MAX_CONTENT_LENGTH') is None:
+        app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 1024 * 1024))
     
+    # テンプレートのバイトコードキャッシュ（jinja_env を使う拡張機能より先に設定する）
+    import templating
+    templating.init_app(app)
+
     # 拡張機能をアプリで初期化
     login_manager.init_app(app)
     csrf.init_app(app)
@@ -199,6 +252,47 @@ def create_app(test_config=None):
     from routes import main_bp
     app.register_blueprint(main_bp)
 
+    # スキーマ移行コマンド（flask db-upgrade / flask db-status）
+    from migrations import register_commands
+    register_commands(app)
+
+    # 受注アーカイブコマンド（flask archive-orders）
+    import archive
+    archive.register_commands(app)
+
+    # 書き込み競合などの一時的なエラーの再試行（retry.py）
+    import retry
+    retry.init_app(app)
+
+    # エンドポイントの種類ごとの同時実行数の制御（接続プールが埋まる前に優先度の低いリクエストを503で断る）
+    import admission
+    admission.init_app(app)
+
+    # リクエストごとのクエリの実行時間・SQL文の数の上限（超えた場合は503）
+    import budgets
+    budgets.init_app(app, db)
+
+    # 差分同期で確定を待つ秒数（updated_at・deleted_at の採番からコミットまでにかかりうる時間）。
+    # 実行予算の期限後は新たなSQL文を実行しないため、期限（QUERY_TIMEOUT_MS）と最後の文のロック待ち（同じ秒数）の合計とする
+    query_timeout = app.config["QUERY_TIMEOUT_MS"] / 1000 or 30
+    app.config.setdefault("SYNC_SETTLE_SECONDS", float(os.environ.get('SYNC_SETTLE_SECONDS', query_timeout * 2 + 1)))
+    # 差分同期の削除記録の保持日数（flask purge-order-tombstones。これより古い同期トークンは全件の取り直しになる）
+    app.config.setdefault("ORDER_TOMBSTONE_RETENTION_DAYS", int(os.environ.get('ORDER_TOMBSTONE_RETENTION_DAYS', 30)))
+
+    # 登録APIの Idempotency-Key（flask purge-idempotency-keys）
+    import idempotency
+    idempotency.init_app(app)
+
+    # 受注の変更履歴（コミット後にキューへ積み、バックグラウンドでまとめて書き込む）
+    import audit
+    audit.init_app(app, db)
+
+    # JSON応答の圧縮と、ハッシュ付き・事前圧縮済みの静的ファイル（flask build-assets）
+    import compression
+    import assets
+    compression.init_app(app)
+    assets.init_app(app)
+
     @csrf.exempt
     @app.route('/health')
     @login_manager.exempt
@@ -211,6 +305,9 @@ def create_app(test_config=None):
 
     with app.app_context():
         import models  # noqa: F401
+        import dimensions  # noqa: F401
+
+        replicas.forget_replica_metadata(db)
 
         if app.config["TESTING"]:
             db.create_all()
@@ -219,8 +316,9 @@ def create_app(test_config=None):
 
 # アプリケーションが直接実行された場合にのみインスタンスを作成
 if __name__ == '__main__':
+    # 開発用サーバー（本番は gunicorn -c gunicorn.conf.py main:app で起動する）
     app = create_app()
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
 elif os.environ.get('TESTING') == 'true':
     # テスト環境用の設定
     app = create_app({
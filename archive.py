@@ -0,0 +1,150 @@
+"""保持期間を過ぎた受注のアーカイブ
+
+orders には直近 ORDER_HOT_MONTHS か月分の受注だけを残し、それより古い受注は
+月単位で orders_archive へ移動する。移動した月は案件別の月次集計
+（order_monthly_rollups）を作り直し、利益集計はホットな明細と集計を組み合わせて求める。
+
+差分同期の削除記録（order_tombstones）は ORDER_TOMBSTONE_RETENTION_DAYS 日を過ぎたものを
+flask purge-order-tombstones で削除する（それより古い同期トークンは全件の取り直しになる）。
+"""
+import logging
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import delete, distinct, func, insert, literal, select
+
+from app import db
+from models import Order, OrderArchive, OrderMonthlyRollup, OrderTombstone
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def add_months(value, months):
+    """月初日に月数を加算する（負数で減算）"""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def hot_cutoff(today=None, hot_months=None):
+    """この日付より前の受注をアーカイブ対象とする（常に月初日）"""
+    if hot_months is None:
+        hot_months = current_app.config['ORDER_HOT_MONTHS']
+    return add_months(month_start(today or date.today()), -hot_months)
+
+
+def covered_months(start_date, end_date):
+    """期間に丸ごと含まれる月の範囲 [from, to) を返す（含まれる月がなければ None）"""
+    months_from = start_date if start_date.day == 1 else add_months(month_start(start_date), 1)
+    months_to = month_start(end_date + timedelta(days=1))
+    if months_from >= months_to:
+        return None
+    return months_from, months_to
+
+
+def _rebuild_rollups(connection, months):
+    """指定した月の月次集計をアーカイブの明細から作り直す"""
+    for month in sorted(months):
+        connection.execute(delete(OrderMonthlyRollup).where(OrderMonthlyRollup.month == month))
+        connection.execute(insert(OrderMonthlyRollup).from_select(
+            ['project_id', 'month', 'order_count', 'sales_amount', 'order_amount', 'invoiced_amount'],
+            select(
+                OrderArchive.project_id,
+                literal(month, OrderMonthlyRollup.month.type),
+                func.count(),
+                func.sum(OrderArchive.sales_amount),
+                func.sum(OrderArchive.order_amount),
+                func.sum(OrderArchive.invoiced_amount)
+            )
+            .where(OrderArchive.order_date >= month, OrderArchive.order_date < add_months(month, 1))
+            .where(OrderArchive.project_id.isnot(None))
+            .group_by(OrderArchive.project_id)
+        ))
+
+
+def archive_orders(engine, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """cutoff より前の受注をバッチごとに移動し、移動した件数を返す
+
+    各バッチは明細の移動・削除記録・月次集計の更新を1トランザクションで行うため、
+    途中で中断しても明細と集計がずれることはない。
+    """
+    order_columns = [column.name for column in Order.__table__.columns]
+    archived = 0
+    while True:
+        with engine.begin() as connection:
+            ids = connection.execute(
+                select(Order.id).where(Order.order_date < cutoff).order_by(Order.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+
+            archived_at = datetime.utcnow()
+            months = {month_start(value) for value in connection.execute(
+                select(distinct(Order.order_date)).where(Order.id.in_(ids))
+            ).scalars()}
+            connection.execute(insert(OrderArchive).from_select(
+                order_columns + ['archived_at'],
+                select(*[Order.__table__.c[name] for name in order_columns],
+                       literal(archived_at, OrderArchive.archived_at.type))
+                .where(Order.id.in_(ids))
+            ))
+            connection.execute(delete(Order).where(Order.id.in_(ids)))
+            _rebuild_rollups(connection, months)
+            # 差分同期中のクライアントからも取り除かれるよう削除として記録する
+            # （差分同期は採番からコミットまでの時間を待つため、コミットの直前に採番する）
+            deleted_at = datetime.utcnow()
+            connection.execute(
+                insert(OrderTombstone), [{'order_id': order_id, 'deleted_at': deleted_at} for order_id in ids]
+            )
+
+        archived += len(ids)
+        logging.info(f"Archived {len(ids)} orders (months: {', '.join(m.strftime('%Y-%m') for m in sorted(months))})")
+    return archived
+
+
+def purge_tombstones(engine, retention_days, now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """保持期間を過ぎた削除記録をバッチごとに削除し、削除した件数を返す"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    purged = 0
+    while True:
+        with engine.begin() as connection:
+            ids = connection.execute(
+                select(OrderTombstone.id).where(OrderTombstone.deleted_at < cutoff)
+                .order_by(OrderTombstone.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            connection.execute(delete(OrderTombstone).where(OrderTombstone.id.in_(ids)))
+        purged += len(ids)
+    return purged
+
+
+def register_commands(app):
+    @app.cli.command('archive-orders')
+    @click.option('--hot-months', type=int, default=None, help='ordersに残す月数（既定は ORDER_HOT_MONTHS）')
+    @click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='1トランザクションで移動する件数')
+    @click.option('--dry-run', is_flag=True, help='対象件数の表示のみ行う')
+    def archive_orders_command(hot_months, batch_size, dry_run):
+        """保持期間を過ぎた受注をアーカイブへ移動する"""
+        cutoff = hot_cutoff(hot_months=hot_months)
+        if dry_run:
+            with db.engine.connect() as connection:
+                count = connection.execute(
+                    select(func.count()).select_from(Order).where(Order.order_date < cutoff)
+                ).scalar()
+            click.echo(f"{count} orders before {cutoff} would be archived")
+            return
+        archived = archive_orders(db.engine, cutoff, batch_size=batch_size)
+        click.echo(f"Archived {archived} orders before {cutoff}")
+
+    @app.cli.command('purge-order-tombstones')
+    @click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='1トランザクションで削除する件数')
+    def purge_order_tombstones_command(batch_size):
+        """保持期間を過ぎた差分同期の削除記録を削除する"""
+        retention_days = app.config['ORDER_TOMBSTONE_RETENTION_DAYS']
+        purged = purge_tombstones(db.engine, retention_days, batch_size=batch_size)
+        click.echo(f"Purged {purged} order tombstones older than {retention_days} days")
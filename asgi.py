@@ -0,0 +1,229 @@
+"""非同期（ASGI）の参照API
+
+/api/orders・/api/projects・/api/profit-data の GET を非同期エンジン（aiomysql、テストでは aiosqlite）で処理し、
+それ以外のリクエストは従来の Flask アプリへ渡す。データベースの往復を待つ間もワーカーを占有しないため、
+同時に処理できるリクエスト数が「プール数 × ワーカー数」に縛られない。
+絞り込み条件・集計クエリ・シリアライズは同期版（routes.py / models.py）と共通。
+
+    uvicorn --factory asgi:create_asgi_app
+
+非同期ドライバと asgiref は任意依存（pip install ".[async]"）。
+レート制限は Flask-Limiter が WSGI 側でのみ動作するため、この経路では適用されない。
+"""
+import json
+import logging
+import math
+import random
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl
+
+from itsdangerous import BadSignature
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.datastructures import MultiDict
+
+from app import app as default_app
+from models import User, Order, OrderArchive, Project, ORDER_FIELDS
+from replicas import STICKY_SESSION_KEY
+from sqlite_mode import apply_pragmas, pragmas
+from aggregation import amount_totals_columns, order_amount_sources
+from routes import _order_fields, _order_filter_criteria, _order_list_body, _project_has_orders
+
+# 同期ドライバに対応する非同期ドライバ
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+DATE_FORMAT_ERROR = '日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。'
+
+
+def async_database_uri(uri):
+    """同期用の接続URIを非同期ドライバのURIに変換する"""
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+class AsyncReadApi:
+    """参照APIを非同期に処理し、それ以外を Flask アプリへ渡す ASGI アプリ"""
+
+    def __init__(self, flask_app, fallback=None):
+        self.flask_app = flask_app
+        self.fallback = fallback
+        self.routes = {
+            '/api/orders': self.get_orders,
+            '/api/projects': self.get_projects,
+            '/api/profit-data': self.get_profit_data,
+        }
+
+        config = flask_app.config
+        options = {
+            key: value for key, value in config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).items()
+            if key in ('pool_recycle', 'pool_pre_ping', 'pool_size', 'max_overflow')
+        }
+        self.primary = create_async_engine(
+            config.get('ASYNC_SQLALCHEMY_DATABASE_URI') or async_database_uri(config['SQLALCHEMY_DATABASE_URI']),
+            **options
+        )
+        self.replicas = [
+            create_async_engine(async_database_uri(uri), **options)
+            for uri in config.get('SQLALCHEMY_REPLICA_URIS') or []
+        ]
+        if config.get('SQLITE_PATH'):
+            apply_pragmas(self.primary.sync_engine, pragmas(flask_app))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        handler = self.routes.get(scope.get('path'))
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD') and handler is not None:
+            await self._handle(handler, scope, send)
+            return
+        if self.fallback is None:
+            await self._send_json(send, {'error': 'Not Found'}, 404)
+            return
+        await self.fallback(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispose(self):
+        for engine in [self.primary, *self.replicas]:
+            await engine.dispose()
+
+    async def _handle(self, handler, scope, send):
+        flask_session = self._load_session(scope)
+        args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        try:
+            async with AsyncSession(self._engine_for(flask_session), expire_on_commit=False) as db_session:
+                if not await self._is_authenticated(db_session, flask_session):
+                    await self._send_json(send, {'error': '認証が必要です'}, 401)
+                    return
+                body, status = await handler(db_session, args)
+        except Exception as e:
+            logging.error(f"Error in async read API {scope.get('path')}: {e}")
+            body, status = {'error': 'データの取得中にエラーが発生しました'}, 500
+        await self._send_json(send, body, status)
+
+    def _load_session(self, scope):
+        """Flask の署名付きセッションクッキーを検証して中身を返す"""
+        cookie_name = self.flask_app.config['SESSION_COOKIE_NAME']
+        cookies = {}
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                for part in value.decode('latin-1').split(';'):
+                    key, _, cookie_value = part.strip().partition('=')
+                    cookies[key] = cookie_value
+        if cookie_name not in cookies:
+            return {}
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        try:
+            return serializer.loads(
+                cookies[cookie_name],
+                max_age=int(self.flask_app.permanent_session_lifetime.total_seconds())
+            )
+        except BadSignature:
+            return {}
+
+    def _engine_for(self, flask_session):
+        # 自分の更新直後はプライマリから読む（同期版の replicas.py と同じ規則）
+        if self.replicas and flask_session.get(STICKY_SESSION_KEY, 0) <= time.time():
+            return random.choice(self.replicas)
+        return self.primary
+
+    async def _is_authenticated(self, db_session, flask_session):
+        user_id = flask_session.get('_user_id')
+        if user_id is None:
+            return False
+        user = await db_session.get(User, int(user_id))
+        return user is not None and user.is_active
+
+    async def _send_json(self, send, body, status):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(payload)).encode('latin-1')),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def get_orders(self, db_session, args):
+        page = args.get('page', 1, type=int)
+        per_page = min(args.get('per_page', 50, type=int), 100)
+        model = OrderArchive if args.get('archived') == 'true' else Order
+        fields, unknown = _order_fields(args)
+        if unknown:
+            return {'error': f"指定できない項目です: {', '.join(unknown)}", 'fields': list(ORDER_FIELDS)}, 400
+        try:
+            criteria = _order_filter_criteria(args, model)
+        except ValueError:
+            return {'error': DATE_FORMAT_ERROR}, 400
+
+        total = (await db_session.execute(
+            select(func.count()).select_from(model).where(*criteria)
+        )).scalar()
+        rows = (await db_session.execute(
+            select(*[getattr(model, field) for field in fields]).where(*criteria)
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(per_page).offset((max(page, 1) - 1) * per_page)
+        )).all()
+
+        return {
+            **_order_list_body(rows, fields, args.get('format') == 'compact'),
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': math.ceil(total / per_page) if total and per_page > 0 else 0
+        }, 200
+
+    async def get_projects(self, db_session, args):
+        projects = (await db_session.execute(
+            select(Project.name).where(_project_has_orders()).order_by(Project.name)
+        )).scalars().all()
+        return {'projects': list(projects)}, 200
+
+    async def get_profit_data(self, db_session, args):
+        project_name = args.get('project_name')
+        try:
+            start_date = datetime.strptime(args.get('start_date'), '%Y-%m-%d').date()
+            end_date = datetime.strptime(args.get('end_date'), '%Y-%m-%d').date()
+        except ValueError:
+            return {'error': DATE_FORMAT_ERROR}, 400
+
+        project_ids = None
+        if project_name != 'all':
+            project_id = (await db_session.execute(
+                select(Project.id).where(Project.name == project_name)
+            )).scalar()
+            project_ids = [project_id] if project_id is not None else []
+
+        amounts = order_amount_sources(start_date, end_date, project_ids)
+        totals = (await db_session.execute(select(*amount_totals_columns(amounts)))).one()
+        return {
+            'total_sales_amount': float(totals[0]),
+            'total_order_amount': float(totals[1]),
+            'total_invoiced_amount': float(totals[2])
+        }, 200
+
+
+def create_asgi_app(flask_app=None):
+    """ASGI アプリを作成する（Flask アプリへの受け渡しには asgiref を使う）"""
+    from asgiref.wsgi import WsgiToAsgi
+
+    if flask_app is None:
+        # app.py の読み込み時に作成されたインスタンスを使う（ここで create_app() を呼ぶと2つ作られる）
+        flask_app = default_app
+    return AsyncReadApi(flask_app, fallback=WsgiToAsgi(flask_app))
@@ -0,0 +1,124 @@
+"""静的ファイルのビルド（内容ハッシュ付きのファイル名と事前圧縮）
+
+    flask build-assets
+
+static 配下のファイルを static/dist へ「名前.<ハッシュ>.拡張子」でコピーし、
+テキスト系のファイルは .gz（brotli があれば .br も）を合わせて作成する。
+元のパスとの対応は static/dist/manifest.json に書き出し、起動時に読み込んで
+url_for('static', filename=...) がハッシュ付きのパスを返すようにする。
+ハッシュ付きのファイルは内容が変われば名前も変わるため、Cache-Control: immutable で1年間キャッシュさせる。
+マニフェストがなければ（開発環境など）従来どおり元のファイルを返す。
+static/dist はリポジトリに含めないため、Vercel へのデプロイでは .github/workflows/vercel_deploy.yml が
+vercel build の前にこのコマンドを実行する（他の環境でもデプロイの前に実行すること）。
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory
+
+from compression import brotli, choose_encoding
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# 事前圧縮したファイルの拡張子
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def hashed_name(path, content):
+    root, extension = os.path.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+
+
+def build_assets(static_folder):
+    """静的ファイルをハッシュ付きの名前で static/dist へ書き出し、マニフェストを返す"""
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist_folder, ignore_errors=True)
+
+    manifest = {}
+    for directory, subdirectories, filenames in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder):
+            subdirectories[:] = [name for name in subdirectories if name != DIST_DIR]
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            path = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            target = f'{DIST_DIR}/{hashed_name(path, content)}'
+            target_path = os.path.join(static_folder, *target.split('/'))
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(target_path, 'wb') as f:
+                f.write(content)
+            if filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                with open(target_path + ENCODING_SUFFIXES['gzip'], 'wb') as f:
+                    f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target_path + ENCODING_SUFFIXES['br'], 'wb') as f:
+                        f.write(brotli.compress(content, quality=11))
+            manifest[path] = target
+
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    """ビルド済みのマニフェストを読み込む（なければ空）"""
+    path = os.path.join(app.static_folder, DIST_DIR, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    app.extensions['asset_manifest'] = manifest
+    app.extensions['hashed_assets'] = set(manifest.values())
+    return manifest
+
+
+def _hashed_static_url(endpoint, values):
+    if endpoint == 'static':
+        filename = values.get('filename')
+        values['filename'] = current_app.extensions['asset_manifest'].get(filename, filename)
+
+
+def send_static(filename):
+    """ハッシュ付きのファイルは事前圧縮版を選び、immutable で返す"""
+    if filename not in current_app.extensions['hashed_assets']:
+        return current_app.send_static_file(filename)
+
+    static_folder = current_app.static_folder
+    encoding = choose_encoding(request.accept_encodings)
+    suffix = ENCODING_SUFFIXES.get(encoding)
+    if suffix is None or not os.path.exists(os.path.join(static_folder, *(filename + suffix).split('/'))):
+        encoding, suffix = None, ''
+
+    response = send_from_directory(
+        static_folder, filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        max_age=IMMUTABLE_MAX_AGE
+    )
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    load_manifest(app)
+    app.url_defaults(_hashed_static_url)
+    app.view_functions['static'] = send_static
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """静的ファイルをハッシュ付きの名前で書き出し、事前圧縮する"""
+        manifest = build_assets(app.static_folder)
+        click.echo(f"Built {len(manifest)} assets into {os.path.join(app.static_folder, DIST_DIR)}")
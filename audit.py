@@ -0,0 +1,317 @@
+"""受注の変更履歴（ライトビハインド）
+
+受注の追加・更新・削除をセッションのイベントで捉え、列ごとの差分を order_changes に記録する。
+変更はトランザクションがコミットされた時点でプロセス内の上限付きキューに積み、
+バックグラウンドのスレッドがまとめて INSERT するため、受注の更新処理に書き込みは増えない。
+
+- ORM の追加・変更・削除（session.add など）は after_flush で変更前後の値を記録する
+  （変更前の値は読み込み済みの場合のみ。コミット後に再読み込みせず代入した列は変更前を None とする）
+- UPDATE/DELETE 文（routes.py の更新・削除）は do_orm_execute で捉える。
+  UPDATE 文で書き込んだ値は、呼び出し元が実行オプション audit_values で渡す（渡さない場合は列の差分を記録しない）。
+  事前の SELECT を行わないため、書き込み時にその受注の直前までの履歴から最後に記録された値を求めて変更前の値とし、
+  値の変わらない列は記録しない（履歴のない列は変更前を None とする。複数のプロセスが同じ受注を同時に更新した場合、
+  変更前の値は各プロセスが書き込んだ順の履歴に基づく）
+- キューが満杯のときは呼び出し元のスレッドで同期的に書き込み、履歴を取りこぼさない
+- プロセス終了時（atexit）はキューに残った履歴を同期的に書き込む
+- テスト時はスレッドを起動せず、コミット時に同期的に書き込む
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+from sqlalchemy.sql import operators
+
+from metrics import get_metrics
+from models import Order, OrderChange
+from replicas import RoutingSession
+
+PENDING_KEY = 'audit_pending'
+COMMITTED_KEY = 'audit_committed'
+# UPDATE 文の履歴のうち、書き込み時に直前の履歴から変更前の値を補うもの（書き込む前に取り除く）
+RESOLVE_PREVIOUS_KEY = 'resolve_previous'
+
+
+class AuditLog:
+    """変更履歴をキューに溜め、まとめて書き込む"""
+
+    def __init__(self, engine, metrics, queue_size=10000, batch_size=200, flush_interval=1.0, background=True):
+        self.engine = engine
+        self.metrics = metrics
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+
+    def enqueue(self, entries):
+        if not self.background:
+            self._write(entries)
+            return
+        self._ensure_thread()
+        overflow = []
+        for entry in entries:
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                overflow.append(entry)
+        self.metrics.increment('audit.enqueued', len(entries) - len(overflow))
+        if overflow:
+            # 書き込みが追いつかない場合は呼び出し元で書き込む（履歴は捨てない）
+            self.metrics.increment('audit.overflow', len(overflow))
+            self._write(overflow)
+
+    def flush(self):
+        """キューに残っている履歴をすべて書き込む"""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # フォーク後の子プロセスでは親のキューとスレッドを引き継がない
+                self._queue = queue.Queue(maxsize=self.queue_size)
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take(block=True)
+            if batch:
+                self._write(batch)
+
+    def _take(self, block):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval) if block else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, entries):
+        try:
+            with self._write_lock, self.engine.begin() as connection:
+                _resolve_previous_values(connection, entries)
+                connection.execute(insert(OrderChange), entries)
+            self.metrics.increment('audit.written', len(entries))
+        except Exception as e:
+            self.metrics.increment('audit.failed', len(entries))
+            logging.error(f"Failed to write {len(entries)} order change entries: {e}")
+
+
+def _last_known_values(connection, order_id):
+    """受注の履歴を新しい順にたどり、列ごとに最後に記録された値を返す"""
+    rows = connection.execute(
+        select(OrderChange.action, OrderChange.changes)
+        .where(OrderChange.order_id == order_id)
+        .order_by(OrderChange.changed_at.desc(), OrderChange.id.desc())
+    )
+    values = {}
+    for action, changes in rows:
+        if action == 'delete':
+            break
+        for key, (_, new) in json.loads(changes).items():
+            values.setdefault(key, new)
+        if action == 'create':
+            break
+    return values
+
+
+def _resolve_previous_values(connection, entries):
+    """UPDATE 文の履歴に変更前の値を補い、値の変わらない列を除く（entries は古い順）"""
+    order_ids = {entry['order_id'] for entry in entries if entry.get(RESOLVE_PREVIOUS_KEY)}
+    order_ids.discard(None)
+    known = {}
+    for entry in entries:
+        resolve = entry.pop(RESOLVE_PREVIOUS_KEY, False)
+        order_id = entry['order_id']
+        if order_id not in order_ids:
+            continue
+        if order_id not in known:
+            known[order_id] = _last_known_values(connection, order_id)
+        last = known[order_id]
+        changes = json.loads(entry['changes'])
+        if resolve:
+            changes = {
+                key: [last.get(key), new] for key, (_, new) in changes.items()
+                if key not in last or last[key] != new
+            }
+            entry['changes'] = json.dumps(changes, ensure_ascii=False, sort_keys=True)
+
+        # 同じバッチの後続の履歴のために、最後に記録された値を更新する
+        if entry['action'] == 'delete':
+            last.clear()
+        else:
+            last.update({key: new for key, (_, new) in changes.items()})
+
+
+def get_audit_log(app=None):
+    return (app or current_app).extensions.get('audit_log')
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _current_user_id():
+    # フラッシュ中にユーザーを読み込まないよう、読み込み済みのユーザーの主キーのみを使う
+    if not has_request_context():
+        return None
+    user = g.get('_login_user')
+    state = inspect(user, raiseerr=False) if user is not None else None
+    if state is None or state.identity is None:
+        return None
+    return state.identity[0]
+
+
+def _entry(order_id, action, changes):
+    return {
+        'order_id': order_id,
+        'action': action,
+        'user_id': _current_user_id(),
+        'changes': json.dumps(changes, ensure_ascii=False, sort_keys=True),
+        'changed_at': datetime.utcnow(),
+    }
+
+
+def _add_pending(session, entries):
+    if entries and has_app_context() and get_audit_log() is not None:
+        session.info.setdefault(PENDING_KEY, []).extend(entries)
+
+
+def _column_attributes():
+    return [attribute for attribute in inspect(Order).column_attrs]
+
+
+def _instance_changes(instance, action):
+    state = inspect(instance)
+    changes = {}
+    for attribute in _column_attributes():
+        history = state.attrs[attribute.key].history
+        if action == 'create':
+            value = history.added[0] if history.added else getattr(instance, attribute.key, None)
+            changes[attribute.key] = [None, _json_value(value)]
+        elif action == 'delete':
+            value = history.deleted[0] if history.deleted else history.unchanged[0] if history.unchanged else None
+            changes[attribute.key] = [_json_value(value), None]
+        elif history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            changes[attribute.key] = [_json_value(old), _json_value(history.added[0] if history.added else None)]
+    return changes
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _capture_flush(session, flush_context):
+    entries = []
+    for instances, action in ((session.new, 'create'), (session.dirty, 'update'), (session.deleted, 'delete')):
+        for instance in instances:
+            if not isinstance(instance, Order):
+                continue
+            changes = _instance_changes(instance, action)
+            if changes:
+                entries.append(_entry(instance.id, action, changes))
+    _add_pending(session, entries)
+
+
+def _primary_key_value(whereclause):
+    """WHERE が「Order.id == 値」の形ならその値を返す"""
+    if (isinstance(whereclause, BinaryExpression) and whereclause.operator is operators.eq
+            and getattr(whereclause.left, 'key', None) == 'id'
+            and isinstance(whereclause.right, BindParameter)):
+        return whereclause.right.effective_value
+    return None
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _capture_statement(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Order:
+        return
+
+    order_id = _primary_key_value(orm_execute_state.statement.whereclause)
+    if orm_execute_state.is_update:
+        # 変更前の値は書き込み時に補う（_resolve_previous_values）
+        values = orm_execute_state.execution_options.get('audit_values', {})
+        entry = _entry(order_id, 'update', {key: [None, _json_value(value)] for key, value in values.items()})
+        entry[RESOLVE_PREVIOUS_KEY] = True
+        _add_pending(orm_execute_state.session, [entry])
+    else:
+        _add_pending(orm_execute_state.session, [_entry(order_id, 'delete', {})])
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _mark_committed(session):
+    entries = session.info.pop(PENDING_KEY, None)
+    if entries:
+        session.info.setdefault(COMMITTED_KEY, []).extend(entries)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _enqueue_committed(session, transaction):
+    # 接続をプールに返した後に積む（SQLite の書き込みロックを保持したまま同期的に書き込まない）
+    if transaction.parent is not None:
+        return
+    entries = session.info.pop(COMMITTED_KEY, None)
+    if entries and has_app_context():
+        audit_log = get_audit_log()
+        if audit_log is not None:
+            audit_log.enqueue(entries)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def init_app(app, db):
+    app.config.setdefault('AUDIT_QUEUE_SIZE', int(os.environ.get('AUDIT_QUEUE_SIZE', 10000)))
+    app.config.setdefault('AUDIT_BATCH_SIZE', int(os.environ.get('AUDIT_BATCH_SIZE', 200)))
+    app.config.setdefault('AUDIT_FLUSH_INTERVAL', float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0)))
+    with app.app_context():
+        engine = db.engine
+    audit_log = app.extensions['audit_log'] = AuditLog(
+        engine,
+        get_metrics(app),
+        queue_size=app.config['AUDIT_QUEUE_SIZE'],
+        batch_size=app.config['AUDIT_BATCH_SIZE'],
+        flush_interval=app.config['AUDIT_FLUSH_INTERVAL'],
+        background=not app.config.get('TESTING', False)
+    )
+    atexit.register(audit_log.close)
@@ -0,0 +1,150 @@
+"""同期（WSGI）と非同期（ASGI）の参照APIのスループット比較
+
+SQLiteの各接続で、文の実行ごとに --latency-ms だけ待たせてリモートDBの往復を再現する。
+同期版はワーカースレッド数で、非同期版は接続プール数で同時実行数が決まる。
+
+    python benchmarks/async_read_benchmark.py --requests 400 --concurrency 50 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('TESTING', 'true')
+
+from bs4 import BeautifulSoup  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.util import await_only  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from asgi import AsyncReadApi  # noqa: E402
+from models import Order, User  # noqa: E402
+
+PATH = '/api/profit-data'
+QUERY = 'project_name=all&start_date=2024-01-01&end_date=2024-12-31'
+
+
+def build_app(database_path, rows, pool_size):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database_path}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"pool_size": pool_size, "max_overflow": 0},
+        "ADMISSION_CAPACITY": pool_size,
+        "RATELIMIT_ENABLED": False,
+        "SESSION_COOKIE_SECURE": False
+    })
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', is_active=True)
+        user.set_password('password')
+        db.session.add(user)
+        for index in range(rows):
+            db.session.add(Order(
+                customer_name=f'Customer {index % 20}',
+                project_name=f'Project {index % 50}',
+                sales_amount=1000, order_amount=900, invoiced_amount=800,
+                order_date=date(2024, 1 + index % 12, 1 + index % 28)
+            ))
+        db.session.commit()
+    return app
+
+
+def login(app):
+    client = app.test_client()
+    response = client.get('/login')
+    csrf_token = BeautifulSoup(response.data, 'html.parser').find('input', {'name': 'csrf_token'}).get('value')
+    client.post('/login', data={'username': 'bench', 'password': 'password', 'csrf_token': csrf_token})
+    return client, client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+
+
+def bench_sync(app, requests, concurrency, latency):
+    with app.app_context():
+        @event.listens_for(db.engine, 'connect')
+        def add_latency(dbapi_connection, connection_record):
+            dbapi_connection.set_trace_callback(lambda statement: time.sleep(latency))
+        db.engine.dispose()
+
+    def worker(client, count):
+        for _ in range(count):
+            assert client.get(f'{PATH}?{QUERY}').status_code == 200
+
+    # ログインは計測に含めず、先に順に済ませる（同時のログインがアドミッション制御で断られないようにする）
+    clients = [login(app)[0] for _ in range(concurrency)]
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, clients, per_worker))
+    return time.perf_counter() - started
+
+
+def bench_async(app, requests, concurrency, latency):
+    _, cookie = login(app)
+    asgi_app = AsyncReadApi(app)
+
+    @event.listens_for(asgi_app.primary.sync_engine, 'connect')
+    def add_latency(dbapi_connection, connection_record):
+        # aiosqliteの接続スレッド内で待つため、イベントループは止まらない
+        await_only(connection_record.driver_connection.set_trace_callback(lambda statement: time.sleep(latency)))
+
+    async def request():
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await asgi_app({
+            'type': 'http', 'method': 'GET', 'path': PATH, 'query_string': QUERY.encode(),
+            'headers': [(b'cookie', f'session={cookie}'.encode())]
+        }, receive, send)
+        assert messages[0]['status'] == 200
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                await request()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[limited() for _ in range(requests)])
+        elapsed = time.perf_counter() - started
+        await asgi_app.dispose()
+        return elapsed
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=50, help='同時に処理中のリクエスト数')
+    parser.add_argument('--workers', type=int, default=8, help='同期版のワーカースレッド数')
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    with tempfile.TemporaryDirectory() as directory:
+        sync_app = build_app(os.path.join(directory, 'sync.db'), args.rows, args.pool_size)
+        sync_elapsed = bench_sync(sync_app, args.requests, min(args.workers, args.concurrency), latency)
+
+        async_app = build_app(os.path.join(directory, 'async.db'), args.rows, args.pool_size)
+        async_elapsed = bench_async(async_app, args.requests, args.concurrency, latency)
+
+    print(f"requests={args.requests} concurrency={args.concurrency} workers={args.workers} "
+          f"pool_size={args.pool_size} latency={args.latency_ms}ms")
+    print(f"sync  (WSGI): {sync_elapsed:.2f}s  {args.requests / sync_elapsed:.1f} req/s")
+    print(f"async (ASGI): {async_elapsed:.2f}s  {args.requests / async_elapsed:.1f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""利益集計の1クエリ方式と期間分割の並列方式の比較
+
+ファイルのSQLiteに受注を作成し、全案件・全期間の集計を各方式で繰り返し実行する。
+--latency-ms を指定すると、文の実行ごとにその時間だけ待たせてリモートDBの往復を再現する。
+
+    python benchmarks/profit_aggregation_benchmark.py --rows 200000 --shards 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('TESTING', 'true')
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from aggregation import sum_amounts_sharded  # noqa: E402
+from dimensions import resolve_id  # noqa: E402
+from models import Order, Project  # noqa: E402
+
+START_DATE = date(2020, 1, 1)
+END_DATE = date(2024, 12, 31)
+
+
+def build_app(database_path, rows, workers):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{database_path}",
+        "PROFIT_AGGREGATION_WORKERS": workers,
+    })
+    with app.app_context():
+        db.create_all()
+        project_ids = [resolve_id(db.session.connection(), Project, f'Project {index}') for index in range(50)]
+        days = (END_DATE - START_DATE).days + 1
+        db.session.execute(insert(Order), [{
+            'customer_name': 'Customer',
+            'project_name': f'Project {index % 50}',
+            'project_id': project_ids[index % 50],
+            'sales_amount': 1000 + index % 97,
+            'order_amount': 900,
+            'invoiced_amount': 800,
+            'order_date': START_DATE + timedelta(days=index % days),
+        } for index in range(rows)])
+        db.session.commit()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(os.path.join(directory, 'orders.db'), args.rows, max(args.shards))
+        with app.app_context():
+            if args.latency_ms:
+                @event.listens_for(db.engine, 'connect')
+                def add_latency(dbapi_connection, connection_record):
+                    dbapi_connection.set_trace_callback(lambda statement: time.sleep(args.latency_ms / 1000))
+                db.engine.dispose()
+
+            expected = None
+            print(f"rows={args.rows} range={START_DATE}..{END_DATE} latency={args.latency_ms}ms")
+            for shards in args.shards:
+                sum_amounts_sharded(db.engine, START_DATE, END_DATE, None, shards)  # 接続の準備
+                started = time.perf_counter()
+                for _ in range(args.repeat):
+                    totals = sum_amounts_sharded(db.engine, START_DATE, END_DATE, None, shards)
+                elapsed = (time.perf_counter() - started) / args.repeat
+                expected = expected or totals
+                assert totals == expected, 'sharded totals differ from the single-query totals'
+                print(f"shards={shards:<3} {elapsed * 1000:8.1f} ms/query")
+
+
+if __name__ == '__main__':
+    main()
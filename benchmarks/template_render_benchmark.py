@@ -0,0 +1,77 @@
+"""テンプレートの初回表示（コールドスタート）の比較
+
+新しいプロセスでアプリを作成し、起動時間と各ページの最初の表示時間を測る。
+ソースからのコンパイル、バイトコードキャッシュ、バイトコードキャッシュ + 起動時の読み込みを比較する。
+
+    python benchmarks/template_render_benchmark.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# 子プロセスで実行する計測（起動時間と、ログイン画面・エラー画面の最初の表示時間を出力する）
+CHILD = r'''
+import json, os, sys, time
+sys.path.insert(0, os.environ['BENCH_ROOT'])
+os.environ['TESTING'] = 'true'
+started = time.perf_counter()
+from app import create_app
+config = {"TESTING": True, "TEMPLATE_BYTECODE_DIR": os.environ['BENCH_CACHE']}
+if os.environ.get('BENCH_PRELOAD') == '0':
+    config["TEMPLATE_PRELOAD"] = False
+app = create_app(config)
+import_and_create = time.perf_counter() - started
+client = app.test_client()
+timings = {'startup': import_and_create}
+for name, path in (('login', '/login'), ('404', '/no-such-page')):
+    started = time.perf_counter()
+    client.get(path)
+    timings[name] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+
+def run_child(cache_dir, preload):
+    env = {**os.environ, 'BENCH_ROOT': ROOT, 'BENCH_CACHE': cache_dir, 'BENCH_PRELOAD': '1' if preload else '0'}
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('TESTING', 'true')
+    from app import create_app
+    from templating import precompile_templates
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_dir = os.path.join(directory, 'template_cache')
+        app = create_app({"TESTING": True, "TEMPLATE_BYTECODE_DIR": cache_dir})
+        names = precompile_templates(app)
+        print(f"precompiled {len(names)} templates, runs={args.runs} (median ms)")
+
+        cases = (
+            ('source', os.path.join(directory, 'missing'), False),
+            ('bytecode', cache_dir, False),
+            ('bytecode + preload', cache_dir, True),
+        )
+        for name, cache, preload in cases:
+            results = [run_child(cache, preload) for _ in range(args.runs)]
+            medians = {key: statistics.median(result[key] for result in results) * 1000 for key in results[0]}
+            print(f"{name:<20} startup {medians['startup']:7.1f}  "
+                  f"first /login {medians['login']:6.1f}  first 404 {medians['404']:6.1f}")
+
+
+if __name__ == '__main__':
+    main()
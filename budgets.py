@@ -0,0 +1,236 @@
+"""リクエストごとのクエリの実行予算
+
+1つのリクエストがDB接続を長時間占有し、接続プールを枯渇させないよう、
+リクエストごとにクエリの実行時間の上限（QUERY_TIMEOUT_MS）と実行するSQL文の数の上限
+（QUERY_MAX_STATEMENTS）を設ける。上限はリクエストの開始からの合計で、各SQL文には残り時間を渡す。
+
+- MySQL/TiDB: SELECT に MAX_EXECUTION_TIME ヒントを付け、残り時間を超えたらサーバー側で中断させる。
+  行ロックの待ち時間（innodb_lock_wait_timeout）も QUERY_TIMEOUT_MS（秒に切り上げ）までとする
+- SQLite: プログレスハンドラーで残り時間を超えた実行を中断する
+- SQL文の数が上限を超えた場合は、実行前に QueryBudgetExceeded を送出する
+
+リクエストのスレッド以外（並列集計のワーカーなど）で実行するクエリには、using_budget でリクエストの予算を引き継ぐ。
+予算を超えたリクエストは、ビューがエラーをどう処理したかによらず 503（Retry-After 付き）を返す。
+single flight で結果を共有する処理は within_budget で包み、予算を超えた失敗を待っていたリクエストへ
+QueryBudgetExceeded として伝える（受け取ったリクエストは share_exceeded で自分の予算も超えたものとする）。
+上限はエンドポイントごとに @query_budget で既定値を変えられ、QUERY_BUDGETS（エンドポイント名 → 値）で上書きできる。
+0 または None はその上限を設けない。
+"""
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from werkzeug.exceptions import ServiceUnavailable
+
+from metrics import get_metrics
+
+# SQLite のプログレスハンドラーを呼び出す間隔（仮想マシンの命令数）
+SQLITE_PROGRESS_STEPS = 10000
+
+# MySQL/TiDB で実行時間の上限により中断されたときのエラーコード
+MYSQL_TIMEOUT_ERROR_CODES = (3024, 1317)
+
+_SELECT = re.compile(r'^(\s*SELECT)\b', re.IGNORECASE)
+
+# リクエストのスレッド以外で実行するクエリに引き継いだ予算
+_worker = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    """リクエストのクエリの実行予算を超えた"""
+
+    def __init__(self, message, reason=None):
+        super().__init__(message)
+        self.reason = reason  # 超えた上限（'timeout' / 'statements'）
+
+
+class QueryBudget:
+    def __init__(self, timeout_ms=None, max_statements=None):
+        self.deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+        self.max_statements = max_statements
+        self.statements = 0
+        self.exceeded = None  # 超えた上限（'timeout' / 'statements'）
+        self._lock = threading.Lock()
+
+    def count_statement(self):
+        """実行するSQL文を数え、これまでの数を返す（並列集計のワーカーからも呼ばれる）"""
+        with self._lock:
+            self.statements += 1
+            return self.statements
+
+    def remaining_ms(self):
+        return (self.deadline - time.monotonic()) * 1000
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+
+def query_budget(timeout_ms=None, max_statements=None):
+    """エンドポイントの既定の予算を変える（@main_bp.route の直下に付ける）"""
+    values = {key: value for key, value in (('timeout_ms', timeout_ms), ('max_statements', max_statements))
+              if value is not None}
+
+    def decorator(view):
+        view.query_budget = values
+        return view
+    return decorator
+
+
+def budget_for(endpoint):
+    """エンドポイントの予算（既定値 < @query_budget < QUERY_BUDGETS の順に優先）"""
+    config = current_app.config
+    values = {'timeout_ms': config['QUERY_TIMEOUT_MS'], 'max_statements': config['QUERY_MAX_STATEMENTS']}
+    values.update(getattr(current_app.view_functions.get(endpoint), 'query_budget', {}))
+    values.update(config['QUERY_BUDGETS'].get(endpoint, {}))
+    return values
+
+
+def with_max_execution_time(statement, milliseconds):
+    """SELECT 文に MAX_EXECUTION_TIME ヒントを付ける（それ以外の文はそのまま）"""
+    return _SELECT.sub(rf'\1 /*+ MAX_EXECUTION_TIME({milliseconds}) */', statement, count=1)
+
+
+def current_budget():
+    """実行中のリクエスト（または using_budget で引き継いだ）予算。予算がなければ None"""
+    if has_request_context():
+        return g.get('query_budget')
+    return getattr(_worker, 'budget', None)
+
+
+@contextmanager
+def using_budget(budget):
+    """リクエストのスレッド以外で実行するクエリに、リクエストの予算を引き継ぐ"""
+    previous = getattr(_worker, 'budget', None)
+    _worker.budget = budget
+    try:
+        yield budget
+    finally:
+        _worker.budget = previous
+
+
+def _exceed(budget, reason):
+    budget.exceeded = budget.exceeded or reason
+    endpoint = request.endpoint if has_request_context() else threading.current_thread().name
+    raise QueryBudgetExceeded(f"Query budget exceeded ({reason}) for {endpoint}", reason)
+
+
+def within_budget(func):
+    """予算を超えて失敗した場合は QueryBudgetExceeded を送出する（DBの中断エラーなども含める）"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except QueryBudgetExceeded:
+            raise
+        except Exception as e:
+            budget = current_budget()
+            if budget is None or budget.exceeded is None:
+                raise
+            raise QueryBudgetExceeded(f"Query budget exceeded ({budget.exceeded}): {e}", budget.exceeded) from e
+    return wrapper
+
+
+def share_exceeded(error):
+    """他のリクエストが予算を超えた結果を受け取ったリクエストも、予算を超えたものとして 503 を返す"""
+    budget = current_budget()
+    if budget is not None:
+        budget.exceeded = budget.exceeded or error.reason or 'timeout'
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    budget = current_budget()
+    if budget is None:
+        return statement, parameters
+
+    statements = budget.count_statement()
+    if budget.max_statements and statements > budget.max_statements:
+        _exceed(budget, 'statements')
+    if budget.deadline is None:
+        return statement, parameters
+    if budget.expired():
+        _exceed(budget, 'timeout')
+
+    if connection.dialect.name == 'mysql':
+        statement = with_max_execution_time(statement, max(int(budget.remaining_ms()), 1))
+    elif connection.dialect.name == 'sqlite':
+        cursor.connection.set_progress_handler(budget.expired, SQLITE_PROGRESS_STEPS)
+    return statement, parameters
+
+
+def _clear_progress_handler(cursor):
+    set_progress_handler = getattr(getattr(cursor, 'connection', None), 'set_progress_handler', None)
+    if set_progress_handler is not None:
+        set_progress_handler(None, 0)
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if connection.dialect.name == 'sqlite' and current_budget() is not None:
+        _clear_progress_handler(cursor)
+
+
+def _handle_error(context):
+    budget = current_budget()
+    if budget is None:
+        return
+    if context.dialect.name == 'sqlite' and context.execution_context is not None:
+        _clear_progress_handler(context.execution_context.cursor)
+
+    error = context.original_exception
+    code = error.args[0] if error.args else None
+    if (isinstance(error, sqlite3.OperationalError) and str(error) == 'interrupted') \
+            or code in MYSQL_TIMEOUT_ERROR_CODES:
+        budget.exceeded = budget.exceeded or 'timeout'
+
+
+def _lock_wait_timeout_setter(seconds):
+    def set_lock_wait_timeout(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET SESSION innodb_lock_wait_timeout = {seconds}")
+        cursor.close()
+    return set_lock_wait_timeout
+
+
+def _start_budget():
+    values = budget_for(request.endpoint)
+    g.query_budget = QueryBudget(values['timeout_ms'], values['max_statements'])
+
+
+def _reject_over_budget(response):
+    budget = g.pop('query_budget', None)
+    if budget is None or budget.exceeded is None:
+        return response
+
+    get_metrics().increment(f'query_budget.{budget.exceeded}')
+    retry_after = current_app.config['QUERY_BUDGET_RETRY_AFTER']
+    error = ServiceUnavailable(
+        description='処理に時間がかかりすぎたため中断しました。しばらくしてから再度お試しください。'
+    )
+    response = current_app.make_response(current_app.handle_http_exception(error))
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def init_app(app, db):
+    app.config.setdefault('QUERY_TIMEOUT_MS', int(os.environ.get('QUERY_TIMEOUT_MS', 3000)))
+    app.config.setdefault('QUERY_MAX_STATEMENTS', int(os.environ.get('QUERY_MAX_STATEMENTS', 100)))
+    app.config.setdefault('QUERY_BUDGETS', {})
+    app.config.setdefault('QUERY_BUDGET_RETRY_AFTER', int(os.environ.get('QUERY_BUDGET_RETRY_AFTER', 5)))
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute, retval=True)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+        if engine.dialect.name == 'mysql' and app.config['QUERY_TIMEOUT_MS']:
+            lock_wait_seconds = math.ceil(app.config['QUERY_TIMEOUT_MS'] / 1000)
+            event.listen(engine, 'connect', _lock_wait_timeout_setter(lock_wait_seconds))
+    app.before_request(_start_budget)
+    app.after_request(_reject_over_budget)
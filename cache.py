@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from metrics import increment
+
+
+class TTLCache:
+    """有効期限付きのLRUキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, maxsize=256, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(ヒットしたか, 値) を返す"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_extension_lock = threading.Lock()
+
+
+def app_cache(name, maxsize=256, ttl=30):
+    """アプリケーションごとに名前付きキャッシュを取得する"""
+    with _extension_lock:
+        caches = current_app.extensions.setdefault('ttl_caches', {})
+        if name not in caches:
+            caches[name] = TTLCache(maxsize=maxsize, ttl=ttl)
+        return caches[name]
+
+
+def data_version():
+    """受注データの更新世代番号（キャッシュキーに含めて無効化に使う）"""
+    return current_app.extensions.get('order_data_version', 0)
+
+
+def bump_data_version():
+    """受注データを更新したときに呼び出し、世代番号を進める"""
+    with _extension_lock:
+        current_app.extensions['order_data_version'] = current_app.extensions.get('order_data_version', 0) + 1
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの処理が実行中であれば、新たに実行せずその結果を待って共有する
+
+    結果は保持しないため（キャッシュではない）、完了後の呼び出しは再び実行される。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            increment(f'singleflight.{self.name}.shared')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        increment(f'singleflight.{self.name}.executions')
+        try:
+            flight.result = func()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+def app_single_flight(name):
+    """アプリケーションごとに名前付きのシングルフライトを取得する"""
+    with _extension_lock:
+        flights = current_app.extensions.setdefault('single_flights', {})
+        if name not in flights:
+            flights[name] = SingleFlight(name)
+        return flights[name]
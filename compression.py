@@ -0,0 +1,59 @@
+"""応答の圧縮
+
+COMPRESS_MIN_SIZE バイト以上の JSON 応答を、クライアントの Accept-Encoding に応じて
+brotli（brotli パッケージがある場合）または gzip で圧縮する。
+ストリーミング応答（/api/orders/stream）と、圧縮済みの静的ファイル（assets.py）はそのまま返す。
+"""
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # 任意依存（pip install ".[compression]"）
+    brotli = None
+
+DEFAULT_MIMETYPES = ('application/json',)
+
+
+def choose_encoding(accept_encodings):
+    """Accept-Encoding で受け付けられる符号化方式を選ぶ（brotli を優先）"""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BR_QUALITY'])
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_GZIP_LEVEL'])
+
+
+def _compress_response(response):
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in current_app.config['COMPRESS_MIMETYPES']):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_QUALITY', 4)  # 応答ごとに圧縮するため速度を優先する
+    app.after_request(_compress_response)
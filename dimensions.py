@@ -0,0 +1,77 @@
+import threading
+
+from flask import current_app
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.exc import IntegrityError
+
+from models import Customer, Project, Order
+
+
+class NameIdCache:
+    """名前から整数キーへの対応をプロセス内に保持するキャッシュ"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            return self._data.get(name)
+
+    def set(self, name, id_):
+        with self._lock:
+            if len(self._data) >= self.maxsize:
+                self._data.clear()
+            self._data[name] = id_
+
+
+def _cache(model):
+    caches = current_app.extensions.setdefault('dimension_ids', {})
+    return caches.setdefault(model.__tablename__, NameIdCache())
+
+
+def lookup_id(connection, model, name):
+    """既存の名前の整数キーを返す（未登録なら None）"""
+    cache = _cache(model)
+    id_ = cache.get(name)
+    if id_ is None:
+        id_ = connection.execute(select(model.id).where(model.name == name)).scalar()
+        if id_ is not None:
+            cache.set(name, id_)
+    return id_
+
+
+def resolve_id(connection, model, name):
+    """名前の整数キーを返す。未登録の場合は登録する
+
+    新規登録したキーはトランザクションがロールバックされ得るため、
+    ここではキャッシュせず次回のSELECT時にキャッシュする。
+    """
+    id_ = lookup_id(connection, model, name)
+    if id_ is not None:
+        return id_
+
+    try:
+        with connection.begin_nested():
+            return connection.execute(insert(model).values(name=name)).inserted_primary_key[0]
+    except IntegrityError:
+        # 同時に同じ名前が登録された場合は登録済みのキーを使う
+        return lookup_id(connection, model, name)
+
+
+@event.listens_for(Order, 'before_insert')
+def _resolve_on_insert(mapper, connection, target):
+    if target.customer_id is None:
+        target.customer_id = resolve_id(connection, Customer, target.customer_name)
+    if target.project_id is None:
+        target.project_id = resolve_id(connection, Project, target.project_name)
+
+
+@event.listens_for(Order, 'before_update')
+def _resolve_on_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.customer_name.history.has_changes():
+        target.customer_id = resolve_id(connection, Customer, target.customer_name)
+    if state.attrs.project_name.history.has_changes():
+        target.project_id = resolve_id(connection, Project, target.project_name)
@@ -0,0 +1,84 @@
+import json
+import queue
+import threading
+
+from flask import current_app
+
+
+class Subscription:
+    """購読者ごとの上限付きイベントキュー"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout):
+        """イベントを1件取り出す。timeout秒以内に届かなければ None を返す"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class OrderEventBroker:
+    """受注の変更イベントをプロセス内で配信するブローカー"""
+
+    RESYNC_EVENT = {'type': 'resync'}
+
+    def __init__(self, queue_size=100, max_subscribers=None):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """購読を開始する。購読者数が上限に達している場合は None を返す"""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscriptions) >= self.max_subscribers:
+                return None
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, event):
+        # put_nowait はブロックしないため、ロックを保持したまま全購読者へ配る
+        with self._lock:
+            for subscription in self._subscriptions:
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # 遅いクライアントのキューは捨てて、差分同期での再取得を指示する
+                    self._reset_to_resync(subscription)
+
+    def _reset_to_resync(self, subscription):
+        while True:
+            try:
+                subscription.queue.get_nowait()
+            except queue.Empty:
+                break
+        subscription.queue.put_nowait(self.RESYNC_EVENT)
+
+
+def get_broker(app=None):
+    app = app or current_app
+    return app.extensions['order_events']
+
+
+def publish_order_event(event_type, order_id, order=None):
+    """受注の作成・更新・削除をブローカーへ通知する"""
+    event = {'type': event_type, 'id': order_id}
+    if order is not None:
+        event['order'] = order
+    get_broker().publish(event)
+
+
+def format_sse(event, event_name='order'):
+    return f"event: {event_name}\ndata: {json.dumps(event, ensure_ascii=False, separators=(',', ':'))}\n\n"
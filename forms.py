@@ -68,6 +68,23 @@ class OrderForm(FlaskForm):
         Length(max=2000, message='詳細は2000文字以下で入力してください')
     ])
 
+class ProjectCostForm(FlaskForm):
+    project_name = StringField('案件名', validators=[
+        DataRequired(message='案件名は必須です'),
+        Length(max=200, message='案件名は200文字以下で入力してください')
+    ])
+    cost_month = DateField('計上月', format='%Y-%m', validators=[
+        DataRequired(message='計上月は必須です')
+    ])
+    employee_cost = StringField('社員コスト', validators=[
+        Optional(),
+        validate_amount
+    ], default='0')
+    bp_cost = StringField('BPコスト', validators=[
+        Optional(),
+        validate_amount
+    ], default='0')
+
 class UserForm(FlaskForm):
     id = HiddenField()
     username = StringField('ユーザー名', validators=[
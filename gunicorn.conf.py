@@ -0,0 +1,74 @@
+"""gunicorn の設定（gunicorn -c gunicorn.conf.py main:app）
+
+同時に処理できるリクエスト数は WEB_CONCURRENCY（プロセス数）× WEB_THREADS（スレッド数）。
+接続プールはプロセスごとに作られるため、DBを使うリクエストのスレッド数は DB_POOL_SIZE + DB_MAX_OVERFLOW 以下にする
+（超えた分のスレッドは接続待ちになるだけで、スループットは上がらない）。
+WEB_THREADS の既定値は、これに受注変更の配信の購読者数の上限 ORDER_STREAM_MAX_SUBSCRIBERS を加えた数。
+データベースへの最大接続数は WEB_CONCURRENCY ×（DB_POOL_SIZE + DB_MAX_OVERFLOW）になるため、
+TiDB/MySQL の max_connections を、全インスタンスの合計が超えないよう見積もること。
+
+例: 2 vCPU、max_connections 100 に対して 2 インスタンスで運用する場合
+    WEB_CONCURRENCY=4 DB_POOL_SIZE=8 DB_MAX_OVERFLOW=2 WEB_THREADS=10
+    → 1 インスタンスあたり 40 接続、合計 80 接続
+
+受注変更のリアルタイム配信（/api/orders/stream）はプロセス内で配信しているため、
+1 接続につき 1 スレッドを占有し、別プロセスで発生した変更は届かない
+（クライアントは差分同期で追いつく）。購読者数はプロセスごとに ORDER_STREAM_MAX_SUBSCRIBERS までとし、
+超えた接続には 204 を返してポーリングに切り替えさせる。WEB_THREADS を明示する場合も、この分の余裕を持たせる。
+
+SQLITE_PATH（ファイルのSQLite）で運用する場合、書き込みの順番待ちはプロセス内のロックで行い、
+プロセス間では busy_timeout の間だけ待ち合わせる。書き込みが多い場合は WEB_CONCURRENCY=1 とし、
+WEB_THREADS で同時実行数を確保する（読み取りは WAL により書き込み中も並行して行える）。
+
+kill -HUP <master pid> はワーカーを graceful_timeout 以内に順に入れ替えるが、preload_app のため
+アプリケーションのコードはマスタープロセスで読み込んだもののまま変わらない（再読み込みされるのは設定のみ）。
+コードを入れ替える場合は kill -USR2 <master pid> で新しいマスターを起動し、新しいワーカーが応答し始めてから
+古いマスターに kill -TERM を送るか、gunicorn を再起動する。
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# プロセス数とスレッド数
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+# 既定値は app.py の ORDER_STREAM_MAX_SUBSCRIBERS と揃える
+threads = int(os.environ.get(
+    'WEB_THREADS',
+    int(os.environ.get('DB_POOL_SIZE', 5)) + int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    + int(os.environ.get('ORDER_STREAM_MAX_SUBSCRIBERS', 4))
+))
+
+# create_app をマスタープロセスで一度だけ実行し、フォーク後のワーカーでメモリを共有する
+preload_app = True
+
+# Keep-Alive（ロードバランサーのアイドルタイムアウトより短くする）
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# リクエストサイズの上限（本文は MAX_CONTENT_LENGTH で Flask 側が制限する）
+limit_request_line = 4094
+limit_request_fields = 100
+limit_request_field_size = 8190
+
+# 応答のないワーカーの再起動と、停止・再読み込み時の猶予
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# メモリの増加を抑えるため、一定数のリクエストを処理したワーカーを順に入れ替える
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # マスタープロセスで作られた接続をワーカー間で共有しないよう、フォーク後にプールを作り直す
+    from app import db
+    from main import app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
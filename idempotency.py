@@ -0,0 +1,153 @@
+"""Idempotency-Key による再送の重複防止
+
+    flask purge-idempotency-keys
+
+登録系のAPI（@idempotent を付けたもの）は Idempotency-Key ヘッダーを受け付ける。
+最初のリクエストではキーを本文のハッシュとともに業務データと同じトランザクションで登録し、
+成功した応答（2xx）を保存する。同じキーの再送には、フォームの検証や登録を行わず保存した応答を返す。
+キーの登録は登録処理の作業単位（run_in_transaction に渡す関数）の先頭で reserve_key() を呼んで行い、
+再試行（retry.py）でやり直した場合も業務データとともに登録し直す。
+
+- キーの参照はユーザーIDとキーの主キー1回の検索のみ
+- 同じキーで内容の異なるリクエストは 422、先のリクエストが処理中なら 409 を返す
+- 失敗した応答は保存しない（同じキーで再送できる）
+- キーは IDEMPOTENCY_TTL_SECONDS 秒で期限切れとなり、期限切れのキーは再利用できる
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import current_app, g, jsonify, make_response, request
+from flask_login import current_user
+from sqlalchemy import delete
+
+from app import db
+from metrics import get_metrics
+from models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 64
+
+
+def request_hash():
+    """メソッド・パス・本文のハッシュ（フォームのCSRFトークンは画面の表示ごとに変わるため除く）"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    if request.form:
+        fields = sorted((name, value) for name, value in request.form.items(multi=True) if name != 'csrf_token')
+        digest.update(json.dumps(fields, ensure_ascii=False).encode())
+    else:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _replay(record, fingerprint):
+    """登録済みのキーに対する応答（保存した応答、または内容の不一致・処理中のエラー）"""
+    metrics = get_metrics()
+    if record.request_hash != fingerprint:
+        metrics.increment('idempotency.mismatch')
+        return jsonify({'error': f'同じ {HEADER} で内容の異なるリクエストが送信されました'}), 422
+    if record.status_code is None:
+        metrics.increment('idempotency.in_progress')
+        return jsonify({'error': f'同じ {HEADER} のリクエストを処理中です'}), 409
+
+    metrics.increment('idempotency.replayed')
+    response = current_app.response_class(record.response, status=record.status_code, mimetype='application/json')
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _reserve(record, fingerprint, expires_at):
+    record.request_hash = fingerprint
+    record.status_code = None
+    record.response = None
+    record.expires_at = expires_at
+    if record not in db.session:
+        db.session.add(record)
+
+
+def reserve_key():
+    """@idempotent の付いたリクエストなら、キーを処理中として現在のトランザクションに登録する
+
+    登録処理の作業単位の先頭で呼ぶ（やり直しのたびに呼ばれ、業務データと同時にコミットされる）。
+    同じキーのリクエストが先に登録していれば、ここで IntegrityError となる。
+    """
+    reservation = g.get('idempotency_reservation')
+    if reservation is None:
+        return
+    _reserve(*reservation)
+    g.idempotency_reserved = True
+    db.session.flush()
+
+
+def idempotent(view):
+    """Idempotency-Key ヘッダーがあれば、同じキーの再送に保存した応答を返す（@login_required の内側に付ける）"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} は1〜{MAX_KEY_LENGTH}文字で指定してください'}), 400
+
+        identity = (current_user.id, key)
+        fingerprint = request_hash()
+        now = datetime.utcnow()
+        record = db.session.get(IdempotencyKey, identity)
+        if record is not None and record.expires_at > now:
+            return _replay(record, fingerprint)
+
+        # キーを処理中として登録する内容（登録は作業単位の中の reserve_key() で行う。期限切れのキーは上書きする）
+        if record is None:
+            record = IdempotencyKey(user_id=identity[0], key=key)
+        expires_at = now + timedelta(seconds=current_app.config['IDEMPOTENCY_TTL_SECONDS'])
+        g.idempotency_reservation = (record, fingerprint, expires_at)
+
+        response = make_response(view(*args, **kwargs))
+        if not 200 <= response.status_code < 300:
+            # 失敗した場合はキーの登録も取り消し、同じキーで再送できるようにする
+            db.session.rollback()
+            if g.pop('idempotency_reserved', False):
+                # 同じキーのリクエストが先に登録していた場合（キーの重複で失敗した）はその結果を返す
+                record = db.session.get(IdempotencyKey, identity)
+                if record is not None and record.expires_at > now:
+                    return _replay(record, fingerprint)
+            return response
+
+        try:
+            # reserve_key() を呼ばない処理では、ここで登録する
+            _reserve(record, fingerprint, expires_at)
+            record.status_code = response.status_code
+            record.response = response.get_data(as_text=True)
+            db.session.commit()
+            get_metrics().increment('idempotency.stored')
+        except Exception as e:
+            # 業務データはコミット済みのため応答はそのまま返す（キーは期限切れまで処理中のまま）
+            db.session.rollback()
+            logging.error(f"Error storing idempotent response for key {key}: {e}")
+        return response
+
+    return wrapper
+
+
+def purge_expired(engine, now=None):
+    """期限切れのキーを削除し、削除した件数を返す"""
+    with engine.begin() as connection:
+        result = connection.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.expires_at <= (now or datetime.utcnow()))
+        )
+    return result.rowcount
+
+
+def init_app(app):
+    app.config.setdefault('IDEMPOTENCY_TTL_SECONDS', int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60)))
+
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys_command():
+        """期限切れの Idempotency-Key を削除する"""
+        click.echo(f"Purged {purge_expired(db.engine)} expired idempotency keys")
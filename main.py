@@ -1,6 +1,10 @@
-from app import create_app
-import routes  # noqa: F401
+import os
+
+# 本番サーバーの読み込み先（gunicorn -c gunicorn.conf.py main:app）
+# app.py の読み込み時に作成されたインスタンスをそのまま使う（ここで create_app() を呼ぶと2つ作られる）。
+# preload_app によりマスタープロセスで一度だけ作成され、ワーカーはフォーク後にこれを共有する
+from app import app
 
 if __name__ == "__main__":
-    app = create_app() # create_app()を呼び出してappインスタンスを取得
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # 開発用サーバー
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -0,0 +1,37 @@
+import threading
+
+from flask import current_app
+
+
+class MetricsRegistry:
+    """プロセス内のカウンタ（スレッドセーフ）"""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+
+_registry_lock = threading.Lock()
+
+
+def get_metrics(app=None):
+    """アプリケーションごとのメトリクスを取得する"""
+    app = app or current_app
+    with _registry_lock:
+        return app.extensions.setdefault('metrics', MetricsRegistry())
+
+
+def increment(name, value=1):
+    get_metrics().increment(name, value)
@@ -0,0 +1,332 @@
+"""バージョン管理されたスキーマ移行
+
+本番（TiDB/MySQL）のスキーマはこのモジュールの移行を順に適用して更新する。
+各移行は適用済みのバージョンを schema_migrations テーブルに記録し、
+途中まで適用された状態からでも再実行できるよう、既存の列や索引を確認してから変更する。
+作成するテーブルの定義は各移行の時点のものを移行内に固定する（models.py の現在の定義には依存しない）。
+大きなテーブルの埋め戻しは id の範囲ごとにコミットし、1トランザクションの大きさを抑える。
+TiDB の ADD INDEX や列型の変更はオンラインDDLとして実行されるため、サービスを止めずに適用できる。
+"""
+import logging
+from datetime import datetime
+
+import click
+from sqlalchemy import Boolean, Column, Date, DateTime, Index, Integer, MetaData, Numeric, \
+    String, Table, Text, UniqueConstraint, func, inspect, select, text
+
+from app import db
+
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow)
+)
+
+MIGRATIONS = []
+
+# 埋め戻しで1回にコミットする id の範囲
+BACKFILL_BATCH_SIZE = 1000
+
+
+def migration(version, name):
+    """移行関数を登録するデコレータ"""
+    def decorator(func):
+        MIGRATIONS.append((version, name, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return decorator
+
+
+def _columns(connection, table_name):
+    return {column['name'] for column in inspect(connection).get_columns(table_name)}
+
+
+def _indexes(connection, table_name):
+    return {index['name'] for index in inspect(connection).get_indexes(table_name)}
+
+
+def _create_index(connection, name, table_name, *column_names):
+    if name not in _indexes(connection, table_name):
+        table = Table(table_name, MetaData(), autoload_with=connection)
+        Index(name, *[table.c[column_name] for column_name in column_names]).create(connection)
+
+
+def _backfill_by_id(connection, table_name, set_clause, where_clause):
+    """UPDATE を id の範囲ごとに実行してコミットする（条件で未処理の行に絞るため、途中から再実行できる）"""
+    table = Table(table_name, MetaData(), autoload_with=connection)
+    low, high = connection.execute(select(func.min(table.c.id), func.max(table.c.id))).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BACKFILL_BATCH_SIZE):
+        connection.execute(text(
+            f'UPDATE {table_name} SET {set_clause} WHERE id >= :start AND id < :end AND {where_clause}'
+        ), {'start': start, 'end': start + BACKFILL_BATCH_SIZE})
+        connection.commit()
+
+
+@migration(1, 'create missing tables')
+def _create_missing_tables(connection):
+    # 新規環境ではすべてのテーブルを、既存環境では未作成のテーブルのみを作成する（整数キーへの正規化前の定義）
+    metadata = MetaData()
+    Table(
+        'users', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('username', String(64), nullable=False, unique=True, index=True),
+        Column('email', String(120), nullable=False, unique=True, index=True),
+        Column('password_hash', String(256), nullable=False),
+        Column('is_active', Boolean, nullable=False),
+        Column('is_admin', Boolean, nullable=False),
+        Column('created_at', DateTime)
+    )
+    for table_name in ('customers', 'projects'):
+        Table(
+            table_name, metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', String(255), nullable=False, unique=True)
+        )
+    Table(
+        'orders', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('customer_name', Text, nullable=False),
+        Column('project_name', Text, nullable=False),
+        Column('sales_amount', Numeric(10, 2), nullable=False),
+        Column('order_amount', Numeric(10, 2), nullable=False),
+        Column('invoiced_amount', Numeric(10, 2), nullable=False),
+        Column('order_date', Date, nullable=False),
+        Column('contract_type', String(16)),
+        Column('sales_stage', String(16)),
+        Column('billing_month', Date),
+        Column('work_in_progress', Boolean),
+        Column('description', Text),
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime)
+    )
+    Table(
+        'project_costs', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('project_name', String(255), nullable=False),
+        Column('cost_month', Date, nullable=False),
+        Column('employee_cost', Numeric(14, 2), nullable=False),
+        Column('bp_cost', Numeric(14, 2), nullable=False),
+        Column('updated_at', DateTime),
+        Index('uq_project_costs_project_month', 'project_name', 'cost_month', unique=True)
+    )
+    metadata.create_all(bind=connection, checkfirst=True)
+
+
+@migration(2, 'normalize customers and projects')
+def _normalize_dimensions(connection):
+    if 'customer_id' not in _columns(connection, 'orders'):
+        connection.execute(text('ALTER TABLE orders ADD COLUMN customer_id INTEGER'))
+    if 'project_id' not in _columns(connection, 'orders'):
+        connection.execute(text('ALTER TABLE orders ADD COLUMN project_id INTEGER'))
+    _create_index(connection, 'ix_orders_customer_id', 'orders', 'customer_id')
+    _create_index(connection, 'ix_orders_project_id', 'orders', 'project_id')
+
+    # 既存の名前からディメンションを登録し、受注へ整数キーを埋め戻す
+    for table, column in (('customers', 'customer'), ('projects', 'project')):
+        connection.execute(text(
+            f'INSERT INTO {table} (name) SELECT DISTINCT {column}_name FROM orders '
+            f'WHERE {column}_name NOT IN (SELECT name FROM {table})'
+        ))
+        _backfill_by_id(
+            connection, 'orders',
+            f'{column}_id = (SELECT {table}.id FROM {table} WHERE {table}.name = orders.{column}_name)',
+            f'{column}_id IS NULL'
+        )
+
+    # 原価テーブルを案件名から整数キーへ切り替える
+    if 'project_name' in _columns(connection, 'project_costs'):
+        connection.execute(text(
+            'INSERT INTO projects (name) SELECT DISTINCT project_name FROM project_costs '
+            'WHERE project_name NOT IN (SELECT name FROM projects)'
+        ))
+        if 'project_id' not in _columns(connection, 'project_costs'):
+            connection.execute(text('ALTER TABLE project_costs ADD COLUMN project_id INTEGER'))
+        _backfill_by_id(
+            connection, 'project_costs',
+            'project_id = (SELECT projects.id FROM projects WHERE projects.name = project_costs.project_name)',
+            'project_id IS NULL'
+        )
+        if 'uq_project_costs_project_month' in _indexes(connection, 'project_costs'):
+            on_table = ' ON project_costs' if connection.dialect.name == 'mysql' else ''
+            connection.execute(text(f'DROP INDEX uq_project_costs_project_month{on_table}'))
+        connection.execute(text('ALTER TABLE project_costs DROP COLUMN project_name'))
+        if connection.dialect.name == 'mysql':
+            connection.execute(text('ALTER TABLE project_costs MODIFY project_id INTEGER NOT NULL'))
+        connection.execute(text(
+            'CREATE UNIQUE INDEX uq_project_costs_project_month ON project_costs (project_id, cost_month)'
+        ))
+
+
+@migration(3, 'add order indexes')
+def _add_order_indexes(connection):
+    # 利益集計: 受注日の範囲 + 案件キー（案件名は整数キーに正規化済み）
+    _create_index(connection, 'ix_orders_order_date_project_id', 'orders', 'order_date', 'project_id')
+    # 一覧: 登録日時の降順ページング
+    _create_index(connection, 'ix_orders_created_at_id', 'orders', 'created_at', 'id')
+    # 差分同期
+    _create_index(connection, 'ix_orders_updated_at', 'orders', 'updated_at')
+    # 請求日での絞り込み
+    _create_index(connection, 'ix_orders_billing_month', 'orders', 'billing_month')
+
+
+@migration(4, 'bound text columns')
+def _bound_text_columns(connection):
+    # SQLiteは型の長さを保持しないため、MySQL/TiDBのみ変更する
+    if connection.dialect.name != 'mysql':
+        return
+    connection.execute(text(
+        'ALTER TABLE orders '
+        'MODIFY customer_name VARCHAR(255) NOT NULL, '
+        'MODIFY project_name VARCHAR(255) NOT NULL, '
+        'MODIFY description VARCHAR(2000)'
+    ))
+
+
+@migration(5, 'create order archive tables')
+def _create_archive_tables(connection):
+    metadata = MetaData()
+    Table(
+        'orders_archive', metadata,
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('customer_name', String(255), nullable=False),
+        Column('project_name', String(255), nullable=False),
+        Column('customer_id', Integer),
+        Column('project_id', Integer),
+        Column('sales_amount', Numeric(10, 2), nullable=False),
+        Column('order_amount', Numeric(10, 2), nullable=False),
+        Column('invoiced_amount', Numeric(10, 2), nullable=False),
+        Column('order_date', Date, nullable=False),
+        Column('contract_type', String(16)),
+        Column('sales_stage', String(16)),
+        Column('billing_month', Date),
+        Column('work_in_progress', Boolean),
+        Column('description', String(2000)),
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('archived_at', DateTime, nullable=False),
+        Index('ix_orders_archive_order_date_project_id', 'order_date', 'project_id'),
+        Index('ix_orders_archive_created_at_id', 'created_at', 'id')
+    )
+    Table(
+        'order_monthly_rollups', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('project_id', Integer, nullable=False),
+        Column('month', Date, nullable=False, index=True),
+        Column('order_count', Integer, nullable=False),
+        Column('sales_amount', Numeric(14, 2), nullable=False),
+        Column('order_amount', Numeric(14, 2), nullable=False),
+        Column('invoiced_amount', Numeric(14, 2), nullable=False),
+        UniqueConstraint('project_id', 'month', name='uq_order_monthly_rollups_project_month')
+    )
+    metadata.create_all(bind=connection, checkfirst=True)
+
+
+@migration(6, 'create order change log')
+def _create_order_changes(connection):
+    metadata = MetaData()
+    Table(
+        'order_changes', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('order_id', Integer),
+        Column('action', String(16), nullable=False),
+        Column('user_id', Integer),
+        Column('changes', Text, nullable=False),
+        Column('changed_at', DateTime, nullable=False, index=True),
+        Index('ix_order_changes_order_id_changed_at', 'order_id', 'changed_at')
+    )
+    metadata.create_all(bind=connection, checkfirst=True)
+
+
+@migration(7, 'create idempotency keys')
+def _create_idempotency_keys(connection):
+    metadata = MetaData()
+    Table(
+        'idempotency_keys', metadata,
+        Column('user_id', Integer, primary_key=True, autoincrement=False),
+        Column('key', String(64), primary_key=True),
+        Column('request_hash', String(32), nullable=False),
+        Column('status_code', Integer),
+        Column('response', Text),
+        Column('expires_at', DateTime, nullable=False, index=True)
+    )
+    metadata.create_all(bind=connection, checkfirst=True)
+
+
+@migration(8, 'create order tombstones')
+def _create_order_tombstones(connection):
+    metadata = MetaData()
+    Table(
+        'order_tombstones', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('order_id', Integer, nullable=False),
+        Column('deleted_at', DateTime, nullable=False, index=True)
+    )
+    metadata.create_all(bind=connection, checkfirst=True)
+
+
+@migration(9, 'add dimension foreign keys')
+def _add_dimension_foreign_keys(connection):
+    # SQLiteは既存テーブルへ制約を追加できないため、MySQL/TiDBのみ追加する
+    if connection.dialect.name != 'mysql':
+        return
+    foreign_keys = (
+        ('orders', 'orders_customer_id_fk', 'customer_id', 'customers'),
+        ('orders', 'orders_project_id_fk', 'project_id', 'projects'),
+        ('project_costs', 'project_costs_project_id_fk', 'project_id', 'projects'),
+    )
+    for table_name, name, column_name, referred_table in foreign_keys:
+        existing = {foreign_key['name'] for foreign_key in inspect(connection).get_foreign_keys(table_name)}
+        if name not in existing:
+            connection.execute(text(
+                f'ALTER TABLE {table_name} ADD CONSTRAINT {name} '
+                f'FOREIGN KEY ({column_name}) REFERENCES {referred_table} (id)'
+            ))
+
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return {row.version for row in connection.execute(schema_migrations.select())}
+
+
+def upgrade(engine, target=None):
+    """未適用の移行を順に適用し、適用したバージョンの一覧を返す"""
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        # MySQL/TiDBではDDLが暗黙にコミットされるため、移行ごとにトランザクションを分ける
+        # （埋め戻しは移行の中で途中コミットする。完了を記録するまでは未適用として再実行される）
+        with engine.connect() as connection:
+            logging.info(f"Applying migration {version}: {name}")
+            apply(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+            connection.commit()
+        applied.append(version)
+    return applied
+
+
+def register_commands(app):
+    @app.cli.command('db-upgrade')
+    @click.option('--target', type=int, default=None, help='このバージョンまで適用する')
+    def db_upgrade_command(target):
+        """未適用のスキーマ移行を適用する"""
+        applied = upgrade(db.engine, target=target)
+        click.echo(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+    @app.cli.command('db-status')
+    def db_status_command():
+        """スキーマ移行の適用状況を表示する"""
+        with db.engine.begin() as connection:
+            done = applied_versions(connection)
+        for version, name, _ in MIGRATIONS:
+            click.echo(f"[{'x' if version in done else ' '}] {version:04d} {name}")
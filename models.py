@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, Date
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Numeric, Date, UniqueConstraint, ForeignKey, Index
+from sqlalchemy.orm import relationship
 from app import Base # Import Base directly
 
 class User(UserMixin, Base):
@@ -26,41 +27,205 @@ class User(UserMixin, Base):
     def __repr__(self):
         return f'<User {self.username}>'
 
+class Customer(Base):
+    __tablename__ = 'customers'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f'<Customer {self.name}>'
+
+class Project(Base):
+    __tablename__ = 'projects'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f'<Project {self.name}>'
+
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        Index('ix_orders_order_date_project_id', 'order_date', 'project_id'),
+        Index('ix_orders_created_at_id', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     customer_name = Column(String(255), nullable=False)
     project_name = Column(String(255), nullable=False)
+    # 集計・絞り込み用の整数キー（名前は表示用に非正規化して保持）
+    customer_id = Column(Integer, ForeignKey('customers.id'), index=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), index=True)
     sales_amount = Column(Numeric(10, 2), nullable=False, default=0)
     order_amount = Column(Numeric(10, 2), nullable=False, default=0)
     invoiced_amount = Column(Numeric(10, 2), nullable=False, default=0)
     order_date = Column(Date, nullable=False)
     contract_type = Column(String(16))
     sales_stage = Column(String(16))
-    billing_month = Column(Date)
+    billing_month = Column(Date, index=True)
     work_in_progress = Column(Boolean, default=False)
-    description = Column(String(255))
+    description = Column(String(2000))
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __repr__(self):
         return f'<Order {self.project_name}>'
     
+    def to_dict(self):
+        return {field: format_order_value(field, getattr(self, field)) for field in ORDER_FIELDS}
+
+
+def _format_date(value):
+    return value.strftime('%Y-%m-%d') if value else None
+
+
+def _format_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+
+# APIで返す受注の項目（この順に出力する）と値の変換
+ORDER_FIELD_FORMATTERS = {
+    'id': None,
+    'customer_name': None,
+    'project_name': None,
+    'sales_amount': float,
+    'order_amount': float,
+    'invoiced_amount': float,
+    'order_date': _format_date,
+    'contract_type': None,
+    'sales_stage': None,
+    'billing_month': _format_date,
+    'work_in_progress': None,
+    'description': None,
+    'created_at': _format_datetime,
+    'updated_at': _format_datetime,
+}
+ORDER_FIELDS = tuple(ORDER_FIELD_FORMATTERS)
+
+
+def format_order_value(field, value):
+    formatter = ORDER_FIELD_FORMATTERS[field]
+    return value if formatter is None else formatter(value)
+
+
+class OrderArchive(Base):
+    """保持期間を過ぎた受注（orders から移動した明細。列は Order と同じ）"""
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        Index('ix_orders_archive_order_date_project_id', 'order_date', 'project_id'),
+        Index('ix_orders_archive_created_at_id', 'created_at', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    customer_name = Column(String(255), nullable=False)
+    project_name = Column(String(255), nullable=False)
+    customer_id = Column(Integer)
+    project_id = Column(Integer)
+    sales_amount = Column(Numeric(10, 2), nullable=False, default=0)
+    order_amount = Column(Numeric(10, 2), nullable=False, default=0)
+    invoiced_amount = Column(Numeric(10, 2), nullable=False, default=0)
+    order_date = Column(Date, nullable=False)
+    contract_type = Column(String(16))
+    sales_stage = Column(String(16))
+    billing_month = Column(Date)
+    work_in_progress = Column(Boolean, default=False)
+    description = Column(String(2000))
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # 明細の形式は受注と同じ
+    to_dict = Order.to_dict
+
+    def __repr__(self):
+        return f'<OrderArchive {self.project_name}>'
+
+class OrderMonthlyRollup(Base):
+    """アーカイブ済み受注の案件別・月別集計"""
+    __tablename__ = 'order_monthly_rollups'
+    __table_args__ = (
+        UniqueConstraint('project_id', 'month', name='uq_order_monthly_rollups_project_month'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, nullable=False)
+    month = Column(Date, nullable=False, index=True)  # 月初日で保持
+    order_count = Column(Integer, nullable=False, default=0)
+    sales_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    order_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    invoiced_amount = Column(Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OrderMonthlyRollup {self.project_id} {self.month}>'
+
+class OrderTombstone(Base):
+    """削除された受注の記録（差分同期で削除をクライアントへ伝えるため）"""
+    __tablename__ = 'order_tombstones'
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<OrderTombstone {self.order_id}>'
+
+class OrderChange(Base):
+    """受注の変更履歴（追記のみ。audit.py が非同期にまとめて書き込む）"""
+    __tablename__ = 'order_changes'
+    __table_args__ = (
+        Index('ix_order_changes_order_id_changed_at', 'order_id', 'changed_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer)
+    action = Column(String(16), nullable=False)  # create / update / delete
+    user_id = Column(Integer)
+    # 変更された列ごとの [変更前, 変更後]（JSON）。UPDATE文による更新の変更前は、直前までの履歴に記録された値
+    changes = Column(Text, nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<OrderChange {self.action} {self.order_id}>'
+
+class IdempotencyKey(Base):
+    """Idempotency-Key ヘッダー付きで処理したリクエストの応答（再送時にそのまま返す。idempotency.py）"""
+    __tablename__ = 'idempotency_keys'
+
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    key = Column(String(64), primary_key=True)
+    request_hash = Column(String(32), nullable=False)  # メソッド・パス・本文のハッシュ
+    status_code = Column(Integer)  # 処理中は NULL
+    response = Column(Text)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id} {self.key}>'
+
+class ProjectCost(Base):
+    __tablename__ = 'project_costs'
+    __table_args__ = (
+        UniqueConstraint('project_id', 'cost_month', name='uq_project_costs_project_month'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
+    cost_month = Column(Date, nullable=False)  # 月初日で保持
+    employee_cost = Column(Numeric(14, 2), nullable=False, default=0)
+    bp_cost = Column(Numeric(14, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    project = relationship(Project, lazy='joined')
+
+    def __repr__(self):
+        return f'<ProjectCost {self.project_id} {self.cost_month}>'
+
     def to_dict(self):
         return {
             'id': self.id,
-            'customer_name': self.customer_name,
-            'project_name': self.project_name,
-            'sales_amount': float(self.sales_amount),
-            'order_amount': float(self.order_amount),
-            'invoiced_amount': float(self.invoiced_amount),
-            'order_date': self.order_date.strftime('%Y-%m-%d') if self.order_date else None,
-            'contract_type': self.contract_type,
-            'sales_stage': self.sales_stage,
-            'billing_month': self.billing_month.strftime('%Y-%m-%d') if self.billing_month else None,
-            'work_in_progress': self.work_in_progress,
-            'description': self.description,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+            'project_name': self.project.name,
+            'cost_month': self.cost_month.strftime('%Y-%m'),
+            'employee_cost': float(self.employee_cost),
+            'bp_cost': float(self.bp_cost)
         }
@@ -0,0 +1,82 @@
+"""読み取りレプリカへの振り分け
+
+参照専用のエンドポイント（@replica_read を付けたもの）は SQLALCHEMY_REPLICA_URIS の
+レプリカへ、それ以外と書き込みはプライマリへ送る。ユーザー自身が更新した直後は
+レプリカの反映遅れで古いデータが見えないよう、REPLICA_STICKY_SECONDS の間プライマリから読む。
+"""
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_PREFIX = 'replica_'
+STICKY_SESSION_KEY = 'replica_sticky_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_read(view):
+    """レプリカから読んでよい参照専用のビューに付ける"""
+    view.replica_read = True
+    return view
+
+
+class RoutingSession(Session):
+    """リクエストで選ばれたレプリカがあれば、プライマリ向けの読み取りをそちらへ送る"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing or not has_request_context():
+            return primary
+        replica_key = g.get('replica_bind')
+        if replica_key is None or primary is not self._db.engines.get(None):
+            return primary
+        return self._db.engines[replica_key]
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _record_write(db_session):
+    # このリクエストでプライマリへ書き込んだことを記録し、応答時に追従期間を設定する
+    if has_request_context():
+        g.replica_wrote = True
+
+
+def replica_binds(uris):
+    """レプリカのURIを SQLALCHEMY_BINDS の形式に変換する"""
+    return {f'{REPLICA_BIND_PREFIX}{index}': uri for index, uri in enumerate(uris)}
+
+
+def _select_replica():
+    g.replica_bind = None
+    keys = current_app.config.get('REPLICA_BIND_KEYS')
+    if not keys or request.method not in SAFE_METHODS:
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, 'replica_read', False):
+        return
+    # 自分の更新直後はプライマリから読む（read-your-writes）
+    if session.get(STICKY_SESSION_KEY, 0) > time.time():
+        return
+    g.replica_bind = random.choice(keys)
+
+
+def _mark_sticky(response):
+    if current_app.config.get('REPLICA_BIND_KEYS') and g.pop('replica_wrote', False):
+        session[STICKY_SESSION_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+    return response
+
+
+def forget_replica_metadata(db):
+    """レプリカのバインドにはモデルがないため、create_all/drop_all の対象から外す"""
+    for key in current_app.config.get('REPLICA_BIND_KEYS', []):
+        db.metadatas.pop(key, None)
+
+
+def init_app(app):
+    uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+    binds = replica_binds(uris)
+    app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), **binds}
+    app.config['REPLICA_BIND_KEYS'] = list(binds)
+    app.before_request(_select_replica)
+    app.after_request(_mark_sticky)
@@ -0,0 +1,88 @@
+"""書き込みトランザクションの再試行
+
+TiDB の楽観的トランザクションでは同時更新で書き込み競合（9007）やスキーマ変更（8028）が
+コミット時に返り、MySQL ではデッドロック（1213）やロック待ちのタイムアウト（1205）、
+SQLite ではロック（database is locked）が返る。いずれもロールバックしてやり直せば成功するため、
+run_in_transaction はこれらのエラーのときだけジッター付きの指数バックオフで処理をやり直す。
+DB_RETRY_MAX_ATTEMPTS 回、または DB_RETRY_BUDGET 秒を超える場合は諦めて例外をそのまま送出する。
+"""
+import logging
+import os
+import random
+import sqlite3
+import time
+
+from flask import current_app
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+from metrics import get_metrics
+
+# 再試行できるエラーコード（MySQL/TiDB）とメトリクスでの名前
+RETRYABLE_ERROR_CODES = {
+    1205: 'lock_wait_timeout',
+    1213: 'deadlock',
+    8002: 'write_conflict',  # TiDB: SELECT ... FOR UPDATE の書き込み競合
+    8022: 'txn_retry',  # TiDB: トランザクションの再試行に失敗
+    8028: 'schema_changed',  # TiDB: Information schema is changed
+    9007: 'write_conflict',  # TiDB: Write conflict
+}
+SQLITE_RETRYABLE_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def retryable_error(error):
+    """再試行できるエラーならその種類を返す（できなければ None）"""
+    if not isinstance(error, DBAPIError) or error.connection_invalidated:
+        return None
+    orig = error.orig
+    code = orig.args[0] if orig is not None and orig.args else None
+    if isinstance(code, int) and code in RETRYABLE_ERROR_CODES:
+        return RETRYABLE_ERROR_CODES[code]
+    if isinstance(orig, sqlite3.OperationalError) and str(orig).startswith(SQLITE_RETRYABLE_MESSAGES):
+        return 'sqlite_locked'
+    return None
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """attempt 回目の再試行までの待ち時間（フルジッター）"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def run_in_transaction(work, session=None):
+    """work() を実行し、再試行できるエラーならロールバックしてやり直す
+
+    work はコミットまでを行い、やり直しても同じ結果になるようにする（セッションの状態に依存しない）。
+    """
+    session = session or db.session
+    config = current_app.config
+    metrics = get_metrics()
+    deadline = time.monotonic() + config['DB_RETRY_BUDGET']
+    attempt = 0
+    while True:
+        try:
+            result = work()
+        except DBAPIError as e:
+            kind = retryable_error(e)
+            if kind is None:
+                raise
+            session.rollback()
+            delay = backoff_delay(attempt, config['DB_RETRY_BASE_DELAY'], config['DB_RETRY_MAX_DELAY'])
+            attempt += 1
+            if attempt >= config['DB_RETRY_MAX_ATTEMPTS'] or time.monotonic() + delay > deadline:
+                metrics.increment('db_retry.exhausted')
+                raise
+            metrics.increment('db_retry.retries')
+            metrics.increment(f'db_retry.{kind}')
+            logging.warning(f"Retrying transaction after {kind} (attempt {attempt}, wait {delay * 1000:.0f}ms): {e.orig}")
+            time.sleep(delay)
+            continue
+        if attempt:
+            metrics.increment('db_retry.recovered')
+        return result
+
+
+def init_app(app):
+    app.config.setdefault('DB_RETRY_MAX_ATTEMPTS', int(os.environ.get('DB_RETRY_MAX_ATTEMPTS', 5)))
+    app.config.setdefault('DB_RETRY_BASE_DELAY', float(os.environ.get('DB_RETRY_BASE_DELAY', 0.02)))
+    app.config.setdefault('DB_RETRY_MAX_DELAY', float(os.environ.get('DB_RETRY_MAX_DELAY', 0.5)))
+    app.config.setdefault('DB_RETRY_BUDGET', float(os.environ.get('DB_RETRY_BUDGET', 2.0)))
@@ -1,22 +1,37 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, session, Blueprint, current_app
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, Blueprint, current_app, Response, g
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
-from sqlalchemy import and_, or_, func, distinct
+from sqlalchemy import and_, or_, func, case, exists, false, true, select, union, update, delete
 from decimal import Decimal
 import logging
 from datetime import datetime, timedelta, date
 from functools import wraps
 import functools
+import base64
+import json
 from urllib.parse import urlparse
 
 from app import limiter, db
-from models import User, Order
-from forms import LoginForm, OrderForm, UserForm
+from cache import app_cache, app_single_flight, data_version, bump_data_version
+from events import get_broker, publish_order_event, format_sse
+from models import User, Order, OrderArchive, OrderMonthlyRollup, OrderTombstone, Customer, Project, ProjectCost, \
+    ORDER_FIELDS, ORDER_FIELD_FORMATTERS, format_order_value
+from dimensions import lookup_id, resolve_id
+from aggregation import order_amount_sources, amount_totals_columns, sum_amounts_sharded
+from replicas import replica_read
+from metrics import get_metrics
+from idempotency import idempotent, reserve_key
+from retry import run_in_transaction
+from budgets import query_budget, within_budget, share_exceeded, QueryBudgetExceeded
+from admission import AdmissionRejected, admission_class, admitted, get_admission, rejected_response
+from forms import LoginForm, OrderForm, UserForm, ProjectCostForm
 
 main_bp = Blueprint('main', __name__)
 
 # 定数を定義
 ADMIN_USERS_ROUTE = 'main.admin_users'
+# 利益集計は期間が長いと時間がかかるため、クエリの実行予算を既定より長くする（budgets.py）
+PROFIT_QUERY_TIMEOUT_MS = 8000
 
 @main_bp.route('/')
 def index():
@@ -50,15 +65,88 @@ def login():
 def logout():
     logout_user()
     flash('ログアウトしました', 'info')
-    return redirect(url_for('main.login'))
+    response = redirect(url_for('main.login'))
+    # 共用のPCで次の利用者が受注のキャッシュ（IndexedDB）を読めないよう、ブラウザのストレージを消去させる
+    response.headers['Clear-Site-Data'] = '"storage"'
+    response.delete_cookie(ORDER_CACHE_COOKIE, path=url_for('main.orders'))
+    return response
 
 @main_bp.route('/orders')
 @login_required
 def orders():
     form = OrderForm()
-    return render_template('orders.html', form=form)
+    # 差分同期の最初のページをHTMLに埋め込み、初回表示でAPIを待たないようにする
+    # （ブラウザのキャッシュが揃っている再訪時は、キャッシュを表示して差分だけ取得するため埋め込まない）
+    initial_changes = None
+    cache_ready = request.cookies.get(ORDER_CACHE_COOKIE) == str(current_user.id)
+    if current_app.config['INLINE_INITIAL_DATA'] and not cache_ready:
+        try:
+            horizon = _sync_horizon()
+            initial_changes = _order_changes(_initial_sync_state(horizon), INLINE_ORDERS_LIMIT, horizon)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error embedding initial orders: {e}")
+    return render_template('orders.html', form=form, initial_changes=initial_changes)
+
+def _parse_date_arg(args, name):
+    value = args.get(name, '').strip()
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _order_filter_criteria(args, model=Order):
+    """検索パネルの条件から受注の絞り込み条件を組み立てる"""
+    criteria = []
+
+    search = args.get('search', '').strip()
+    if search:
+        criteria.append(or_(
+            model.customer_name.contains(search),
+            model.project_name.contains(search)
+        ))
+
+    for field in ('customer_name', 'project_name', 'contract_type', 'sales_stage'):
+        value = args.get(field, '').strip()
+        if value:
+            criteria.append(getattr(model, field).contains(value))
+
+    work_in_progress = args.get('work_in_progress', '')
+    if work_in_progress in ('true', 'false'):
+        criteria.append(model.work_in_progress == (work_in_progress == 'true'))
+
+    for column in (model.order_date, model.billing_month):
+        date_from = _parse_date_arg(args, f'{column.key}_from')
+        if date_from is not None:
+            criteria.append(column >= date_from)
+        date_to = _parse_date_arg(args, f'{column.key}_to')
+        if date_to is not None:
+            criteria.append(column <= date_to)
+
+    return criteria
+
+def _order_fields(args):
+    """fields= で指定された出力項目と、指定できない項目を返す（id は常に先頭に含める）"""
+    value = args.get('fields', '').strip()
+    if not value:
+        return ORDER_FIELDS, []
+    requested = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in ORDER_FIELD_FORMATTERS]
+    fields = ['id'] + [field for field in dict.fromkeys(requested) if field in ORDER_FIELD_FORMATTERS and field != 'id']
+    return tuple(fields), unknown
+
+def _order_list_body(rows, fields, compact):
+    """一覧の行を出力形式に変換する（compact は項目名を1度だけ返す列・行の配列形式）"""
+    formatters = [ORDER_FIELD_FORMATTERS[field] for field in fields]
+    values = [
+        [value if formatter is None else formatter(value) for formatter, value in zip(formatters, row)]
+        for row in rows
+    ]
+    if compact:
+        return {'columns': list(fields), 'rows': values}
+    return {'orders': [dict(zip(fields, row)) for row in values]}
 
 @main_bp.route('/api/orders', methods=['GET'])
+@replica_read
 @login_required
 @limiter.limit("60 per minute")
 def api_get_orders():
@@ -67,65 +155,281 @@ def api_get_orders():
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 50, type=int), 100)  # Limit max per_page
         
-        # Get search parameters
-        search = request.args.get('search', '').strip()
-        
-        # Build query
-        query = db.session.query(Order)
-        
-        if search:
-            search_filter = or_(
-                Order.customer_name.contains(search),
-                Order.project_name.contains(search)
-            )
-            query = query.filter(search_filter)
-        
-        # Get total count
-        total = query.count()
+        # 通常はホットな受注のみを対象とし、archived=true のときはアーカイブを参照する
+        model = OrderArchive if request.args.get('archived') == 'true' else Order
+
+        # 出力する項目（fields=）と形式（format=compact）
+        fields, unknown = _order_fields(request.args)
+        if unknown:
+            return jsonify({
+                'error': f"指定できない項目です: {', '.join(unknown)}",
+                'fields': list(ORDER_FIELDS)
+            }), 400
+        compact = request.args.get('format') == 'compact'
+
+        # Build query (出力する列のみを取得する)
+        query = db.session.query(*[getattr(model, field) for field in fields])\
+            .filter(*_order_filter_criteria(request.args, model))
         
-        # Apply pagination and ordering
-        orders = query.order_by(Order.created_at.desc()).paginate(
+        # Apply pagination and ordering (total count is taken by paginate)
+        orders = query.order_by(model.created_at.desc(), model.id.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
         return jsonify({
-            'orders': [order.to_dict() for order in orders.items],
-            'total': total,
+            **_order_list_body(orders.items, fields, compact),
+            'total': orders.total,
             'page': page,
             'per_page': per_page,
             'pages': orders.pages
         })
     
+    except ValueError:
+        return jsonify({'error': '日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。'}), 400
     except Exception as e:
         logging.error(f"Error fetching orders: {e}")
         return jsonify({'error': 'データの取得中にエラーが発生しました'}), 500
 
+ORDER_FACET_FIELDS = ('contract_type', 'sales_stage', 'work_in_progress')
+
+@main_bp.route('/api/orders/facets', methods=['GET'])
+@admission_class('heavy')
+@replica_read
+@login_required
+@limiter.limit("60 per minute")
+def api_get_order_facets():
+    try:
+        criteria = _order_filter_criteria(request.args)
+    except ValueError:
+        return jsonify({'error': '日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。'}), 400
+
+    # 同じ絞り込み条件・同じデータ世代であればキャッシュを返す
+    # データ世代はプロセスごとのため、他のワーカーが処理した更新はキャッシュの有効期限（30秒）まで反映されない
+    signature = tuple(sorted((key, value.strip()) for key, value in request.args.items() if value.strip()))
+    cache = app_cache('order_facets', maxsize=256, ttl=30)
+    cache_key = (data_version(), signature)
+    hit, cached = cache.get(cache_key)
+    if hit:
+        return jsonify(cached)
+
+    try:
+        # 契約・確度の組み合わせごとに仕掛の有無を条件付き集計し、1回の走査で3つのファセットの件数を求める
+        rows = db.session.execute(
+            select(
+                Order.contract_type,
+                Order.sales_stage,
+                func.count().label('count'),
+                func.sum(case((Order.work_in_progress == true(), 1), else_=0)).label('in_progress'),
+                func.sum(case((Order.work_in_progress == false(), 1), else_=0)).label('not_in_progress')
+            ).where(*criteria).group_by(Order.contract_type, Order.sales_stage)
+        ).all()
+
+        counts = {field: {} for field in ORDER_FACET_FIELDS}
+        for row in rows:
+            counts['contract_type'][row.contract_type] = counts['contract_type'].get(row.contract_type, 0) + row.count
+            counts['sales_stage'][row.sales_stage] = counts['sales_stage'].get(row.sales_stage, 0) + row.count
+            for value, count in ((True, row.in_progress), (False, row.not_in_progress),
+                                 (None, row.count - row.in_progress - row.not_in_progress)):
+                counts['work_in_progress'][value] = counts['work_in_progress'].get(value, 0) + count
+
+        facets = {
+            field: sorted(
+                ({'value': value, 'count': count} for value, count in values.items() if count),
+                key=lambda item: -item['count']
+            )
+            for field, values in counts.items()
+        }
+
+        result = {
+            'facets': facets,
+            'total': sum(row.count for row in rows)
+        }
+        cache.set(cache_key, result)
+        return jsonify(result)
+
+    except Exception as e:
+        logging.error(f"Error fetching order facets: {e}")
+        return jsonify({'error': 'データの取得中にエラーが発生しました'}), 500
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 1000
+# HTMLに埋め込む最初のページの件数（続きは表示後に差分同期で取得する）
+INLINE_ORDERS_LIMIT = 50
+# ブラウザの受注キャッシュ（IndexedDB）が揃っていることを示すCookie（値はユーザーID。orders.js が設定する）
+ORDER_CACHE_COOKIE = 'order_cache'
+
+def _encode_sync_token(state):
+    payload = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+def _decode_sync_token(token):
+    state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    return {
+        'u': datetime.fromisoformat(state['u']),
+        'i': int(state['i']),
+        'd': datetime.fromisoformat(state['d']),
+        'j': int(state['j'])
+    }
+
+def _keyset_after(timestamp_column, id_column, timestamp, last_id):
+    return or_(
+        timestamp_column > timestamp,
+        and_(timestamp_column == timestamp, id_column > last_id)
+    )
+
+@main_bp.route('/api/orders/changes', methods=['GET'])
+@login_required
+@limiter.limit("120 per minute")
+def api_get_order_changes():
+    """since トークン以降に作成・更新・削除された受注を返す（差分同期用）"""
+    since = request.args.get('since', '').strip()
+    limit = min(max(request.args.get('limit', SYNC_DEFAULT_LIMIT, type=int), 1), SYNC_MAX_LIMIT)
+    horizon = _sync_horizon()
+
+    try:
+        state = _decode_sync_token(since) if since else _initial_sync_state(horizon)
+    except (ValueError, KeyError, TypeError):
+        return jsonify({'error': '同期トークンが正しくありません'}), 400
+    # 削除記録の保持期間より前のトークンは、消えた削除を伝えられないため全件の取り直しを求める
+    retention = timedelta(days=current_app.config['ORDER_TOMBSTONE_RETENTION_DAYS'])
+    if state['d'] < datetime.utcnow() - retention:
+        return jsonify({'error': '同期トークンの有効期限が切れています'}), 400
+
+    try:
+        return jsonify(_order_changes(state, limit, horizon))
+
+    except Exception as e:
+        logging.error(f"Error fetching order changes: {e}")
+        return jsonify({'error': 'データの取得中にエラーが発生しました'}), 500
+
+def _sync_horizon():
+    """差分同期で返す変更の上限時刻
+
+    updated_at・deleted_at はコミット前に採番されるため、コミットまでにかかりうる時間
+    （SYNC_SETTLE_SECONDS）より新しい変更は確定を待ってから返す。
+    """
+    return datetime.utcnow() - timedelta(seconds=current_app.config['SYNC_SETTLE_SECONDS'])
+
+def _initial_sync_state(horizon):
+    # 初回は全件を返し、削除記録は現時点以降のみを対象にする
+    return {'u': datetime.min, 'i': 0, 'd': horizon, 'j': 0}
+
+def _order_changes(state, limit, horizon):
+    """state 以降の変更を1ページ分返す（差分同期APIと /orders への埋め込みで共用）"""
+    orders = db.session.query(Order)\
+        .filter(_keyset_after(Order.updated_at, Order.id, state['u'], state['i']))\
+        .filter(Order.updated_at <= horizon)\
+        .order_by(Order.updated_at, Order.id)\
+        .limit(limit + 1)\
+        .all()
+    tombstones = db.session.query(OrderTombstone)\
+        .filter(_keyset_after(OrderTombstone.deleted_at, OrderTombstone.id, state['d'], state['j']))\
+        .filter(OrderTombstone.deleted_at <= horizon)\
+        .order_by(OrderTombstone.deleted_at, OrderTombstone.id)\
+        .limit(limit + 1)\
+        .all()
+
+    has_more_tombstones = len(tombstones) > limit
+    has_more = len(orders) > limit or has_more_tombstones
+    orders = orders[:limit]
+    tombstones = tombstones[:limit]
+
+    if orders:
+        state['u'], state['i'] = orders[-1].updated_at, orders[-1].id
+    if has_more_tombstones:
+        state['d'], state['j'] = tombstones[-1].deleted_at, tombstones[-1].id
+    else:
+        # 上限時刻までの削除記録をすべて返した場合は、基準点を上限時刻まで進める（削除がなくてもトークンが古くならない）
+        state['d'], state['j'] = max(state['d'], horizon), 0
+
+    return {
+        'orders': [order.to_dict() for order in orders],
+        'deleted': [tombstone.order_id for tombstone in tombstones],
+        'next': _encode_sync_token({
+            'u': state['u'].isoformat(),
+            'i': state['i'],
+            'd': state['d'].isoformat(),
+            'j': state['j']
+        }),
+        'has_more': has_more
+    }
+
+ORDER_STREAM_KEEPALIVE_SECONDS = 15
+# ワーカースレッドを長時間占有しないよう、一定時間で接続を閉じて再接続させる
+ORDER_STREAM_MAX_SECONDS = 300
+
+@main_bp.route('/api/orders/stream', methods=['GET'])
+@admission_class(None)  # DBを使わず接続を保持し続けるため同時実行数の制御から外す
+@login_required
+@limiter.limit("30 per minute")
+def api_order_stream():
+    """受注の変更イベントをServer-Sent Eventsで配信する"""
+    if current_app.config.get('ORDER_EVENTS_MODE') != 'stream':
+        # 204を返すとEventSourceは再接続を止めるため、クライアントはポーリングに切り替える
+        return '', 204
+
+    broker = get_broker()
+    subscription = broker.subscribe()
+    if subscription is None:
+        # 購読者数の上限に達した場合もワーカースレッドを占有せず、ポーリングに切り替えさせる
+        get_metrics().increment('order_stream.rejected')
+        return '', 204
+
+    def generate():
+        deadline = datetime.utcnow() + timedelta(seconds=ORDER_STREAM_MAX_SECONDS)
+        try:
+            yield "retry: 5000\n\n"
+            while datetime.utcnow() < deadline:
+                event = subscription.get(timeout=ORDER_STREAM_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield format_sse(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    return response
+
 @main_bp.route('/api/orders', methods=['POST'])
 @login_required
 @limiter.limit("30 per minute")
+@idempotent
 def api_create_order():
     form = OrderForm()
     if form.validate_on_submit():
         try:
-            order = Order(
-                customer_name=form.customer_name.data,
-                project_name=form.project_name.data,
-                sales_amount=form.sales_amount.data,
-                order_amount=form.order_amount.data,
-                invoiced_amount=form.invoiced_amount.data,
-                order_date=form.order_date.data,
-                contract_type=form.contract_type.data,
-                sales_stage=form.sales_stage.data,
-                billing_month=form.billing_month.data,
-                work_in_progress=form.work_in_progress.data,
-                description=form.description.data
-            )
-            
-            db.session.add(order)
-            db.session.commit()
+            def create_order():
+                # Idempotency-Key は受注と同じトランザクションで登録する（やり直しても同時にコミットされる）
+                reserve_key()
+                order = Order(
+                    customer_name=form.customer_name.data,
+                    project_name=form.project_name.data,
+                    sales_amount=form.sales_amount.data,
+                    order_amount=form.order_amount.data,
+                    invoiced_amount=form.invoiced_amount.data,
+                    order_date=form.order_date.data,
+                    contract_type=form.contract_type.data,
+                    sales_stage=form.sales_stage.data,
+                    billing_month=form.billing_month.data,
+                    work_in_progress=form.work_in_progress.data,
+                    description=form.description.data
+                )
+                db.session.add(order)
+                db.session.commit()
+                return order
+
+            # 書き込み競合などの一時的なエラーはやり直す（retry.py）
+            order = run_in_transaction(create_order)
+            bump_data_version()
+            order_data = order.to_dict()
+            publish_order_event('create', order.id, order_data)
             
             logging.info(f"Order created for project: {order.project_name}")
-            return jsonify({'message': '受注が登録されました', 'order': order.to_dict()}), 201
+            return jsonify({'message': '受注が登録されました', 'order': order_data}), 201
         
         except Exception as e:
             db.session.rollback()
@@ -134,32 +438,82 @@ def api_create_order():
     
     return jsonify({'error': 'バリデーションエラー', 'errors': form.errors}), 400
 
+# 受注フォームから書き込む列
+ORDER_FORM_FIELDS = (
+    'customer_name', 'project_name', 'sales_amount', 'order_amount', 'invoiced_amount',
+    'order_date', 'contract_type', 'sales_stage', 'billing_month', 'work_in_progress', 'description'
+)
+
+ORDER_AMOUNT_FIELDS = ('sales_amount', 'order_amount', 'invoiced_amount')
+
+def _changed_order_fields():
+    changed = request.form.get('changed_fields')
+    if changed is None:
+        return ORDER_FORM_FIELDS
+    names = set(changed.split(','))
+    return [field for field in ORDER_FORM_FIELDS if field in names]
+
+def _dialect():
+    return db.session.get_bind().dialect
+
 @main_bp.route('/api/orders/<int:order_id>', methods=['PUT'])
 @login_required
 @limiter.limit("30 per minute")
 def api_update_order(order_id):
-    order = db.session.query(Order).get_or_404(order_id)
-    
     form = OrderForm()
     if form.validate_on_submit():
         try:
-            # Update order fields
-            order.customer_name = form.customer_name.data
-            order.project_name = form.project_name.data
-            order.sales_amount = form.sales_amount.data
-            order.order_amount = form.order_amount.data
-            order.invoiced_amount = form.invoiced_amount.data
-            order.order_date = form.order_date.data
-            order.contract_type = form.contract_type.data
-            order.sales_stage = form.sales_stage.data
-            order.billing_month = form.billing_month.data
-            order.work_in_progress = form.work_in_progress.data
-            order.description = form.description.data
-            
-            db.session.commit()
+            def update_order():
+                # 事前のSELECTを行わず、UPDATE 1文で更新する（該当なしは更新件数で判定）
+                submitted = {field: getattr(form, field).data for field in ORDER_FORM_FIELDS}
+                for field in ORDER_AMOUNT_FIELDS:
+                    submitted[field] = submitted[field] or 0
+                # 書き込むのは画面で変更された列だけ（changed_fields を送らないクライアントは全列）
+                values = {field: submitted[field] for field in _changed_order_fields()}
+                if 'customer_name' in values:
+                    values['customer_id'] = resolve_id(db.session.connection(), Customer, values['customer_name'])
+                if 'project_name' in values:
+                    values['project_id'] = resolve_id(db.session.connection(), Project, values['project_name'])
+                values['updated_at'] = datetime.utcnow()
+                # 書き込む値は変更履歴（audit.py）にも実行オプションで渡す
+                statement = update(Order).where(Order.id == order_id).values(**values)
+
+                if _dialect().update_returning:
+                    # RETURNING に対応したDBでは更新後の行をそのまま受け取る
+                    result = db.session.execute(
+                        statement.returning(Order),
+                        execution_options={'synchronize_session': False, 'populate_existing': True,
+                                           'audit_values': values}
+                    )
+                    order = result.scalar_one_or_none()
+                    if order is None:
+                        return None
+                    # コミット後の再読み込みを避けるため、先に応答用の表現を作る
+                    order_data = order.to_dict()
+                else:
+                    # 対応していないDBでは読み直さず、送信された値と id・更新日時から応答を作る
+                    # （フォームにない作成日時は含めない）
+                    result = db.session.execute(
+                        statement, execution_options={'synchronize_session': False, 'audit_values': values}
+                    )
+                    if not result.rowcount:
+                        return None
+                    row = dict(submitted, id=order_id, updated_at=values['updated_at'])
+                    order_data = {field: format_order_value(field, row[field]) for field in ORDER_FIELDS if field in row}
+
+                db.session.commit()
+                return order_data
+
+            order_data = run_in_transaction(update_order)
+            if order_data is None:
+                db.session.rollback()
+                return jsonify({'error': '指定された受注が見つかりません'}), 404
+
+            bump_data_version()
+            publish_order_event('update', order_id, order_data)
             
-            logging.info(f"Order updated: {order.project_name}")
-            return jsonify({'message': '受注が更新されました', 'order': order.to_dict()})
+            logging.info(f"Order updated: {order_data['project_name']}")
+            return jsonify({'message': '受注が更新されました', 'order': order_data})
         
         except Exception as e:
             db.session.rollback()
@@ -172,13 +526,36 @@ def api_update_order(order_id):
 @login_required
 @limiter.limit("20 per minute")
 def api_delete_order(order_id):
-    order = db.session.query(Order).get_or_404(order_id)
-    
     try:
-        db.session.delete(order)
-        db.session.commit()
+        def delete_order():
+            # 事前のSELECTを行わず、DELETE 1文で削除する（該当なしは削除件数で判定）
+            statement = delete(Order).where(Order.id == order_id)
+            if _dialect().delete_returning:
+                row = db.session.execute(
+                    statement.returning(Order.project_name),
+                    execution_options={'synchronize_session': False}
+                ).first()
+                label = f"project: {row.project_name}" if row is not None else None
+            else:
+                result = db.session.execute(statement, execution_options={'synchronize_session': False})
+                label = f"id: {order_id}" if result.rowcount > 0 else None
+
+            if label is None:
+                return None
+
+            db.session.add(OrderTombstone(order_id=order_id))
+            db.session.commit()
+            return label
+
+        label = run_in_transaction(delete_order)
+        if label is None:
+            db.session.rollback()
+            return jsonify({'error': '指定された受注が見つかりません'}), 404
+
+        bump_data_version()
+        publish_order_event('delete', order_id)
         
-        logging.info(f"Order deleted for project: {order.project_name}")
+        logging.info(f"Order deleted for {label}")
         return jsonify({'message': '受注が削除されました'})
     
     except Exception as e:
@@ -189,27 +566,55 @@ def api_delete_order(order_id):
 @main_bp.route('/profit-analysis')
 @login_required
 def profit_analysis():
-    return render_template('profit_analysis.html')
+    # 案件一覧をHTMLに埋め込み、初回表示でAPIを待たないようにする
+    initial_projects = None
+    if current_app.config['INLINE_INITIAL_DATA']:
+        try:
+            initial_projects = _project_names()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error embedding projects: {e}")
+    return render_template('profit_analysis.html', initial_projects=initial_projects)
+
+def _single_flight_key(*params):
+    """シングルフライトのキー（データ世代と読み取り先を含め、更新前後や追従中の結果を共有しない）"""
+    return (data_version(), g.get('replica_bind') is not None) + params
+
+def _project_has_orders():
+    """受注が存在する案件の条件（受注側は整数キーの索引で判定、アーカイブ済みの案件も含める）"""
+    return or_(
+        exists().where(Order.project_id == Project.id),
+        exists().where(OrderMonthlyRollup.project_id == Project.id)
+    )
+
+def _project_names():
+    """受注がある案件名の一覧（/api/projects と /profit-analysis への埋め込みで共用）"""
+    def fetch_projects():
+        projects = db.session.query(Project.name)\
+            .filter(_project_has_orders())\
+            .order_by(Project.name)\
+            .all()
+        return {'projects': [project[0] for project in projects]}
+
+    # 同時に来た同じ問い合わせは1回の実行結果を共有する
+    return app_single_flight('projects').do(_single_flight_key(), fetch_projects)
 
 @main_bp.route('/api/projects', methods=['GET'])
+@replica_read
 @login_required
 @limiter.limit("60 per minute")
 def api_get_projects():
     try:
-        # プロジェクト名の一覧を取得（重複を除く）
-        projects = db.session.query(distinct(Order.project_name))\
-            .order_by(Order.project_name)\
-            .all()
-        
-        return jsonify({
-            'projects': [project[0] for project in projects]
-        })
+        return jsonify(_project_names())
     
     except Exception as e:
         logging.error(f"Error fetching projects: {e}")
         return jsonify({'error': 'プロジェクトの取得中にエラーが発生しました'}), 500
 
 @main_bp.route('/api/profit-data', methods=['GET'])
+@admission_class('heavy', single_flight=True)  # 集計を実行する先頭のリクエストだけが枠を使う
+@query_budget(timeout_ms=PROFIT_QUERY_TIMEOUT_MS)
+@replica_read
 @login_required
 @limiter.limit("60 per minute")
 def api_get_profit_data():
@@ -221,33 +626,208 @@ def api_get_profit_data():
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
 
-        # クエリの構築
-        query = db.session.query(Order).filter(Order.order_date.between(start_date, end_date))
-        
-        # プロジェクト名が'all'でない場合は、特定のプロジェクトでフィルタリング
-        if project_name != 'all':
-            query = query.filter(Order.project_name == project_name)
+        def calculate_profit_data():
+            # プロジェクト名が'all'でない場合は、特定のプロジェクトの整数キーでフィルタリング
+            project_ids = None
+            if project_name != 'all':
+                project_id = lookup_id(db.session.connection(), Project, project_name)
+                project_ids = [project_id] if project_id is not None else []
+
+            # ホットな受注・アーカイブ明細・月次集計を合算してデータベース側で集計する
+            shards = current_app.config['PROFIT_AGGREGATION_SHARDS']
+            totals = None
+            if shards > 1:
+                # 期間を分割し、区間ごとに別の接続で並列に集計する（接続の枠が空いていなければ分割しない）
+                totals = sum_amounts_sharded(db.session.get_bind(), start_date, end_date, project_ids, shards)
+            if totals is None:
+                amounts = order_amount_sources(start_date, end_date, project_ids)
+                totals = db.session.query(*amount_totals_columns(amounts)).one()
+            return {
+                'total_sales_amount': float(totals[0]),
+                'total_order_amount': float(totals[1]),
+                'total_invoiced_amount': float(totals[2])
+            }
+
+        # 月次締めの直後など、同時に来た同じ条件の集計は1回の実行結果を共有する
+        key = _single_flight_key(project_name, start_date, end_date)
+        return jsonify(app_single_flight('profit_data').do(key, admitted(within_budget(calculate_profit_data))))
+
+    except AdmissionRejected:
+        return rejected_response()
+    except QueryBudgetExceeded as e:
+        # 集計を実行した先頭のリクエストが予算を超えた場合は、待っていたリクエストも 503 とする
+        # （応答は budgets.py の after_request で予算超過の 503 に置き換わる）
+        share_exceeded(e)
+        return rejected_response()
+    except ValueError:
+        flash('日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。', 'error')
+        return jsonify({'error': '日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。'}), 400
+    except Exception as e:
+        logging.error(f"Error calculating profit data: {e}")
+        flash('利益データの計算中にエラーが発生しました', 'error')
+        return jsonify({'error': '利益データの計算中にエラーが発生しました'}), 500
 
-        # 受注データを取得
-        orders = query.all()
+@main_bp.route('/api/project-costs', methods=['GET'])
+@replica_read
+@login_required
+@limiter.limit("60 per minute")
+def api_get_project_costs():
+    project_name = request.args.get('project_name', '').strip()
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
 
-        total_sales_amount = sum(float(order.sales_amount) for order in orders)
-        total_order_amount = sum(float(order.order_amount) for order in orders)
-        total_invoiced_amount = sum(float(order.invoiced_amount) for order in orders)
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+
+        # 原価は月単位で保持しているため、開始日を月初に丸めて範囲を決める
+        costs = db.session.query(ProjectCost)\
+            .filter(ProjectCost.project_id == lookup_id(db.session.connection(), Project, project_name))\
+            .filter(ProjectCost.cost_month.between(start_date.replace(day=1), end_date))\
+            .order_by(ProjectCost.cost_month)\
+            .all()
 
         return jsonify({
-            'total_sales_amount': total_sales_amount,
-            'total_order_amount': total_order_amount,
-            'total_invoiced_amount': total_invoiced_amount
+            'costs': [cost.to_dict() for cost in costs],
+            'total_employee_cost': sum(float(cost.employee_cost) for cost in costs),
+            'total_bp_cost': sum(float(cost.bp_cost) for cost in costs)
         })
 
-    except ValueError:
-        flash('日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。', 'error')
+    except (TypeError, ValueError):
         return jsonify({'error': '日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。'}), 400
     except Exception as e:
-        logging.error(f"Error calculating profit data: {e}")
-        flash('利益データの計算中にエラーが発生しました', 'error')
-        return jsonify({'error': '利益データの計算中にエラーが発生しました'}), 500
+        logging.error(f"Error fetching project costs: {e}")
+        return jsonify({'error': '原価データの取得中にエラーが発生しました'}), 500
+
+@main_bp.route('/api/project-costs', methods=['PUT'])
+@login_required
+@limiter.limit("30 per minute")
+def api_save_project_cost():
+    form = ProjectCostForm()
+    if form.validate_on_submit():
+        try:
+            cost_month = form.cost_month.data.replace(day=1)
+
+            def save_cost():
+                project_id = resolve_id(db.session.connection(), Project, form.project_name.data)
+                cost = db.session.query(ProjectCost).filter_by(
+                    project_id=project_id,
+                    cost_month=cost_month
+                ).first()
+                if cost is None:
+                    cost = ProjectCost(project_id=project_id, cost_month=cost_month)
+                    db.session.add(cost)
+
+                cost.employee_cost = form.employee_cost.data or 0
+                cost.bp_cost = form.bp_cost.data or 0
+                db.session.commit()
+                return cost
+
+            cost = run_in_transaction(save_cost)
+
+            logging.info(f"Project cost saved: {form.project_name.data} {cost_month:%Y-%m}")
+            return jsonify({'message': '原価が保存されました', 'cost': cost.to_dict()})
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error saving project cost: {e}")
+            return jsonify({'error': '原価保存中にエラーが発生しました'}), 500
+
+    return jsonify({'error': 'バリデーションエラー', 'errors': form.errors}), 400
+
+PROFIT_RANKING_MAX_LIMIT = 100
+
+@main_bp.route('/api/profit-ranking', methods=['GET'])
+@admission_class('heavy')
+@query_budget(timeout_ms=PROFIT_QUERY_TIMEOUT_MS)
+@replica_read
+@login_required
+@limiter.limit("60 per minute")
+def api_get_profit_ranking():
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
+    order_by = request.args.get('order_by', 'profit')
+    direction = request.args.get('direction', 'top')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), PROFIT_RANKING_MAX_LIMIT)
+
+    if order_by not in ('profit', 'margin') or direction not in ('top', 'bottom'):
+        return jsonify({'error': '並び替え条件が正しくありません'}), 400
+
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+
+        # 案件ごとの売上と原価をそれぞれ集約してから結合し、1クエリで上位N件を取得する
+        amounts = order_amount_sources(start_date, end_date)
+        sales = db.session.query(
+                amounts.c.project_id.label('project_id'),
+                func.sum(amounts.c.sales_amount).label('sales_amount')
+            )\
+            .group_by(amounts.c.project_id)\
+            .subquery()
+        costs = db.session.query(
+                ProjectCost.project_id.label('project_id'),
+                func.sum(ProjectCost.employee_cost).label('employee_cost'),
+                func.sum(ProjectCost.bp_cost).label('bp_cost')
+            )\
+            .filter(ProjectCost.cost_month.between(start_date.replace(day=1), end_date))\
+            .group_by(ProjectCost.project_id)\
+            .subquery()
+
+        # 売上または原価のある案件（原価のみで売上のない赤字案件も含める）
+        project_ids = union(
+            select(sales.c.project_id.label('project_id')),
+            select(costs.c.project_id.label('project_id'))
+        ).subquery()
+
+        sales_amount = func.coalesce(sales.c.sales_amount, 0)
+        employee_cost = func.coalesce(costs.c.employee_cost, 0)
+        bp_cost = func.coalesce(costs.c.bp_cost, 0)
+        profit = sales_amount - employee_cost - bp_cost
+        # SQLiteでは整数同士の除算が切り捨てになるため、1.0を掛けて小数で計算させる
+        margin = profit * 1.0 / func.nullif(sales_amount, 0)
+        sort_key = profit if order_by == 'profit' else margin
+        ordering = [sort_key.desc() if direction == 'top' else sort_key.asc(), Project.name]
+        if order_by == 'margin':
+            # 売上ゼロの案件は利益率が算出できないため末尾に回す
+            ordering.insert(0, margin.is_(None))
+
+        rows = db.session.query(
+                Project.name.label('project_name'),
+                sales_amount.label('sales_amount'),
+                employee_cost.label('employee_cost'),
+                bp_cost.label('bp_cost'),
+                profit.label('profit'),
+                margin.label('margin')
+            )\
+            .select_from(project_ids)\
+            .join(Project, Project.id == project_ids.c.project_id)\
+            .outerjoin(sales, sales.c.project_id == project_ids.c.project_id)\
+            .outerjoin(costs, costs.c.project_id == project_ids.c.project_id)\
+            .order_by(*ordering)\
+            .limit(limit)\
+            .all()
+
+        return jsonify({
+            'projects': [{
+                'project_name': row.project_name,
+                'sales_amount': float(row.sales_amount),
+                'employee_cost': float(row.employee_cost),
+                'bp_cost': float(row.bp_cost),
+                'total_cost': float(row.employee_cost) + float(row.bp_cost),
+                'profit': float(row.profit),
+                'profit_rate': round(float(row.margin) * 100, 1) if row.margin is not None else None
+            } for row in rows],
+            'order_by': order_by,
+            'direction': direction,
+            'limit': limit
+        })
+
+    except (TypeError, ValueError):
+        return jsonify({'error': '日付の形式が正しくありません。YYYY-MM-DD形式を使用してください。'}), 400
+    except Exception as e:
+        logging.error(f"Error calculating profit ranking: {e}")
+        return jsonify({'error': '利益ランキングの計算中にエラーが発生しました'}), 500
 
 @main_bp.route('/user/delete', methods=['POST'])
 @login_required
@@ -303,6 +883,12 @@ def admin_users():
     users = db.session.query(User).all()
     return render_template('admin/users.html', users=users)
 
+@main_bp.route('/admin/metrics')
+@login_required
+@admin_required
+def admin_metrics():
+    return jsonify({'counters': get_metrics().snapshot(), 'admission': get_admission().snapshot()})
+
 @main_bp.route('/admin/users/create', methods=['GET', 'POST'])
 @login_required
 @admin_required
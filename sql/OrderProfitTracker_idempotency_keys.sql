@@ -0,0 +1,11 @@
+drop table order_profit_tracker_db.idempotency_keys;
+CREATE TABLE `idempotency_keys` (
+  `user_id` int NOT NULL,
+  `key` varchar(64) NOT NULL,
+  `request_hash` varchar(32) NOT NULL,
+  `status_code` int DEFAULT NULL,
+  `response` text,
+  `expires_at` datetime NOT NULL,
+  PRIMARY KEY (`user_id`, `key`),
+  KEY `ix_idempotency_keys_expires_at` (`expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -1,8 +1,10 @@
 drop table order_profit_tracker_db.orders;
 CREATE TABLE `orders` (
   `id` int NOT NULL AUTO_INCREMENT,
-  `customer_name` text NOT NULL,
-  `project_name` text NOT NULL,
+  `customer_name` varchar(255) NOT NULL,
+  `project_name` varchar(255) NOT NULL,
+  `customer_id` int,
+  `project_id` int,
   `sales_amount` numeric default 0,
   `order_amount` numeric default 0,
   `invoiced_amount` numeric default 0,
@@ -11,8 +13,16 @@ CREATE TABLE `orders` (
   `sales_stage` varchar(16),
   `billing_month` date,
   `work_in_progress` boolean default false,
-  `description` text,
+  `description` varchar(2000),
   `created_at` datetime DEFAULT now(),
   `updated_at` datetime DEFAULT now(),
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  KEY `ix_orders_order_date_project_id` (`order_date`, `project_id`),
+  KEY `ix_orders_created_at_id` (`created_at`, `id`),
+  KEY `ix_orders_updated_at` (`updated_at`),
+  KEY `ix_orders_billing_month` (`billing_month`),
+  KEY `ix_orders_customer_id` (`customer_id`),
+  KEY `ix_orders_project_id` (`project_id`),
+  CONSTRAINT `orders_customer_id_fk` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`),
+  CONSTRAINT `orders_project_id_fk` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=3 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
\ No newline at end of file
@@ -0,0 +1,12 @@
+drop table order_profit_tracker_db.order_changes;
+CREATE TABLE `order_changes` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `order_id` int DEFAULT NULL,
+  `action` varchar(16) NOT NULL,
+  `user_id` int DEFAULT NULL,
+  `changes` text NOT NULL,
+  `changed_at` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `ix_order_changes_order_id_changed_at` (`order_id`, `changed_at`),
+  KEY `ix_order_changes_changed_at` (`changed_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,13 @@
+drop table order_profit_tracker_db.order_monthly_rollups;
+CREATE TABLE `order_monthly_rollups` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `project_id` int NOT NULL,
+  `month` date NOT NULL,
+  `order_count` int NOT NULL DEFAULT 0,
+  `sales_amount` decimal(14,2) NOT NULL DEFAULT 0,
+  `order_amount` decimal(14,2) NOT NULL DEFAULT 0,
+  `invoiced_amount` decimal(14,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_order_monthly_rollups_project_month` (`project_id`, `month`),
+  KEY `ix_order_monthly_rollups_month` (`month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
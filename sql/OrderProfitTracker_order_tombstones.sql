@@ -0,0 +1,8 @@
+drop table order_profit_tracker_db.order_tombstones;
+CREATE TABLE `order_tombstones` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `order_id` int NOT NULL,
+  `deleted_at` datetime NOT NULL DEFAULT now(),
+  PRIMARY KEY (`id`),
+  KEY `ix_order_tombstones_deleted_at` (`deleted_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
\ No newline at end of file
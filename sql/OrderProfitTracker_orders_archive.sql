@@ -0,0 +1,23 @@
+drop table order_profit_tracker_db.orders_archive;
+CREATE TABLE `orders_archive` (
+  `id` int NOT NULL,
+  `customer_name` varchar(255) NOT NULL,
+  `project_name` varchar(255) NOT NULL,
+  `customer_id` int,
+  `project_id` int,
+  `sales_amount` numeric default 0,
+  `order_amount` numeric default 0,
+  `invoiced_amount` numeric default 0,
+  `order_date` date NOT NULL,
+  `contract_type` varchar(16),
+  `sales_stage` varchar(16),
+  `billing_month` date,
+  `work_in_progress` boolean default false,
+  `description` varchar(2000),
+  `created_at` datetime,
+  `updated_at` datetime,
+  `archived_at` datetime NOT NULL DEFAULT now(),
+  PRIMARY KEY (`id`),
+  KEY `ix_orders_archive_order_date_project_id` (`order_date`, `project_id`),
+  KEY `ix_orders_archive_created_at_id` (`created_at`, `id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,12 @@
+drop table order_profit_tracker_db.project_costs;
+CREATE TABLE `project_costs` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `project_id` int NOT NULL,
+  `cost_month` date NOT NULL,
+  `employee_cost` decimal(14,2) NOT NULL DEFAULT 0,
+  `bp_cost` decimal(14,2) NOT NULL DEFAULT 0,
+  `updated_at` datetime DEFAULT now(),
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_project_costs_project_month` (`project_id`, `cost_month`),
+  CONSTRAINT `project_costs_project_id_fk` FOREIGN KEY (`project_id`) REFERENCES `projects` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
\ No newline at end of file
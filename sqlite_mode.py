@@ -0,0 +1,99 @@
+"""単一サーバー構成向けのファイルSQLite
+
+SQLITE_PATH を指定すると MySQL/TiDB の代わりにファイルのSQLiteを使う。
+接続ごとに WAL などのプラグマを設定し、読み取りは書き込み中でも並行して行える。
+
+SQLiteの書き込みは同時に1つだけのため、書き込みのリクエスト（GET/HEAD/OPTIONS 以外）の
+トランザクションはプロセス内のロックで順番に実行し、BEGIN IMMEDIATE で開始して
+最初に書き込みロックを取る（読み取りから書き込みへの昇格で SQLITE_BUSY になるのを防ぐ）。
+別プロセスの書き込みとは busy_timeout の間だけ待ち合わせる。
+"""
+import logging
+import os
+import threading
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from replicas import SAFE_METHODS
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # 負数は KiB 単位（64 MiB）
+    'busy_timeout': 5000,
+}
+
+
+def configure(app):
+    """SQLITE_PATH のデータベースを使うよう接続設定を行う"""
+    path = os.path.abspath(app.config['SQLITE_PATH'])
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 2)),
+        'connect_args': {'check_same_thread': False},
+    })
+    app.config.setdefault('SQLITE_PRAGMAS', {})
+
+
+def apply_pragmas(engine, values):
+    """接続のたびにプラグマを設定する（非同期エンジンには sync_engine を渡す）"""
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in values.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def serialize_writes(engine, lock, timeout):
+    """トランザクションを自前で開始し、書き込みのリクエストではロックを取って BEGIN IMMEDIATE にする
+
+    ロックはトランザクションの開始から接続がプールへ戻るまで（コミット・ロールバックまで）保持する。
+    """
+    @event.listens_for(engine, 'connect')
+    def disable_implicit_begin(dbapi_connection, connection_record):
+        # pysqlite の暗黙の BEGIN を止め、begin イベントで開始する
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        if not (has_request_context() and g.get('sqlite_writer', False)):
+            connection.exec_driver_sql('BEGIN')
+            return
+        if lock.acquire(timeout=timeout):
+            connection.info['sqlite_write_lock'] = lock
+        else:
+            # 待ちきれなかった場合もSQLite側の busy_timeout に任せて処理を続ける
+            logging.warning(f"SQLite writer lock wait exceeded {timeout}s: {request.method} {request.path}")
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    @event.listens_for(engine, 'checkin')
+    def release(dbapi_connection, connection_record):
+        held = connection_record.info.pop('sqlite_write_lock', None)
+        if held is not None:
+            held.release()
+
+
+def _mark_writer():
+    g.sqlite_writer = request.method not in SAFE_METHODS
+
+
+def pragmas(app):
+    """既定値に SQLITE_PRAGMAS の指定を重ねたプラグマ"""
+    return {**DEFAULT_PRAGMAS, **app.config['SQLITE_PRAGMAS']}
+
+
+def init_app(app, db):
+    if not app.config.get('SQLITE_PATH'):
+        return
+    app.extensions['sqlite_write_lock'] = threading.Lock()
+    values = pragmas(app)
+    with app.app_context():
+        engine = db.engine
+        apply_pragmas(engine, values)
+        serialize_writes(engine, app.extensions['sqlite_write_lock'], values['busy_timeout'] / 1000)
+    app.before_request(_mark_writer)
@@ -1,29 +1,115 @@
 // Orders management JavaScript
+
+// 受注データをIndexedDBに保持し、差分同期のトークンと合わせて管理する
+// データベースはユーザーごとに分け、ログアウト時に消去する（base.html）
+class OrderCache {
+    constructor(userId) {
+        this.dbName = userId ? `order-profit-tracker-${userId}` : null;
+        this.db = null;
+        // IndexedDBが使えない環境ではメモリ上に保持する
+        this.memoryOrders = new Map();
+        this.memoryToken = null;
+    }
+
+    async open() {
+        if (!window.indexedDB || !this.dbName) return;
+        // ユーザーで分ける前の共用のデータベースは削除する
+        indexedDB.deleteDatabase('order-profit-tracker');
+        try {
+            this.db = await new Promise((resolve, reject) => {
+                const request = indexedDB.open(this.dbName, 1);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    db.createObjectStore('orders', { keyPath: 'id' });
+                    db.createObjectStore('meta');
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        } catch (error) {
+            console.warn('IndexedDB is unavailable, falling back to memory cache:', error);
+            this.db = null;
+        }
+    }
+
+    transaction(stores, mode, callback) {
+        return new Promise((resolve, reject) => {
+            const tx = this.db.transaction(stores, mode);
+            const result = callback(tx);
+            tx.oncomplete = () => resolve(result?.result ?? result);
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    async getAll() {
+        if (!this.db) return Array.from(this.memoryOrders.values());
+        return this.transaction(['orders'], 'readonly', tx => tx.objectStore('orders').getAll());
+    }
+
+    async getToken() {
+        if (!this.db) return this.memoryToken;
+        const token = await this.transaction(['meta'], 'readonly', tx => tx.objectStore('meta').get('syncToken'));
+        return token || null;
+    }
+
+    async applyChanges(orders, deletedIds, token) {
+        if (!this.db) {
+            orders.forEach(order => this.memoryOrders.set(order.id, order));
+            deletedIds.forEach(id => this.memoryOrders.delete(id));
+            if (token !== undefined) this.memoryToken = token;
+            return;
+        }
+        await this.transaction(['orders', 'meta'], 'readwrite', tx => {
+            const store = tx.objectStore('orders');
+            orders.forEach(order => store.put(order));
+            deletedIds.forEach(id => store.delete(id));
+            if (token !== undefined) {
+                tx.objectStore('meta').put(token, 'syncToken');
+            }
+        });
+    }
+
+    async clear() {
+        this.memoryOrders.clear();
+        this.memoryToken = null;
+        if (!this.db) return;
+        await this.transaction(['orders', 'meta'], 'readwrite', tx => {
+            tx.objectStore('orders').clear();
+            tx.objectStore('meta').clear();
+        });
+    }
+}
+
 class OrderManager {
     constructor() {
         this.editingOrderId = null;
+        this.changedFields = new Set();
         this.deleteOrderId = null;
+        // 新規登録の再送で受注が重複しないよう、フォームごとに同じ Idempotency-Key を送る
+        this.idempotencyKey = null;
+        this.userId = document.querySelector('meta[name=user-id]')?.getAttribute('content');
+        this.cache = new OrderCache(this.userId);
+        this.syncing = null;
+        this.pollTimer = null;
+        this.pollInterval = 30000;
         
         this.initializeTabulator();
         this.initializeEventListeners();
+        this.loadOrders().then(() => this.connectEvents());
+        this.loadFacets();
     }
     
     initializeTabulator() {
-        // Tabulatorテーブルの初期化
+        // Tabulatorテーブルの初期化（全件をローカルに保持し、仮想DOMで描画）
         this.table = new Tabulator("#orders-table", {
-            ajaxURL: "/api/orders",
-            ajaxConfig: {
-                method: "GET",
-                headers: {
-                    "X-CSRFToken": document.querySelector('meta[name=csrf-token]').getAttribute('content')
-                },
-            },
+            data: [],
+            index: "id",
+            height: "600px",
+            renderVertical: "virtual",
             layout: "fitDataTable",
             responsiveLayout: "hide",
             history: true,
-            pagination: "remote",
-            paginationSize: 20,
-            paginationSizeSelector: [10, 20, 50, 100],
             movableColumns: true,
             resizableColumns: true,
             tooltips: true,
@@ -131,9 +217,147 @@ class OrderManager {
                     },
                 },
             ],
-            ajaxResponse: function (url, params, response) {
-                return response.orders;
-            },
+        });
+        this.tableBuilt = new Promise(resolve => this.table.on("tableBuilt", resolve));
+    }
+
+    async loadOrders() {
+        // キャッシュ済みのデータを即座に表示してから差分のみ取得する
+        await Promise.all([this.cache.open(), this.tableBuilt]);
+        const cached = await this.cache.getAll();
+        if (cached.length > 0) {
+            await this.table.setData(cached);
+        } else {
+            // 初回はHTMLに埋め込まれた最初のページを表示し、続きがある場合のみAPIから取得する
+            const initial = this.takeInitialChanges();
+            if (initial) {
+                await this.cache.applyChanges(initial.orders, initial.deleted, initial.next);
+                await this.applyRowPatches(initial.orders, initial.deleted);
+                if (!initial.has_more) {
+                    this.markCacheReady();
+                    return;
+                }
+            }
+        }
+        await this.syncChanges();
+        this.markCacheReady();
+    }
+
+    markCacheReady() {
+        // IndexedDBにキャッシュが揃ったことをサーバーに伝え、次回から初期データの埋め込みを省かせる
+        if (!this.cache.db || !this.userId) return;
+        const secure = location.protocol === 'https:' ? '; Secure' : '';
+        document.cookie = `order_cache=${this.userId}; path=/orders; max-age=${30 * 24 * 60 * 60}; SameSite=Lax${secure}`;
+    }
+
+    takeInitialChanges() {
+        const element = document.getElementById('initialOrderChanges');
+        if (!element) return null;
+        element.remove();
+        return JSON.parse(element.textContent);
+    }
+
+    syncChanges() {
+        // 同時に複数の同期が走らないようにする
+        if (!this.syncing) {
+            this.syncing = this.fetchChanges().finally(() => {
+                this.syncing = null;
+            });
+        }
+        return this.syncing;
+    }
+
+    async fetchChanges() {
+        try {
+            let token = await this.cache.getToken();
+            let hasMore = true;
+            while (hasMore) {
+                const params = new URLSearchParams();
+                if (token) params.append('since', token);
+                const response = await fetch(`/api/orders/changes?${params}`, {
+                    headers: {
+                        'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
+                    }
+                });
+                if (response.status === 400 && token) {
+                    // トークンが無効な場合はキャッシュを破棄して全件を取り直す
+                    await this.cache.clear();
+                    await this.table.clearData();
+                    token = null;
+                    continue;
+                }
+                if (!response.ok) {
+                    throw new Error('受注データの同期に失敗しました');
+                }
+
+                const data = await response.json();
+                await this.cache.applyChanges(data.orders, data.deleted, data.next);
+                await this.applyRowPatches(data.orders, data.deleted);
+                token = data.next;
+                hasMore = data.has_more;
+            }
+        } catch (error) {
+            console.error('Error syncing orders:', error);
+            this.showError('受注データの同期中にエラーが発生しました');
+        }
+    }
+
+    connectEvents() {
+        // 他ユーザーの変更をServer-Sent Eventsで受け取り、行単位で反映する
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        const source = new EventSource('/api/orders/stream');
+        let disconnected = false;
+
+        source.addEventListener('order', async (e) => {
+            const event = JSON.parse(e.data);
+            if (event.type === 'resync') {
+                await this.syncChanges();
+            } else if (event.type === 'delete') {
+                await this.cache.applyChanges([], [event.id]);
+                await this.applyRowPatches([], [event.id]);
+            } else if (event.order) {
+                await this.cache.applyChanges([event.order], []);
+                await this.applyRowPatches([event.order], []);
+            }
+        });
+
+        source.addEventListener('open', () => {
+            // 再接続時は切断中に取りこぼした変更を差分同期で補う
+            if (disconnected) {
+                disconnected = false;
+                this.syncChanges();
+            }
+        });
+
+        source.addEventListener('error', () => {
+            disconnected = true;
+            // サーバーがストリーミングを提供しない場合（204応答など）はポーリングに切り替える
+            if (source.readyState === EventSource.CLOSED) {
+                this.startPolling();
+            }
+        });
+    }
+
+    startPolling() {
+        if (this.pollTimer) return;
+        this.pollTimer = setInterval(() => {
+            if (!document.hidden) {
+                this.syncChanges();
+            }
+        }, this.pollInterval);
+    }
+
+    async applyRowPatches(orders, deletedIds) {
+        if (orders.length > 0) {
+            await this.table.updateOrAddData(orders);
+        }
+        deletedIds.forEach(id => {
+            const row = this.table.getRow(id);
+            if (row) row.delete();
         });
     }
     
@@ -148,6 +372,7 @@ class OrderManager {
         document.getElementById('clearSearchBtn').addEventListener('click', () => {
             document.getElementById('searchForm').reset();
             this.table.clearFilter();
+            this.loadFacets();
         });
         
         // Modal events
@@ -217,6 +442,11 @@ class OrderManager {
             }
         });
 
+        // 編集時に変更された項目を記録する（更新では変更された列だけを書き込む）
+        ['input', 'change'].forEach(type => form.addEventListener(type, (e) => {
+            if (e.target.name) this.changedFields.add(e.target.name);
+        }));
+
         // フォーム送信時の処理
         form.addEventListener('submit', async (e) => {
             e.preventDefault();
@@ -235,6 +465,7 @@ class OrderManager {
             
             this.editingOrderId = orderId;
             this.populateForm(order);
+            this.changedFields = new Set();
             
             // Update modal title
             document.getElementById('orderModalTitle').innerHTML = 
@@ -295,13 +526,17 @@ class OrderManager {
                 }
             });
             
-            const response = await fetch(url, {
-                method: method,
-                headers: {
-                    'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
-                },
-                body: formData
-            });
+            const headers = {
+                'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
+            };
+            if (method === 'PUT') {
+                formData.append('changed_fields', [...this.changedFields].join(','));
+            }
+            if (method === 'POST') {
+                this.idempotencyKey = this.idempotencyKey || crypto.randomUUID();
+                headers['Idempotency-Key'] = this.idempotencyKey;
+            }
+            const response = await this.sendWithRetry(url, { method: method, headers: headers, body: formData }, method === 'POST' ? 2 : 0);
             
             const result = await response.json();
             
@@ -312,9 +547,12 @@ class OrderManager {
                     throw new Error(result.error || '保存中にエラーが発生しました');
                 }
             } else {
+                this.idempotencyKey = null;
                 this.showSuccess(result.message);
                 this.hideModal('orderModal');
-                this.table.replaceData(); // データ保存後にテーブルを更新
+                // 保存結果をテーブルとキャッシュへ直接反映
+                await this.cache.applyChanges([result.order], []);
+                await this.applyRowPatches([result.order], []);
             }
         } catch (error) {
             console.error('Error saving order:', error);
@@ -327,6 +565,20 @@ class OrderManager {
         }
     }
     
+    async sendWithRetry(url, options, retries) {
+        // 通信エラー時のみ再送する（Idempotency-Key 付きの登録は再送しても重複しない）
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await fetch(url, options);
+            } catch (error) {
+                if (attempt >= retries) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+            }
+        }
+    }
+    
     confirmDelete(orderId) {
         this.deleteOrderId = orderId;
         const modal = new bootstrap.Modal(document.getElementById('deleteModal'));
@@ -350,7 +602,10 @@ class OrderManager {
             const result = await response.json();
             this.showSuccess(result.message);
             this.hideModal('deleteModal');
-            this.table.replaceData(); // 削除後にテーブルを更新
+            // 削除結果をテーブルとキャッシュへ直接反映
+            const deletedId = parseInt(this.deleteOrderId);
+            await this.cache.applyChanges([], [deletedId]);
+            await this.applyRowPatches([], [deletedId]);
             
         } catch (error) {
             console.error('Error deleting order:', error);
@@ -364,6 +619,7 @@ class OrderManager {
         document.getElementById('orderForm').reset();
         document.getElementById('id').value = ''; // IDをクリア
         this.editingOrderId = null;
+        this.idempotencyKey = null;
         
         // Update modal title to '新規受注登録'
         document.getElementById('orderModalTitle').innerHTML = 
@@ -527,6 +783,75 @@ class OrderManager {
 
         // フィルターを適用
         this.table.setFilter(filters);
+        this.loadFacets();
+    }
+
+    searchParams() {
+        // 検索フォームの条件をAPIのクエリパラメータに変換
+        const fields = {
+            order_date_from: 'orderDateFrom',
+            order_date_to: 'orderDateTo',
+            customer_name: 'searchCustomerName',
+            project_name: 'searchProjectName',
+            contract_type: 'searchContractType',
+            sales_stage: 'searchSalesStage',
+            billing_month_from: 'billingDateFrom',
+            billing_month_to: 'billingDateTo',
+            work_in_progress: 'searchWorkInProgress'
+        };
+        const params = new URLSearchParams();
+        for (const [param, elementId] of Object.entries(fields)) {
+            const value = document.getElementById(elementId).value;
+            if (value) {
+                params.append(param, value);
+            }
+        }
+        return params;
+    }
+
+    async loadFacets() {
+        try {
+            const response = await fetch(`/api/orders/facets?${this.searchParams()}`, {
+                headers: {
+                    'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
+                }
+            });
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+            this.renderFacets(data.facets);
+        } catch (error) {
+            console.error('Error loading facets:', error);
+        }
+    }
+
+    renderFacets(facets) {
+        // 契約・確度は候補リストに件数を表示
+        const fillDatalist = (datalistId, items) => {
+            const datalist = document.getElementById(datalistId);
+            if (!datalist) return;
+            datalist.innerHTML = '';
+            items.filter(item => item.value).forEach(item => {
+                const option = document.createElement('option');
+                option.value = item.value;
+                option.label = `${item.value} (${item.count.toLocaleString()})`;
+                datalist.appendChild(option);
+            });
+        };
+        fillDatalist('contractTypeFacets', facets.contract_type);
+        fillDatalist('salesStageFacets', facets.sales_stage);
+
+        // 仕掛は選択肢のラベルに件数を付与
+        const counts = { true: 0, false: 0 };
+        facets.work_in_progress.forEach(item => {
+            counts[item.value ? 'true' : 'false'] += item.count;
+        });
+        const labels = { '': 'すべて', 'true': 'あり', 'false': 'なし' };
+        Array.from(document.getElementById('searchWorkInProgress').options).forEach(option => {
+            const count = option.value === '' ? counts.true + counts.false : counts[option.value];
+            option.textContent = `${labels[option.value]} (${count.toLocaleString()})`;
+        });
     }
 }
 
@@ -60,20 +60,55 @@ class ProfitAnalyzer {
         if (bpCostInput) {
             setupCostInput(bpCostInput);
         }
+
+        // 案件が個別に選択され、期間が1か月以内の場合のみ原価を保存できる（原価は月単位で保存する）
+        const projectSelect = document.getElementById('projectSelect');
+        const saveCostBtn = document.getElementById('saveCostBtn');
+        if (projectSelect && saveCostBtn) {
+            const updateSaveCostBtn = () => {
+                saveCostBtn.disabled = !projectSelect.value || projectSelect.value === 'all' || !this.costMonth();
+            };
+            ['projectSelect', 'startDate', 'endDate'].forEach(id => {
+                document.getElementById(id)?.addEventListener('change', updateSaveCostBtn);
+            });
+            updateSaveCostBtn();
+            saveCostBtn.addEventListener('click', () => {
+                this.saveCosts();
+            });
+        }
+
+        // ランキングフォームの送信
+        const rankingForm = document.getElementById('rankingForm');
+        if (rankingForm) {
+            rankingForm.addEventListener('submit', (e) => {
+                e.preventDefault();
+                this.loadRanking();
+            });
+        }
+    }
+
+    async fetchProjects() {
+        // 初回はHTMLに埋め込まれた一覧を使い、APIを呼ばない
+        const initial = document.getElementById('initialProjects');
+        if (initial) {
+            initial.remove();
+            return JSON.parse(initial.textContent);
+        }
+
+        const response = await fetch('/api/projects', {
+            headers: {
+                'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
+            }
+        });
+        if (!response.ok) {
+            throw new Error('プロジェクト一覧の取得に失敗しました');
+        }
+        return response.json();
     }
 
     async loadProjects() {
         try {
-            const response = await fetch('/api/projects', {
-                headers: {
-                    'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
-                }
-            });
-            if (!response.ok) {
-                throw new Error('プロジェクト一覧の取得に失敗しました');
-            }
-            
-            const data = await response.json();
+            const data = await this.fetchProjects();
             const select = document.getElementById('projectSelect');
             
             // 既存のオプションをクリア（最初の2つの静的オプションを除く）
@@ -117,6 +152,9 @@ class ProfitAnalyzer {
                 }
 
                 const data = await response.json();
+                if (project_name !== 'all') {
+                    await this.loadPersistedCosts(project_name, start_date, end_date);
+                }
                 this.currentData = data; // 最新データを保存
                 this.renderProfitData(data);
             } finally {
@@ -129,6 +167,139 @@ class ProfitAnalyzer {
         }
     }
     
+    costMonth() {
+        // 期間が1か月以内なら原価を保存する月（YYYY-MM）、複数月にまたがる場合は null
+        const startDate = document.getElementById('startDate').value;
+        const endDate = document.getElementById('endDate').value;
+        if (!startDate || !endDate || startDate.slice(0, 7) !== endDate.slice(0, 7)) {
+            return null;
+        }
+        return startDate.slice(0, 7);
+    }
+
+    async loadPersistedCosts(projectName, startDate, endDate) {
+        // 保存済みの月次原価を入力欄に反映する（入力欄は1か月分の原価のため、複数月の期間では反映しない）
+        if (startDate.slice(0, 7) !== endDate.slice(0, 7)) {
+            return;
+        }
+        const params = new URLSearchParams({ project_name: projectName, start_date: startDate, end_date: endDate });
+        const response = await fetch(`/api/project-costs?${params}`, {
+            headers: {
+                'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
+            }
+        });
+        if (!response.ok) {
+            return;
+        }
+
+        const data = await response.json();
+        if (data.costs.length === 0) {
+            return;
+        }
+        document.getElementById('employee_cost_input').value = data.total_employee_cost.toLocaleString('ja-JP', { maximumFractionDigits: 0 });
+        document.getElementById('bp_cost_input').value = data.total_bp_cost.toLocaleString('ja-JP', { maximumFractionDigits: 0 });
+    }
+
+    async saveCosts() {
+        const projectName = document.getElementById('projectSelect').value;
+        const costMonth = this.costMonth();
+        if (!projectName || projectName === 'all' || !costMonth) {
+            this.showAlert('案件を選択し、原価を保存する月を期間に指定してください（開始日と終了日を同じ月にします）', 'warning');
+            return;
+        }
+
+        const formData = new FormData();
+        formData.append('project_name', projectName);
+        formData.append('cost_month', costMonth);
+        formData.append('employee_cost', document.getElementById('employee_cost_input').value.replace(/,/g, ''));
+        formData.append('bp_cost', document.getElementById('bp_cost_input').value.replace(/,/g, ''));
+
+        try {
+            const response = await fetch('/api/project-costs', {
+                method: 'PUT',
+                headers: {
+                    'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
+                },
+                body: formData
+            });
+            const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.error || '原価の保存に失敗しました');
+            }
+            this.showAlert(result.message, 'success');
+        } catch (error) {
+            console.error('Error saving costs:', error);
+            this.showAlert(error.message || '原価の保存中にエラーが発生しました', 'danger');
+        }
+    }
+
+    async loadRanking() {
+        const startDate = document.getElementById('startDate').value;
+        const endDate = document.getElementById('endDate').value;
+        if (!startDate || !endDate) {
+            this.showAlert('受注日（開始・終了）を入力してください', 'warning');
+            return;
+        }
+
+        const params = new URLSearchParams({
+            start_date: startDate,
+            end_date: endDate,
+            order_by: document.getElementById('rankingOrderBy').value,
+            direction: document.getElementById('rankingDirection').value,
+            limit: document.getElementById('rankingLimit').value
+        });
+
+        try {
+            const response = await fetch(`/api/profit-ranking?${params}`, {
+                headers: {
+                    'X-CSRFToken': document.querySelector('meta[name=csrf-token]').getAttribute('content')
+                }
+            });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'ランキングの取得に失敗しました');
+            }
+            this.renderRanking(data.projects);
+        } catch (error) {
+            console.error('Error loading ranking:', error);
+            this.showAlert(error.message || 'ランキングの読み込み中にエラーが発生しました', 'danger');
+        }
+    }
+
+    renderRanking(projects) {
+        const tbody = document.getElementById('rankingTableBody');
+        tbody.innerHTML = '';
+
+        if (projects.length === 0) {
+            tbody.innerHTML = '<tr><td colspan="6" class="text-center text-muted">データがありません</td></tr>';
+            return;
+        }
+
+        projects.forEach((project, index) => {
+            const row = document.createElement('tr');
+            const cells = [
+                index + 1,
+                project.project_name,
+                `¥${project.sales_amount.toLocaleString()}`,
+                `¥${project.total_cost.toLocaleString()}`,
+                `¥${project.profit.toLocaleString()}`,
+                project.profit_rate === null ? '-' : `${project.profit_rate.toFixed(1)}%`
+            ];
+            cells.forEach((value, cellIndex) => {
+                const cell = document.createElement('td');
+                cell.textContent = value;
+                if (cellIndex >= 2) {
+                    cell.classList.add('text-end');
+                }
+                if (cellIndex === 4 && project.profit < 0) {
+                    cell.classList.add('text-danger');
+                }
+                row.appendChild(cell);
+            });
+            tbody.appendChild(row);
+        });
+    }
+
     renderProfitData(data) {
         const profitDataDisplay = document.getElementById('profitDataDisplay');
         const noProfitData = document.getElementById('noProfitData');
@@ -202,6 +373,29 @@ class ProfitAnalyzer {
         window.location.reload();
     }
     
+    showAlert(message, type) {
+        const alertContainer = document.getElementById('alertContainer');
+        if (!alertContainer) return;
+
+        const alertDiv = document.createElement('div');
+        alertDiv.className = `alert alert-${type} alert-dismissible fade show`;
+        alertDiv.setAttribute('role', 'alert');
+        alertDiv.textContent = message;
+        const closeButton = document.createElement('button');
+        closeButton.type = 'button';
+        closeButton.className = 'btn-close';
+        closeButton.setAttribute('data-bs-dismiss', 'alert');
+        closeButton.setAttribute('aria-label', 'Close');
+        alertDiv.appendChild(closeButton);
+        alertContainer.appendChild(alertDiv);
+
+        setTimeout(() => {
+            if (alertDiv?.parentNode) {
+                alertDiv.parentNode.removeChild(alertDiv);
+            }
+        }, 5000);
+    }
+
     formatDate(dateStr) {
         // YYYY-MM-DD 形式の日付文字列を YYYY年M月D日 形式に変換
         const [year, month, day] = dateStr.split('-');
@@ -0,0 +1,68 @@
+"""テンプレートのバイトコードキャッシュ
+
+    flask precompile-templates
+
+デプロイ前に全テンプレートをコンパイルし、バイトコードを TEMPLATE_BYTECODE_DIR に書き出す。
+起動時にそのディレクトリがあればバイトコードキャッシュとして使い、全テンプレートを読み込んでおく
+（コールドスタート直後の最初の表示でテンプレートをソースからコンパイルしない）。
+バイトコードはテンプレートのソースのハッシュと照合されるため、ソースが変わったテンプレートは再コンパイルされる。
+template_cache はリポジトリに含めないため、Vercel へのデプロイでは .github/workflows/vercel_deploy.yml が
+vercel build の前にこのコマンドを実行する（バイトコードは実行環境と同じバージョンの Python で作ること）。
+"""
+import logging
+import os
+import shutil
+
+import click
+from jinja2 import FileSystemBytecodeCache
+
+DEFAULT_BYTECODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template_cache')
+
+
+class PortableBytecodeCache(FileSystemBytecodeCache):
+    """テンプレート名だけをキーにし、ビルドと実行でパスが異なっても同じバイトコードを使う"""
+
+    def get_cache_key(self, name, filename=None):
+        return super().get_cache_key(name)
+
+    def dump_bytecode(self, bucket):
+        # サーバーレス環境ではデプロイ先が読み取り専用のため、書き込めなければメモリ上のみで使う
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            logging.debug(f"Template bytecode not written for {bucket.key}: {e}")
+
+
+def precompile_templates(app):
+    """全テンプレートをコンパイルしてバイトコードを書き出し、テンプレート名の一覧を返す"""
+    directory = app.config['TEMPLATE_BYTECODE_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    environment = app.jinja_env.overlay(bytecode_cache=PortableBytecodeCache(directory), cache_size=0)
+    names = environment.list_templates()
+    for name in names:
+        environment.get_template(name)
+    return names
+
+
+def preload_templates(app):
+    """全テンプレートを読み込み、Jinja のテンプレートキャッシュに載せる"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def init_app(app):
+    app.config.setdefault('TEMPLATE_BYTECODE_DIR', os.environ.get('TEMPLATE_BYTECODE_DIR', DEFAULT_BYTECODE_DIR))
+    directory = app.config['TEMPLATE_BYTECODE_DIR']
+    # ビルド済みのバイトコードがある場合のみ使う（開発環境ではソースから都度コンパイルする）
+    if os.path.isdir(directory):
+        app.jinja_options = {**app.jinja_options, 'bytecode_cache': PortableBytecodeCache(directory)}
+        if app.config.setdefault('TEMPLATE_PRELOAD', True):
+            preload_templates(app)
+
+    @app.cli.command('precompile-templates')
+    def precompile_templates_command():
+        """テンプレートをコンパイルし、バイトコードを書き出す"""
+        names = precompile_templates(app)
+        click.echo(f"Precompiled {len(names)} templates into {app.config['TEMPLATE_BYTECODE_DIR']}")
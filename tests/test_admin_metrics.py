@@ -0,0 +1,40 @@
+import pytest
+from models import User
+from bs4 import BeautifulSoup
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestAdminMetrics:
+
+    def _login(self, client, db_session, is_admin):
+        user = User(username='metricsuser', email='metrics@example.com', is_admin=is_admin, is_active=True)
+        user.set_password('password')
+        db_session.add(user)
+        db_session.commit()
+
+        response = client.get('/login')
+        csrf_token = BeautifulSoup(response.data, 'html.parser').find('input', {'name': 'csrf_token'}).get('value')
+        client.post('/login', data={'username': 'metricsuser', 'password': 'password', 'csrf_token': csrf_token})
+
+    def test_admin_metrics_counts_executions(self, client, db_session):
+        self._login(client, db_session, is_admin=True)
+        client.get('/api/projects')
+        client.get('/api/profit-data?project_name=all&start_date=2024-01-01&end_date=2024-01-31')
+
+        response = client.get('/admin/metrics')
+        assert response.status_code == 200
+        counters = response.get_json()['counters']
+        assert counters['singleflight.projects.executions'] == 1
+        assert counters['singleflight.profit_data.executions'] == 1
+
+    def test_admin_metrics_requires_admin(self, client, db_session):
+        self._login(client, db_session, is_admin=False)
+
+        response = client.get('/admin/metrics')
+        assert response.status_code == 302
+
+    def test_admin_metrics_requires_login(self, client):
+        response = client.get('/admin/metrics')
+        assert response.status_code == 302
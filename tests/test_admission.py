@@ -0,0 +1,135 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from admission import AdmissionController, classify, get_admission
+from cache import app_single_flight, data_version
+from metrics import MetricsRegistry, get_metrics
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def controller(capacity=4, **classes):
+    settings = {
+        'write': {'limit': 2, 'queue': 1, 'wait': 0.5, 'reserve': 0},
+        'heavy': {'limit': 2, 'queue': 0, 'wait': 0, 'reserve': 2},
+    }
+    settings.update(classes)
+    return AdmissionController(settings, capacity, MetricsRegistry())
+
+
+class TestAdmissionController:
+
+    def test_limit_per_class_sheds_without_queue(self):
+        admission = controller(heavy={'limit': 1, 'queue': 0, 'wait': 0, 'reserve': 0})
+        assert admission.acquire('heavy')
+        assert admission.acquire('heavy') is False
+        assert admission.metrics.get('admission.heavy.shed') == 1
+        assert admission.snapshot()['heavy'] == {'in_flight': 1, 'waiting': 0}
+
+    def test_lower_priority_is_shed_before_writes(self):
+        admission = controller()
+        assert admission.acquire('write')
+        assert admission.acquire('write')
+        # 全体で2件実行中のため、heavy は受け付けない
+        assert admission.acquire('heavy') is False
+        admission.release('write')
+        assert admission.acquire('heavy')
+
+    def test_waiting_request_is_admitted_on_release(self):
+        admission = controller()
+        admission.acquire('write')
+        admission.acquire('write')
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(admission.acquire('write')))
+        waiter.start()
+        while admission.snapshot()['write']['waiting'] == 0:
+            time.sleep(0.001)
+
+        # 待ち行列は1件のため、それ以上は待たずに断る
+        assert admission.acquire('write') is False
+        admission.release('write')
+        waiter.join(timeout=1)
+        assert results == [True]
+        assert admission.metrics.get('admission.write.queued') == 1
+
+    def test_wait_timeout_sheds(self):
+        admission = controller(write={'limit': 1, 'queue': 1, 'wait': 0.01, 'reserve': 0})
+        assert admission.acquire('write')
+        assert admission.acquire('write') is False
+        assert admission.snapshot()['write'] == {'in_flight': 1, 'waiting': 0}
+
+
+class TestAdmissionControl:
+
+    def test_classify(self, app):
+        with app.test_request_context():
+            assert classify('main.api_get_orders', 'GET') == 'read'
+            assert classify('main.api_create_order', 'POST') == 'write'
+            assert classify('main.api_get_profit_data', 'GET') == 'heavy'
+            assert classify('main.api_order_stream', 'GET') is None
+            assert classify('static', 'GET') is None
+
+    def test_heavy_requests_are_shed_while_reads_continue(self, client, authenticated_user, app):
+        admission = get_admission(app)
+        # 重い集計が上限まで実行中の状態にする
+        for _ in range(admission.classes['heavy']['limit']):
+            assert admission.acquire('heavy')
+        try:
+            response = client.get('/api/profit-data?project_name=all&start_date=2024-01-01&end_date=2024-01-31')
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == str(app.config['ADMISSION_RETRY_AFTER'])
+            assert get_metrics(app).get('admission.heavy.shed') == 1
+
+            assert client.get('/api/orders').status_code == 200
+        finally:
+            for _ in range(admission.classes['heavy']['limit']):
+                admission.release('heavy')
+
+    def test_slots_are_released_after_requests(self, client, authenticated_user, app):
+        client.get('/api/orders')
+        client.get('/api/profit-data?project_name=all&start_date=bad&end_date=bad')
+        client.post('/api/orders', data={})
+        snapshot = get_admission(app).snapshot()
+        assert all(counts == {'in_flight': 0, 'waiting': 0} for counts in snapshot.values())
+        assert get_metrics(app).get('admission.write.admitted') >= 1
+
+    def test_single_flight_waiters_are_not_shed(self, client, authenticated_user, app):
+        admission = get_admission(app)
+        release = threading.Event()
+
+        def leader():
+            # 実行中の集計（先頭のリクエスト）が重い集計の枠を使っている状態にする
+            with app.test_request_context():
+                key = (data_version(), False, 'all', date(2024, 1, 1), date(2024, 1, 31))
+                app_single_flight('profit_data').do(key, lambda: release.wait(5) and {'total_sales_amount': 1.0})
+
+        def release_when_joined():
+            while get_metrics(app).get('singleflight.profit_data.shared') == 0:
+                time.sleep(0.001)
+            release.set()
+
+        for _ in range(admission.classes['heavy']['limit']):
+            assert admission.acquire('heavy')
+        threads = [threading.Thread(target=leader), threading.Thread(target=release_when_joined)]
+        try:
+            threads[0].start()
+            while get_metrics(app).get('singleflight.profit_data.executions') == 0:
+                time.sleep(0.001)
+            threads[1].start()
+            # 同じ条件のリクエストは枠を使わずに結果を待って共有する
+            response = client.get('/api/profit-data?project_name=all&start_date=2024-01-01&end_date=2024-01-31')
+            assert response.status_code == 200
+            assert response.get_json() == {'total_sales_amount': 1.0}
+            assert get_metrics(app).get('admission.heavy.shed') == 0
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join(timeout=5)
+            for _ in range(admission.classes['heavy']['limit']):
+                admission.release('heavy')
@@ -0,0 +1,135 @@
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from bs4 import BeautifulSoup
+from app import create_app, db
+from models import User, Order, Project
+from archive import archive_orders
+from aggregation import split_date_range, sum_amounts_sharded
+from admission import get_admission
+from budgets import QueryBudget
+from flask import g
+from metrics import get_metrics
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    # 並列集計はスレッドごとに別の接続を使うため、ファイルのSQLiteを使う
+    flask_app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'orders.db'}",
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SESSION_COOKIE_SECURE": False
+    })
+    flask_app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com', is_active=True)
+        user.set_password('password')
+        db.session.add(user)
+        for index in range(120):
+            db.session.add(Order(
+                customer_name='Customer A',
+                project_name=f'Project {index % 3}',
+                sales_amount=Decimal('1000.10') + index,
+                order_amount=Decimal('900.05'),
+                invoiced_amount=Decimal('800.01'),
+                order_date=date(2022, 1, 1) + timedelta(days=index * 7)
+            ))
+        db.session.commit()
+        # 古い受注の一部をアーカイブし、明細・月次集計・ホットの3経路を混在させる
+        archive_orders(db.engine, date(2022, 12, 1))
+        db.session.remove()
+
+    yield flask_app
+
+    with flask_app.app_context():
+        db.engine.dispose()
+
+class TestSplitDateRange:
+
+    def test_month_aligned_shards(self):
+        assert split_date_range(date(2024, 1, 15), date(2024, 3, 10), 3) == [
+            (date(2024, 1, 15), date(2024, 1, 31)),
+            (date(2024, 2, 1), date(2024, 2, 29)),
+            (date(2024, 3, 1), date(2024, 3, 10)),
+        ]
+
+    def test_uneven_months(self):
+        ranges = split_date_range(date(2024, 1, 1), date(2024, 12, 31), 5)
+        assert len(ranges) == 5
+        assert ranges[0] == (date(2024, 1, 1), date(2024, 3, 31))
+        assert ranges[-1][1] == date(2024, 12, 31)
+
+    def test_day_shards_for_short_ranges(self):
+        assert split_date_range(date(2024, 1, 1), date(2024, 1, 10), 2) == [
+            (date(2024, 1, 1), date(2024, 1, 5)),
+            (date(2024, 1, 6), date(2024, 1, 10)),
+        ]
+        assert split_date_range(date(2024, 1, 1), date(2024, 1, 1), 4) == [(date(2024, 1, 1), date(2024, 1, 1))]
+
+    def test_ranges_are_contiguous(self):
+        ranges = split_date_range(date(2023, 5, 17), date(2025, 2, 3), 7)
+        assert ranges[0][0] == date(2023, 5, 17)
+        assert ranges[-1][1] == date(2025, 2, 3)
+        for (_, previous_end), (next_start, _) in zip(ranges, ranges[1:]):
+            assert next_start == previous_end + timedelta(days=1)
+
+class TestShardedAggregation:
+
+    def _profit(self, client, project_name, start_date, end_date):
+        response = client.get(f'/api/profit-data?project_name={project_name}&start_date={start_date}&end_date={end_date}')
+        assert response.status_code == 200
+        return response.get_json()
+
+    @pytest.mark.parametrize('shards', [2, 4, 7])
+    def test_sharded_totals_match_single_query(self, file_app, shards):
+        with file_app.app_context():
+            project_id = db.session.query(Project.id).filter_by(name='Project 1').scalar()
+            single = sum_amounts_sharded(db.engine, date(2022, 1, 10), date(2024, 3, 20), None, 1)
+            sharded = sum_amounts_sharded(db.engine, date(2022, 1, 10), date(2024, 3, 20), None, shards)
+            assert sharded == single
+            assert all(isinstance(value, Decimal) for value in sharded)
+
+            single = sum_amounts_sharded(db.engine, date(2022, 1, 10), date(2024, 3, 20), [project_id], 1)
+            sharded = sum_amounts_sharded(db.engine, date(2022, 1, 10), date(2024, 3, 20), [project_id], shards)
+            assert sharded == single
+
+    def test_profit_data_endpoint_with_shards(self, file_app):
+        client = file_app.test_client()
+        response = client.get('/login')
+        csrf_token = BeautifulSoup(response.data, 'html.parser').find('input', {'name': 'csrf_token'}).get('value')
+        client.post('/login', data={'username': 'testuser', 'password': 'password', 'csrf_token': csrf_token})
+
+        expected = self._profit(client, 'all', '2022-01-10', '2024-03-20')
+        file_app.config['PROFIT_AGGREGATION_SHARDS'] = 4
+        assert self._profit(client, 'all', '2022-01-10', '2024-03-20') == expected
+        assert expected['total_sales_amount'] > 0
+
+    def test_shards_take_admission_slots(self, file_app):
+        with file_app.app_context():
+            admission = get_admission(file_app)
+            heavy_room = admission.capacity - admission.classes['heavy']['reserve']
+            for _ in range(heavy_room):
+                admission.acquire('write')
+            try:
+                # 追加の接続の枠が空いていなければ分割しない
+                assert sum_amounts_sharded(db.engine, date(2022, 1, 10), date(2024, 3, 20), None, 4) is None
+                assert get_metrics(file_app).get('admission.heavy.extra_denied') == 1
+            finally:
+                for _ in range(heavy_room):
+                    admission.release('write')
+
+            assert sum_amounts_sharded(db.engine, date(2022, 1, 10), date(2024, 3, 20), None, 4) is not None
+            # 確保した枠は集計後に返す
+            assert admission.acquire_extra('heavy', heavy_room) == heavy_room
+            admission.release_extra(heavy_room)
+
+    def test_shards_inherit_query_budget(self, file_app):
+        with file_app.test_request_context('/api/profit-data'):
+            g.query_budget = budget = QueryBudget(max_statements=2)
+            with pytest.raises(Exception, match='Query budget exceeded'):
+                sum_amounts_sharded(db.engine, date(2022, 1, 10), date(2024, 3, 20), None, 4)
+            assert budget.exceeded == 'statements'
+            assert budget.statements > 2
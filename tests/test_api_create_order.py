@@ -157,4 +157,19 @@ class TestApiCreateOrder:
         # Since it's an API, we expect 401.
         # No CSRF token is needed here as the request should be blocked before CSRF validation.
         response = client.post('/api/orders', data={}, content_type='application/x-www-form-urlencoded') # Data can be empty if it's blocked by login_required
-        assert response.status_code == 401
\ No newline at end of file
+        assert response.status_code == 401
+
+    def test_create_order_request_too_large(self, client, authenticated_user, app):
+        csrf_token = self._get_csrf_token(client)
+        response = client.post(
+            '/api/orders',
+            data={
+                'customer_name': 'Test Customer',
+                'project_name': 'Test Project',
+                'order_date': '2024-01-01',
+                'description': 'x' * (app.config['MAX_CONTENT_LENGTH'] + 1),
+                'csrf_token': csrf_token
+            },
+            content_type='application/x-www-form-urlencoded'
+        )
+        assert response.status_code == 413
@@ -3,6 +3,8 @@ import logging
 from datetime import date
 from models import Order, User
 from bs4 import BeautifulSoup
+from sqlalchemy import event
+from app import db
 
 
 @pytest.fixture
@@ -109,4 +111,40 @@ class TestApiDeleteOrder:
         assert response.status_code == 500
         data = response.get_json()
         assert 'error' in data
-        assert data['error'] == '受注削除中にエラーが発生しました'
\ No newline at end of file
+        assert data['error'] == '受注削除中にエラーが発生しました'
+
+    def test_delete_issues_single_statement(self, client, authenticated_user, db_session):
+        order = Order(customer_name='Old Customer', project_name='Old Project', order_date=date.today())
+        db_session.add(order)
+        db_session.commit()
+        order_id = order.id
+        csrf_token = self._get_csrf_token(client)
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'FROM orders' in statement or 'INTO orders' in statement or statement.startswith('UPDATE orders'):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.delete(f'/api/orders/{order_id}', headers={'X-CSRFToken': csrf_token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert response.status_code == 200
+        assert len(statements) == 1
+        assert statements[0].startswith('DELETE FROM orders')
+
+    def test_delete_without_returning_support(self, client, authenticated_user, db_session, monkeypatch):
+        order = Order(customer_name='Old Customer', project_name='Old Project', order_date=date.today())
+        db_session.add(order)
+        db_session.commit()
+        order_id = order.id
+        csrf_token = self._get_csrf_token(client)
+
+        monkeypatch.setattr(db.engine.dialect, 'delete_returning', False)
+        response = client.delete(f'/api/orders/{order_id}', headers={'X-CSRFToken': csrf_token})
+        assert response.status_code == 200
+
+        db_session.expire_all()
+        assert db_session.get(Order, order_id) is None
@@ -0,0 +1,126 @@
+import pytest
+from datetime import date, datetime, timedelta
+from bs4 import BeautifulSoup
+from models import Order, OrderTombstone
+import routes
+from app import db
+from archive import purge_tombstones
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestApiGetOrderChanges:
+
+    def _get_csrf_token(self, client):
+        """Helper to get CSRF token from the orders page."""
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        csrf_token = soup.find('input', {'name': 'csrf_token'})
+        if csrf_token:
+            return csrf_token.get('value')
+        return None
+
+    def _create_orders(self, db_session, count, updated_at):
+        orders = [
+            Order(customer_name='Customer', project_name=f'Project {i}', order_date=date(2023, 1, 1), updated_at=updated_at)
+            for i in range(count)
+        ]
+        db_session.add_all(orders)
+        db_session.commit()
+        return orders
+
+    def test_initial_sync_returns_all_orders(self, client, authenticated_user, db_session):
+        self._create_orders(db_session, 3, datetime(2023, 1, 1, 9, 0, 0))
+
+        response = client.get('/api/orders/changes')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['orders']) == 3
+        assert data['deleted'] == []
+        assert data['has_more'] is False
+        assert data['next']
+
+    def test_initial_sync_is_paged(self, client, authenticated_user, db_session):
+        self._create_orders(db_session, 3, datetime(2023, 1, 1, 9, 0, 0))
+
+        first = client.get('/api/orders/changes?limit=2').get_json()
+        assert len(first['orders']) == 2
+        assert first['has_more'] is True
+
+        second = client.get(f"/api/orders/changes?limit=2&since={first['next']}").get_json()
+        assert second['has_more'] is False
+        ids = {order['id'] for order in first['orders']} | {order['id'] for order in second['orders']}
+        assert len(ids) == 3
+
+    def test_changes_since_token_only_returns_deltas(self, client, authenticated_user, db_session):
+        old_orders = self._create_orders(db_session, 2, datetime.utcnow() - timedelta(days=1))
+        token = client.get('/api/orders/changes').get_json()['next']
+
+        new_orders = self._create_orders(db_session, 1, datetime.utcnow() - timedelta(minutes=1))
+        data = client.get(f'/api/orders/changes?since={token}').get_json()
+        assert [order['id'] for order in data['orders']] == [new_orders[0].id]
+        assert old_orders[0].id not in [order['id'] for order in data['orders']]
+
+    def test_recent_changes_wait_for_settle_window(self, client, authenticated_user, db_session):
+        self._create_orders(db_session, 1, datetime.utcnow())
+
+        data = client.get('/api/orders/changes').get_json()
+        assert data['orders'] == []
+
+    def test_deleted_orders_are_reported(self, client, authenticated_user, db_session, app):
+        app.config['SYNC_SETTLE_SECONDS'] = 0
+        orders = self._create_orders(db_session, 2, datetime.utcnow() - timedelta(days=1))
+        token = client.get('/api/orders/changes').get_json()['next']
+        deleted_id = orders[0].id
+
+        csrf_token = self._get_csrf_token(client)
+        response = client.delete(f'/api/orders/{deleted_id}', headers={'X-CSRFToken': csrf_token})
+        assert response.status_code == 200
+        assert db_session.query(OrderTombstone).filter_by(order_id=deleted_id).count() == 1
+
+        data = client.get(f'/api/orders/changes?since={token}').get_json()
+        assert data['deleted'] == [deleted_id]
+        assert data['orders'] == []
+
+    def test_invalid_token(self, client, authenticated_user):
+        response = client.get('/api/orders/changes?since=not-a-token')
+        assert response.status_code == 400
+        assert response.get_json()['error'] == '同期トークンが正しくありません'
+
+    def test_authentication_required(self, client):
+        response = client.get('/api/orders/changes')
+        assert response.status_code == 401
+
+    def test_settle_window_covers_query_budget(self, app):
+        # 実行予算の期限とロック待ちの合計より早くコミット前の変更を返さない
+        assert app.config['SYNC_SETTLE_SECONDS'] >= 2 * app.config['QUERY_TIMEOUT_MS'] / 1000
+
+    def test_token_advances_without_deletions(self, client, authenticated_user, db_session):
+        # 削除がなくても削除記録の基準点は上限時刻まで進み、保持期間を過ぎて無効にならない
+        token = routes._encode_sync_token({
+            'u': datetime.min.isoformat(), 'i': 0, 'd': (datetime.utcnow() - timedelta(days=10)).isoformat(), 'j': 0
+        })
+        data = client.get(f'/api/orders/changes?since={token}').get_json()
+        assert routes._decode_sync_token(data['next'])['d'] > datetime.utcnow() - timedelta(minutes=1)
+
+    def test_token_older_than_tombstone_retention(self, client, authenticated_user, db_session, app):
+        token = routes._encode_sync_token({
+            'u': datetime.min.isoformat(), 'i': 0, 'd': (datetime.utcnow() - timedelta(days=31)).isoformat(), 'j': 0
+        })
+        app.config['ORDER_TOMBSTONE_RETENTION_DAYS'] = 30
+        response = client.get(f'/api/orders/changes?since={token}')
+        assert response.status_code == 400
+        assert response.get_json()['error'] == '同期トークンの有効期限が切れています'
+
+    def test_purge_expired_tombstones(self, app, db_session):
+        now = datetime.utcnow()
+        db_session.add_all([
+            OrderTombstone(order_id=1, deleted_at=now - timedelta(days=40)),
+            OrderTombstone(order_id=2, deleted_at=now - timedelta(days=1)),
+        ])
+        db_session.commit()
+
+        assert purge_tombstones(db.engine, 30, batch_size=1) == 1
+        assert [tombstone.order_id for tombstone in db_session.query(OrderTombstone)] == [2]
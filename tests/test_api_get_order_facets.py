@@ -0,0 +1,116 @@
+import pytest
+from datetime import date
+from models import Order
+from app import db
+from sqlalchemy import event
+from bs4 import BeautifulSoup
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestApiGetOrderFacets:
+
+    def _get_csrf_token(self, client):
+        """Helper to get CSRF token from the orders page."""
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        csrf_token = soup.find('input', {'name': 'csrf_token'})
+        if csrf_token:
+            return csrf_token.get('value')
+        return None
+
+    def _seed(self, db_session):
+        db_session.add_all([
+            Order(customer_name='Alpha', project_name='P1', order_date=date(2023, 1, 5), contract_type='請負', sales_stage='受注済', work_in_progress=True),
+            Order(customer_name='Alpha', project_name='P2', order_date=date(2023, 1, 6), contract_type='請負', sales_stage='提案中', work_in_progress=False),
+            Order(customer_name='Beta', project_name='P3', order_date=date(2023, 2, 1), contract_type='準委任', sales_stage='受注済', work_in_progress=False),
+        ])
+        db_session.commit()
+
+    def test_facet_counts(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        response = client.get('/api/orders/facets')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['total'] == 3
+        assert data['facets']['contract_type'] == [
+            {'value': '請負', 'count': 2},
+            {'value': '準委任', 'count': 1},
+        ]
+        assert {item['value']: item['count'] for item in data['facets']['sales_stage']} == {'受注済': 2, '提案中': 1}
+        assert {item['value']: item['count'] for item in data['facets']['work_in_progress']} == {True: 1, False: 2}
+
+    def test_facet_counts_follow_filters(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        response = client.get('/api/orders/facets?customer_name=Alpha&order_date_to=2023-01-31')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['total'] == 2
+        assert data['facets']['contract_type'] == [{'value': '請負', 'count': 2}]
+
+    def test_facets_use_single_query(self, client, authenticated_user, db_session, monkeypatch):
+        self._seed(db_session)
+        statements = []
+        original_execute = db.session.execute
+
+        def counting_execute(*args, **kwargs):
+            statements.append(args[0])
+            return original_execute(*args, **kwargs)
+
+        monkeypatch.setattr(db.session, 'execute', counting_execute)
+        response = client.get('/api/orders/facets?sales_stage=受注済')
+        assert response.status_code == 200
+        assert len(statements) == 1
+
+        # 同じ条件での再取得はキャッシュから返る
+        response = client.get('/api/orders/facets?sales_stage=受注済')
+        assert response.status_code == 200
+        assert len(statements) == 1
+
+    def test_facet_cache_invalidated_by_new_order(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        assert client.get('/api/orders/facets').get_json()['total'] == 3
+
+        csrf_token = self._get_csrf_token(client)
+        response = client.post('/api/orders', data={
+            'customer_name': 'Gamma',
+            'project_name': 'P4',
+            'order_date': '2023-03-01',
+            'csrf_token': csrf_token
+        })
+        assert response.status_code == 201
+        assert client.get('/api/orders/facets').get_json()['total'] == 4
+
+    def test_facets_scan_orders_once(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        db_session.add(Order(customer_name='Gamma', project_name='P4', order_date=date(2023, 3, 1)))
+        db_session.commit()
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            data = client.get('/api/orders/facets').get_json()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        facet_statements = [statement for statement in statements if 'GROUP BY' in statement]
+        assert len(facet_statements) == 1
+        assert 'UNION' not in facet_statements[0]
+        assert data['total'] == 4
+        assert {item['value']: item['count'] for item in data['facets']['work_in_progress']} == \
+            {True: 1, False: 3}
+        assert {item['value']: item['count'] for item in data['facets']['contract_type']} == \
+            {'請負': 2, '準委任': 1, None: 1}
+
+    def test_invalid_date_filter(self, client, authenticated_user):
+        response = client.get('/api/orders/facets?order_date_from=bad')
+        assert response.status_code == 400
+
+    def test_authentication_required(self, client):
+        response = client.get('/api/orders/facets')
+        assert response.status_code == 401
@@ -1,5 +1,7 @@
 import pytest
-from models import Order 
+from models import Order, ORDER_FIELDS
+from sqlalchemy import event
+from app import db
 from routes import main_bp
 from datetime import date # datetime.dateをインポート
 import routes # routesモジュールをインポート
@@ -61,3 +63,76 @@ class TestApiGetOrders:
         assert response.status_code == 500
         data = response.get_json()
         assert 'error' in data
+
+    def test_api_get_orders_with_panel_filters(self, client, authenticated_user, db_session):
+        db_session.add_all([
+            Order(customer_name='Alpha', project_name='P1', order_date=date(2023, 1, 5), contract_type='請負', work_in_progress=True),
+            Order(customer_name='Alpha', project_name='P2', order_date=date(2023, 3, 5), contract_type='請負', work_in_progress=False),
+            Order(customer_name='Beta', project_name='P3', order_date=date(2023, 1, 5), contract_type='準委任', work_in_progress=True),
+        ])
+        db_session.commit()
+
+        response = client.get('/api/orders?contract_type=請負&order_date_from=2023-01-01&order_date_to=2023-01-31&work_in_progress=true')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['total'] == 1
+        assert data['orders'][0]['project_name'] == 'P1'
+
+    def test_api_get_orders_invalid_date_filter(self, client, authenticated_user):
+        response = client.get('/api/orders?order_date_from=2023-13-01')
+        assert response.status_code == 400
+
+    def test_api_get_orders_default_fields_match_to_dict(self, client, authenticated_user, db_session):
+        order = Order(customer_name='Alpha', project_name='P1', order_date=date(2023, 1, 5), description='備考')
+        db_session.add(order)
+        db_session.commit()
+
+        response = client.get('/api/orders')
+        assert response.get_json()['orders'] == [order.to_dict()]
+
+    def test_api_get_orders_sparse_fields(self, client, authenticated_user, db_session, app):
+        db_session.add(Order(customer_name='Alpha', project_name='P1', order_date=date(2023, 1, 5), description='長い備考'))
+        db_session.commit()
+
+        statements = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            response = client.get('/api/orders?fields=project_name,order_date,sales_amount')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        assert response.status_code == 200
+        assert response.get_json()['orders'] == [
+            {'id': 1, 'project_name': 'P1', 'order_date': '2023-01-05', 'sales_amount': 0.0}
+        ]
+        select_statement = next(s for s in statements if 'ORDER BY' in s)
+        assert 'orders.description' not in select_statement
+        assert 'orders.project_name' in select_statement
+
+    def test_api_get_orders_unknown_field(self, client, authenticated_user):
+        response = client.get('/api/orders?fields=project_name,password_hash')
+        assert response.status_code == 400
+        data = response.get_json()
+        assert 'password_hash' in data['error']
+        assert 'project_name' in data['fields']
+
+    def test_api_get_orders_compact_format(self, client, authenticated_user, db_session):
+        db_session.add_all([
+            Order(customer_name='Alpha', project_name='P1', order_date=date(2023, 1, 5), work_in_progress=True),
+            Order(customer_name='Beta', project_name='P2', order_date=date(2023, 1, 6)),
+        ])
+        db_session.commit()
+
+        response = client.get('/api/orders?format=compact&fields=customer_name,work_in_progress')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert 'orders' not in data
+        assert data['columns'] == ['id', 'customer_name', 'work_in_progress']
+        assert sorted(data['rows']) == [[1, 'Alpha', True], [2, 'Beta', False]]
+        assert data['total'] == 2
+
+        full = client.get('/api/orders?format=compact').get_json()
+        assert full['columns'] == list(ORDER_FIELDS)
+        assert len(full['rows'][0]) == len(ORDER_FIELDS)
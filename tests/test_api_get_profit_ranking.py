@@ -0,0 +1,91 @@
+import pytest
+from datetime import date
+from models import Order, Project, ProjectCost
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestApiGetProfitRanking:
+
+    def _seed(self, db_session):
+        projects = {name: Project(name=name) for name in ('ProjectA', 'ProjectB', 'ProjectD')}
+        db_session.add_all(projects.values())
+        db_session.commit()
+        db_session.add_all([
+            Order(customer_name='C', project_name='ProjectA', sales_amount=1000, order_date=date(2023, 1, 5)),
+            Order(customer_name='C', project_name='ProjectA', sales_amount=1000, order_date=date(2023, 1, 20)),
+            Order(customer_name='C', project_name='ProjectB', sales_amount=5000, order_date=date(2023, 1, 10)),
+            Order(customer_name='C', project_name='ProjectC', sales_amount=400, order_date=date(2023, 1, 10)),
+            Order(customer_name='C', project_name='ProjectD', sales_amount=0, order_date=date(2023, 1, 10)),
+            # 期間外の受注は集計対象外
+            Order(customer_name='C', project_name='ProjectC', sales_amount=90000, order_date=date(2023, 3, 1)),
+            ProjectCost(project=projects['ProjectA'], cost_month=date(2023, 1, 1), employee_cost=500, bp_cost=100),
+            ProjectCost(project=projects['ProjectB'], cost_month=date(2023, 1, 1), employee_cost=4000, bp_cost=500),
+            ProjectCost(project=projects['ProjectD'], cost_month=date(2023, 1, 1), employee_cost=50, bp_cost=0),
+        ])
+        db_session.commit()
+
+    def test_top_by_profit(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        response = client.get('/api/profit-ranking?start_date=2023-01-01&end_date=2023-01-31&order_by=profit&limit=2')
+        assert response.status_code == 200
+        projects = response.get_json()['projects']
+        assert [p['project_name'] for p in projects] == ['ProjectA', 'ProjectB']
+        assert projects[0]['sales_amount'] == 2000
+        assert projects[0]['total_cost'] == 600
+        assert projects[0]['profit'] == 1400
+        assert projects[0]['profit_rate'] == 70.0
+
+    def test_bottom_by_profit(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        response = client.get('/api/profit-ranking?start_date=2023-01-01&end_date=2023-01-31&direction=bottom&limit=1')
+        assert response.status_code == 200
+        projects = response.get_json()['projects']
+        assert [p['project_name'] for p in projects] == ['ProjectD']
+        assert projects[0]['profit'] == -50
+        assert projects[0]['profit_rate'] is None
+
+    def test_bottom_includes_projects_with_costs_only(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        project = Project(name='ProjectE')
+        db_session.add(project)
+        db_session.commit()
+        db_session.add(ProjectCost(project=project, cost_month=date(2023, 1, 1), employee_cost=5000, bp_cost=0))
+        db_session.commit()
+
+        response = client.get('/api/profit-ranking?start_date=2023-01-01&end_date=2023-01-31&direction=bottom&limit=1')
+        assert response.status_code == 200
+        projects = response.get_json()['projects']
+        # 売上のない赤字案件も最下位に含める
+        assert [p['project_name'] for p in projects] == ['ProjectE']
+        assert projects[0]['sales_amount'] == 0
+        assert projects[0]['profit'] == -5000
+        assert projects[0]['profit_rate'] is None
+
+    def test_top_by_margin_puts_zero_sales_last(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        response = client.get('/api/profit-ranking?start_date=2023-01-01&end_date=2023-01-31&order_by=margin&direction=bottom')
+        assert response.status_code == 200
+        names = [p['project_name'] for p in response.get_json()['projects']]
+        # ProjectB: 10%, ProjectA: 70%, ProjectC: 原価未登録で100%
+        assert names == ['ProjectB', 'ProjectA', 'ProjectC', 'ProjectD']
+
+    def test_invalid_order_by(self, client, authenticated_user):
+        response = client.get('/api/profit-ranking?start_date=2023-01-01&end_date=2023-01-31&order_by=sales')
+        assert response.status_code == 400
+
+    def test_invalid_date_format(self, client, authenticated_user):
+        response = client.get('/api/profit-ranking?start_date=2023-01-01&end_date=invalid')
+        assert response.status_code == 400
+
+    def test_database_error(self, client, authenticated_user, monkeypatch, app):
+        def mock_query_method(*args, **kwargs):
+            raise Exception("Simulated database error")
+
+        monkeypatch.setattr(app.extensions['sqlalchemy'].session, 'query', mock_query_method)
+
+        response = client.get('/api/profit-ranking?start_date=2023-01-01&end_date=2023-01-31')
+        assert response.status_code == 500
+        assert 'error' in response.get_json()
@@ -0,0 +1,109 @@
+import pytest
+from datetime import date
+from bs4 import BeautifulSoup
+from events import OrderEventBroker, get_broker
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestOrderEventBroker:
+
+    def test_publish_reaches_all_subscribers(self):
+        broker = OrderEventBroker(queue_size=10)
+        first = broker.subscribe()
+        second = broker.subscribe()
+
+        broker.publish({'type': 'delete', 'id': 1})
+        assert first.get(timeout=0) == {'type': 'delete', 'id': 1}
+        assert second.get(timeout=0) == {'type': 'delete', 'id': 1}
+
+    def test_unsubscribed_client_receives_nothing(self):
+        broker = OrderEventBroker(queue_size=10)
+        subscription = broker.subscribe()
+        broker.unsubscribe(subscription)
+
+        broker.publish({'type': 'delete', 'id': 1})
+        assert subscription.get(timeout=0) is None
+        assert broker.subscriber_count == 0
+
+    def test_full_queue_is_replaced_by_resync(self):
+        broker = OrderEventBroker(queue_size=2)
+        subscription = broker.subscribe()
+        for order_id in range(3):
+            broker.publish({'type': 'delete', 'id': order_id})
+
+        assert subscription.get(timeout=0) == OrderEventBroker.RESYNC_EVENT
+        assert subscription.get(timeout=0) is None
+
+    def test_subscribers_are_capped(self):
+        broker = OrderEventBroker(queue_size=10, max_subscribers=1)
+        subscription = broker.subscribe()
+        assert broker.subscribe() is None
+
+        broker.unsubscribe(subscription)
+        assert broker.subscribe() is not None
+
+class TestApiOrderStream:
+
+    def _get_csrf_token(self, client):
+        """Helper to get CSRF token from the orders page."""
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        csrf_token = soup.find('input', {'name': 'csrf_token'})
+        if csrf_token:
+            return csrf_token.get('value')
+        return None
+
+    def test_stream_sends_published_events(self, client, authenticated_user, app):
+        response = client.get('/api/orders/stream', buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+
+        chunks = iter(response.response)
+        assert next(chunks).decode('utf-8').startswith('retry:')
+
+        get_broker(app).publish({'type': 'delete', 'id': 42})
+        chunk = next(chunks).decode('utf-8')
+        assert chunk.startswith('event: order\n')
+        assert '"id":42' in chunk
+        response.close()
+        assert get_broker(app).subscriber_count == 0
+
+    def test_poll_mode_returns_no_content(self, client, authenticated_user, app, monkeypatch):
+        monkeypatch.setitem(app.config, 'ORDER_EVENTS_MODE', 'poll')
+        response = client.get('/api/orders/stream')
+        assert response.status_code == 204
+
+    def test_stream_over_subscriber_cap_returns_no_content(self, client, authenticated_user, app, monkeypatch):
+        monkeypatch.setattr(get_broker(app), 'max_subscribers', 1)
+        subscription = get_broker(app).subscribe()
+        response = client.get('/api/orders/stream')
+        assert response.status_code == 204
+        assert get_broker(app).subscriber_count == 1
+        get_broker(app).unsubscribe(subscription)
+
+    def test_order_mutations_publish_events(self, client, authenticated_user, app):
+        subscription = get_broker(app).subscribe()
+        csrf_token = self._get_csrf_token(client)
+
+        response = client.post('/api/orders', data={
+            'customer_name': 'Customer',
+            'project_name': 'Project',
+            'order_date': str(date.today()),
+            'csrf_token': csrf_token
+        })
+        assert response.status_code == 201
+        order_id = response.get_json()['order']['id']
+        event = subscription.get(timeout=0)
+        assert event['type'] == 'create'
+        assert event['order']['project_name'] == 'Project'
+
+        response = client.delete(f'/api/orders/{order_id}', headers={'X-CSRFToken': csrf_token})
+        assert response.status_code == 200
+        assert subscription.get(timeout=0) == {'type': 'delete', 'id': order_id}
+
+    def test_authentication_required(self, client):
+        response = client.get('/api/orders/stream')
+        assert response.status_code == 401
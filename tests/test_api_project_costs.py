@@ -0,0 +1,80 @@
+import pytest
+from datetime import date
+from bs4 import BeautifulSoup
+from models import Project, ProjectCost
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestApiProjectCosts:
+
+    def _get_csrf_token(self, client):
+        """Helper to get CSRF token from the orders page."""
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        csrf_token = soup.find('input', {'name': 'csrf_token'})
+        if csrf_token:
+            return csrf_token.get('value')
+        return None
+
+    def test_save_project_cost_creates_row(self, client, authenticated_user, db_session):
+        response = client.put('/api/project-costs', headers={'X-CSRFToken': self._get_csrf_token(client)}, data={
+            'project_name': 'ProjectX',
+            'cost_month': '2023-01',
+            'employee_cost': '300,000',
+            'bp_cost': '100000'
+        })
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['cost']['cost_month'] == '2023-01'
+        assert data['cost']['employee_cost'] == 300000
+        assert db_session.query(ProjectCost).count() == 1
+
+    def test_save_project_cost_updates_same_month(self, client, authenticated_user, db_session):
+        for employee_cost in ('100', '200'):
+            response = client.put('/api/project-costs', headers={'X-CSRFToken': self._get_csrf_token(client)}, data={
+                'project_name': 'ProjectX',
+                'cost_month': '2023-01',
+                'employee_cost': employee_cost,
+                'bp_cost': '0'
+            })
+            assert response.status_code == 200
+
+        costs = db_session.query(ProjectCost).all()
+        assert len(costs) == 1
+        assert costs[0].employee_cost == 200
+
+    def test_save_project_cost_validation_error(self, client, authenticated_user):
+        response = client.put('/api/project-costs', headers={'X-CSRFToken': self._get_csrf_token(client)}, data={'cost_month': '2023-01'})
+        assert response.status_code == 400
+        data = response.get_json()
+        assert data['error'] == 'バリデーションエラー'
+        assert 'project_name' in data['errors']
+
+    def test_get_project_costs_in_period(self, client, authenticated_user, db_session):
+        project_x = Project(name='ProjectX')
+        project_y = Project(name='ProjectY')
+        db_session.add_all([
+            ProjectCost(project=project_x, cost_month=date(2023, 1, 1), employee_cost=100, bp_cost=10),
+            ProjectCost(project=project_x, cost_month=date(2023, 2, 1), employee_cost=200, bp_cost=20),
+            ProjectCost(project=project_x, cost_month=date(2023, 4, 1), employee_cost=400, bp_cost=40),
+            ProjectCost(project=project_y, cost_month=date(2023, 1, 1), employee_cost=999, bp_cost=99),
+        ])
+        db_session.commit()
+
+        response = client.get('/api/project-costs?project_name=ProjectX&start_date=2023-01-15&end_date=2023-03-31')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [cost['cost_month'] for cost in data['costs']] == ['2023-01', '2023-02']
+        assert data['total_employee_cost'] == 300
+        assert data['total_bp_cost'] == 30
+
+    def test_get_project_costs_invalid_date(self, client, authenticated_user):
+        response = client.get('/api/project-costs?project_name=ProjectX&start_date=bad&end_date=2023-03-31')
+        assert response.status_code == 400
+
+    def test_project_costs_authentication_required(self, client):
+        response = client.get('/api/project-costs?project_name=ProjectX&start_date=2023-01-01&end_date=2023-01-31')
+        assert response.status_code == 401
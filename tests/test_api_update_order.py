@@ -5,6 +5,8 @@ from datetime import date
 from bs4 import BeautifulSoup
 import logging
 import routes
+from sqlalchemy import event
+from app import db
 
 @pytest.fixture
 def client(app):
@@ -178,4 +180,110 @@ class TestApiUpdateOrder:
             data={},
             content_type='application/x-www-form-urlencoded'
         )
-        assert response.status_code == 401
\ No newline at end of file
+        assert response.status_code == 401
+
+    def _valid_form_data(self, csrf_token):
+        return {
+            'customer_name': 'New Customer',
+            'project_name': 'New Project',
+            'sales_amount': '2000',
+            'order_amount': '2000',
+            'invoiced_amount': '1000',
+            'order_date': str(date.today()),
+            'work_in_progress': 'y',
+            'csrf_token': csrf_token
+        }
+
+    def test_update_issues_single_statement(self, client, authenticated_user, db_session, app):
+        order = Order(customer_name='Old Customer', project_name='Old Project', order_date=date.today())
+        db_session.add(order)
+        db_session.commit()
+        order_id = order.id
+        csrf_token = self._get_csrf_token(client)
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'orders' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.put(f'/api/orders/{order_id}', data=self._valid_form_data(csrf_token))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert response.status_code == 200
+        assert len(statements) == 1
+        assert statements[0].startswith('UPDATE orders')
+        assert response.get_json()['order']['customer_name'] == 'New Customer'
+
+    def test_update_non_existent_order(self, client, authenticated_user):
+        csrf_token = self._get_csrf_token(client)
+        response = client.put('/api/orders/9999', data=self._valid_form_data(csrf_token))
+        assert response.status_code == 404
+        assert 'error' in response.get_json()
+
+    def test_update_without_returning_support(self, client, authenticated_user, db_session, monkeypatch):
+        order = Order(customer_name='Old Customer', project_name='Old Project', order_date=date.today())
+        db_session.add(order)
+        db_session.commit()
+        order_id = order.id
+        csrf_token = self._get_csrf_token(client)
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if 'orders' in statement:
+                statements.append(statement)
+
+        monkeypatch.setattr(db.engine.dialect, 'update_returning', False)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.put(f'/api/orders/{order_id}', data=self._valid_form_data(csrf_token))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert response.status_code == 200
+        # 更新後の行は読み直さない
+        assert len(statements) == 1
+        assert statements[0].startswith('UPDATE orders')
+        data = response.get_json()['order']
+        assert data['project_name'] == 'New Project'
+        assert data['sales_amount'] == 2000
+        assert 'created_at' not in data
+
+        db_session.expire_all()
+        saved = db_session.get(Order, order_id).to_dict()
+        assert data == {field: value for field, value in saved.items() if field != 'created_at'}
+
+    def test_update_writes_only_changed_fields(self, client, authenticated_user, db_session):
+        order = Order(customer_name='Old Customer', project_name='Old Project', order_date=date.today(),
+                      description='Keep me')
+        db_session.add(order)
+        db_session.commit()
+        order_id = order.id
+        csrf_token = self._get_csrf_token(client)
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE orders'):
+                statements.append(statement)
+
+        form_data = dict(self._valid_form_data(csrf_token), changed_fields='sales_amount')
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.put(f'/api/orders/{order_id}', data=form_data)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert response.status_code == 200
+        set_clause = statements[0].split(' WHERE ')[0]
+        assert 'sales_amount' in set_clause
+        assert 'updated_at' in set_clause
+        assert 'customer_name' not in set_clause
+        assert 'description' not in set_clause
+
+        db_session.expire_all()
+        saved = db_session.get(Order, order_id)
+        assert saved.sales_amount == 2000
+        assert saved.customer_name == 'Old Customer'
+        assert saved.description == 'Keep me'
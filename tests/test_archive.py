@@ -0,0 +1,113 @@
+import pytest
+from datetime import date
+from app import db
+from models import Order, OrderArchive, OrderMonthlyRollup, OrderTombstone, Project
+from archive import add_months, archive_orders, covered_months, hot_cutoff
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestArchive:
+
+    def _create_order(self, db_session, project_name, order_date, sales_amount):
+        order = Order(
+            customer_name='Customer A',
+            project_name=project_name,
+            sales_amount=sales_amount,
+            order_amount=sales_amount - 100,
+            invoiced_amount=sales_amount - 200,
+            order_date=order_date
+        )
+        db_session.add(order)
+        db_session.commit()
+        return order.id
+
+    def _seed(self, db_session):
+        self._create_order(db_session, 'Project A', date(2022, 1, 10), 1000)
+        self._create_order(db_session, 'Project A', date(2022, 1, 25), 2000)
+        self._create_order(db_session, 'Project B', date(2022, 2, 5), 3000)
+        self._create_order(db_session, 'Project A', date(2022, 3, 20), 4000)
+        self._create_order(db_session, 'Project A', date(2024, 5, 1), 5000)
+
+    def _profit(self, client, project_name, start_date, end_date):
+        response = client.get(f'/api/profit-data?project_name={project_name}&start_date={start_date}&end_date={end_date}')
+        assert response.status_code == 200
+        return response.get_json()
+
+    def test_month_helpers(self):
+        assert add_months(date(2024, 1, 1), -2) == date(2023, 11, 1)
+        assert hot_cutoff(today=date(2024, 5, 17), hot_months=24) == date(2022, 5, 1)
+        assert covered_months(date(2022, 1, 15), date(2022, 3, 31)) == (date(2022, 2, 1), date(2022, 4, 1))
+        assert covered_months(date(2022, 1, 1), date(2022, 1, 30)) is None
+
+    def test_archive_moves_orders_and_builds_rollups(self, app, db_session):
+        self._seed(db_session)
+
+        assert archive_orders(db.engine, date(2022, 4, 1), batch_size=2) == 4
+        db_session.expire_all()
+
+        assert [order.order_date for order in db_session.query(Order)] == [date(2024, 5, 1)]
+        assert db_session.query(OrderArchive).count() == 4
+        assert db_session.query(OrderTombstone).count() == 4
+
+        project_a = db_session.query(Project).filter_by(name='Project A').one()
+        january = db_session.query(OrderMonthlyRollup)\
+            .filter_by(project_id=project_a.id, month=date(2022, 1, 1)).one()
+        assert january.order_count == 2
+        assert float(january.sales_amount) == 3000
+        assert db_session.query(OrderMonthlyRollup).count() == 3
+
+    def test_late_order_rebuilds_rollup(self, app, db_session):
+        self._seed(db_session)
+        archive_orders(db.engine, date(2022, 4, 1))
+
+        self._create_order(db_session, 'Project A', date(2022, 1, 3), 500)
+        assert archive_orders(db.engine, date(2022, 4, 1)) == 1
+        db_session.expire_all()
+
+        january = db_session.query(OrderMonthlyRollup).filter_by(month=date(2022, 1, 1)).one()
+        assert january.order_count == 3
+        assert float(january.sales_amount) == 3500
+
+    @pytest.mark.parametrize('project_name, start_date, end_date', [
+        ('all', '2022-01-01', '2024-12-31'),
+        ('all', '2022-01-15', '2022-03-10'),
+        ('Project A', '2022-01-01', '2022-02-28'),
+        ('Project A', '2022-01-20', '2024-05-31'),
+        ('Project B', '2022-02-01', '2022-02-28'),
+    ])
+    def test_profit_data_is_unchanged_by_archiving(self, client, authenticated_user, db_session,
+                                                  project_name, start_date, end_date):
+        self._seed(db_session)
+        before = self._profit(client, project_name, start_date, end_date)
+
+        archive_orders(db.engine, date(2022, 4, 1))
+        db_session.expire_all()
+
+        assert self._profit(client, project_name, start_date, end_date) == before
+
+    def test_orders_list_is_hot_only_by_default(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        archive_orders(db.engine, date(2022, 4, 1))
+        db_session.expire_all()
+
+        response = client.get('/api/orders')
+        assert response.status_code == 200
+        assert response.get_json()['total'] == 1
+
+        response = client.get('/api/orders?archived=true&project_name=Project A')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['total'] == 3
+        assert {order['order_date'] for order in data['orders']} == {'2022-01-10', '2022-01-25', '2022-03-20'}
+
+    def test_projects_include_archived_projects(self, client, authenticated_user, db_session):
+        self._seed(db_session)
+        archive_orders(db.engine, date(2022, 4, 1))
+        db_session.expire_all()
+
+        response = client.get('/api/projects')
+        assert response.status_code == 200
+        assert response.get_json()['projects'] == ['Project A', 'Project B']
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import pytest
+from datetime import date
+from bs4 import BeautifulSoup
+from app import create_app, db
+from models import User, Order
+
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+from asgi import AsyncReadApi, async_database_uri, create_asgi_app
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    # 非同期エンジンと同じデータを参照できるよう、ファイルのSQLiteを使う
+    flask_app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'orders.db'}",
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SESSION_COOKIE_SECURE": False
+    })
+    flask_app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com', is_active=True)
+        user.set_password('password')
+        db.session.add(user)
+        for index, project_name in enumerate(['Project A', 'Project B', 'Project A']):
+            db.session.add(Order(
+                customer_name='Customer A',
+                project_name=project_name,
+                sales_amount=1000 * (index + 1),
+                order_amount=900,
+                invoiced_amount=800,
+                order_date=date(2024, 1, 10 + index)
+            ))
+        db.session.commit()
+        db.session.remove()
+
+    yield flask_app
+
+    with flask_app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def session_cookie(file_app):
+    client = file_app.test_client()
+    response = client.get('/login')
+    csrf_token = BeautifulSoup(response.data, 'html.parser').find('input', {'name': 'csrf_token'}).get('value')
+    client.post('/login', data={'username': 'testuser', 'password': 'password', 'csrf_token': csrf_token})
+    return client, client.get_cookie(file_app.config['SESSION_COOKIE_NAME']).value
+
+def _call(asgi_app, path, query_string='', cookie=None, method='GET'):
+    """ASGIアプリへ1リクエスト送り、(ステータス, 本文) を返す"""
+    messages = []
+    headers = [(b'cookie', f'session={cookie}'.encode())] if cookie else []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await asgi_app({
+            'type': 'http', 'http_version': '1.1', 'scheme': 'http', 'method': method,
+            'path': path, 'root_path': '', 'query_string': query_string.encode(), 'headers': headers,
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 50000)
+        }, receive, send)
+        await asgi_app.dispose()
+
+    asyncio.run(run())
+    body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return messages[0]['status'], body
+
+class TestAsyncReadApi:
+
+    def test_async_database_uri(self):
+        assert async_database_uri('mysql+pymysql://u:p@host:4000/db').drivername == 'mysql+aiomysql'
+        assert async_database_uri('sqlite:///orders.db').drivername == 'sqlite+aiosqlite'
+
+    @pytest.mark.parametrize('path, query_string', [
+        ('/api/orders', ''),
+        ('/api/orders', 'project_name=Project A&per_page=1&page=2'),
+        ('/api/orders', 'fields=project_name,sales_amount&format=compact'),
+        ('/api/projects', ''),
+        ('/api/profit-data', 'project_name=Project A&start_date=2024-01-01&end_date=2024-01-31'),
+        ('/api/profit-data', 'project_name=all&start_date=2024-01-01&end_date=2024-01-31'),
+        ('/api/profit-data', 'project_name=Unknown&start_date=2024-01-01&end_date=2024-01-31'),
+    ])
+    def test_matches_sync_api(self, file_app, session_cookie, path, query_string):
+        client, cookie = session_cookie
+        expected = client.get(f'{path}?{query_string}')
+        assert expected.status_code == 200
+
+        status, body = _call(AsyncReadApi(file_app), path, query_string, cookie)
+
+        assert status == 200
+        assert json.loads(body) == expected.get_json()
+
+    def test_requires_login(self, file_app):
+        status, body = _call(AsyncReadApi(file_app), '/api/orders')
+        assert status == 401
+
+    def test_rejects_tampered_cookie(self, file_app, session_cookie):
+        _, cookie = session_cookie
+        status, _ = _call(AsyncReadApi(file_app), '/api/orders', cookie=cookie[:-2] + 'xx')
+        assert status == 401
+
+    def test_invalid_date_format(self, file_app, session_cookie):
+        _, cookie = session_cookie
+        status, _ = _call(AsyncReadApi(file_app), '/api/profit-data',
+                          'project_name=all&start_date=2024/01/01&end_date=2024-01-31', cookie)
+        assert status == 400
+
+    def test_other_requests_fall_through_to_flask(self, file_app, session_cookie):
+        _, cookie = session_cookie
+        status, body = _call(create_asgi_app(file_app), '/health', cookie=cookie)
+        assert status == 200
+        assert b'healthy' in body
@@ -0,0 +1,87 @@
+import gzip
+import os
+import shutil
+import brotli
+import pytest
+from flask import url_for
+from assets import build_assets, load_manifest, IMMUTABLE_MAX_AGE
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def built_app(app, tmp_path):
+    # 作業ツリーの static/dist を汚さないよう、静的ファイルの複製でビルドする
+    static_folder = tmp_path / 'static'
+    shutil.copytree(app.static_folder, static_folder, ignore=shutil.ignore_patterns('dist'))
+    original_folder = app.static_folder
+    app.static_folder = str(static_folder)
+    build_assets(app.static_folder)
+    load_manifest(app)
+    yield app
+    app.static_folder = original_folder
+    load_manifest(app)
+
+class TestAssets:
+
+    def test_manifest_maps_sources_to_hashed_names(self, built_app):
+        manifest = built_app.extensions['asset_manifest']
+        assert set(manifest) >= {'css/style.css', 'js/orders.js', 'js/profit.js'}
+        hashed = manifest['js/orders.js']
+        assert hashed.startswith('dist/js/orders.') and hashed.endswith('.js')
+        assert os.path.exists(os.path.join(built_app.static_folder, hashed + '.gz'))
+        assert os.path.exists(os.path.join(built_app.static_folder, hashed + '.br'))
+
+    def test_hash_changes_with_content(self, built_app):
+        before = built_app.extensions['asset_manifest']['css/style.css']
+        with open(os.path.join(built_app.static_folder, 'css', 'style.css'), 'a') as f:
+            f.write('\n/* changed */\n')
+        after = build_assets(built_app.static_folder)['css/style.css']
+        assert after != before
+        assert not os.path.exists(os.path.join(built_app.static_folder, before))
+
+    def test_url_for_emits_hashed_path(self, built_app):
+        with built_app.test_request_context():
+            assert url_for('static', filename='js/profit.js') == \
+                '/static/' + built_app.extensions['asset_manifest']['js/profit.js']
+            assert url_for('static', filename='favicon.ico') == '/static/favicon.ico'
+
+    def test_templates_reference_hashed_assets(self, built_app, client, authenticated_user):
+        response = client.get('/orders')
+        html = response.data.decode('utf-8')
+        assert built_app.extensions['asset_manifest']['js/orders.js'] in html
+        assert built_app.extensions['asset_manifest']['css/style.css'] in html
+
+    def test_hashed_asset_is_immutable_and_precompressed(self, built_app, client):
+        hashed = built_app.extensions['asset_manifest']['js/orders.js']
+        with open(os.path.join(built_app.static_folder, 'js', 'orders.js'), 'rb') as f:
+            original = f.read()
+
+        response = client.get(f'/static/{hashed}', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'br'
+        assert response.mimetype in ('text/javascript', 'application/javascript')
+        assert brotli.decompress(response.data) == original
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == IMMUTABLE_MAX_AGE
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+        response = client.get(f'/static/{hashed}', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == original
+
+        response = client.get(f'/static/{hashed}')
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == original
+
+    def test_unhashed_asset_is_served_as_before(self, built_app, client):
+        response = client.get('/static/css/style.css', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
+        assert not response.cache_control.immutable
+
+    def test_without_manifest_paths_are_unchanged(self, app):
+        with app.test_request_context():
+            assert url_for('static', filename='js/orders.js') == '/static/js/orders.js'
@@ -0,0 +1,141 @@
+import json
+from datetime import date, datetime
+
+import pytest
+from bs4 import BeautifulSoup
+
+from app import db
+from audit import AuditLog, get_audit_log
+from metrics import MetricsRegistry
+from models import Order, OrderChange
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestAuditLog:
+
+    def _get_csrf_token(self, client):
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        return soup.find('input', {'name': 'csrf_token'}).get('value')
+
+    def _order_form(self, client, **values):
+        data = {
+            'customer_name': 'Audit Customer',
+            'project_name': 'Audit Project',
+            'sales_amount': '1000',
+            'order_amount': '1000',
+            'invoiced_amount': '0',
+            'order_date': str(date.today()),
+            'contract_type': 'Type A',
+            'sales_stage': 'Stage 1',
+            'billing_month': str(date.today()),
+            'work_in_progress': 'n',
+            'description': 'audit',
+            'csrf_token': self._get_csrf_token(client)
+        }
+        data.update(values)
+        return data
+
+    def _changes(self, db_session):
+        return db_session.query(OrderChange).order_by(OrderChange.id).all()
+
+    def test_api_mutations_are_recorded(self, client, authenticated_user, db_session):
+        response = client.post('/api/orders', data=self._order_form(client))
+        assert response.status_code == 201
+        order_id = response.get_json()['order']['id']
+
+        response = client.put(f'/api/orders/{order_id}', data=self._order_form(client, sales_amount='2500'))
+        assert response.status_code == 200
+
+        response = client.delete(f'/api/orders/{order_id}', headers={'X-CSRFToken': self._get_csrf_token(client)})
+        assert response.status_code == 200
+
+        changes = self._changes(db_session)
+        assert [change.action for change in changes] == ['create', 'update', 'delete']
+        assert all(change.order_id == order_id for change in changes)
+        assert all(change.user_id == authenticated_user.id for change in changes)
+
+        created = json.loads(changes[0].changes)
+        assert created['project_name'] == [None, 'Audit Project']
+        # UPDATE 文でも変更された列だけを、直前の履歴の値を変更前として記録する
+        updated = json.loads(changes[1].changes)
+        assert updated['sales_amount'] == [created['sales_amount'][1], 2500]
+        assert 'project_name' not in updated
+        assert 'customer_name' not in updated
+
+    def test_rolled_back_update_is_not_recorded(self, client, authenticated_user, db_session):
+        response = client.put('/api/orders/9999', data=self._order_form(client))
+        assert response.status_code == 404
+        assert self._changes(db_session) == []
+
+    def test_orm_update_records_old_and_new_values(self, app, db_session):
+        order = Order(customer_name='Before', project_name='Audit Project', order_date=date.today())
+        db_session.add(order)
+        db_session.commit()
+
+        assert order.customer_name == 'Before'  # 読み込み済みの値が変更前の値になる
+        order.customer_name = 'After'
+        db_session.commit()
+
+        changes = self._changes(db_session)
+        assert [change.action for change in changes] == ['create', 'update']
+        assert changes[0].user_id is None
+        updated = json.loads(changes[1].changes)
+        assert updated['customer_name'] == ['Before', 'After']
+        assert 'project_name' not in updated
+
+    def test_statement_updates_in_one_batch_are_chained(self, app, db_session):
+        audit_log = AuditLog(db.engine, MetricsRegistry(), background=False)
+
+        def entry(action, changes, **extra):
+            return {'order_id': 1, 'action': action, 'user_id': None, 'changed_at': datetime.utcnow(),
+                    'changes': json.dumps(changes), **extra}
+
+        audit_log.enqueue([entry('create', {'customer_name': [None, 'A'], 'sales_amount': [None, 100]})])
+        audit_log.enqueue([
+            entry('update', {'customer_name': [None, 'B'], 'sales_amount': [None, 100]}, resolve_previous=True),
+            entry('update', {'customer_name': [None, 'C'], 'description': [None, 'x']}, resolve_previous=True),
+        ])
+
+        changes = [json.loads(change.changes) for change in self._changes(db_session)]
+        assert changes[1] == {'customer_name': ['A', 'B']}
+        assert changes[2] == {'customer_name': ['B', 'C'], 'description': [None, 'x']}
+
+    def test_background_writer_batches_entries(self, app, db_session):
+        metrics = MetricsRegistry()
+        audit_log = AuditLog(db.engine, metrics, batch_size=2, flush_interval=0.05)
+        entries = [
+            {'order_id': i, 'action': 'update', 'user_id': None, 'changes': '{}', 'changed_at': datetime.utcnow()}
+            for i in range(5)
+        ]
+        audit_log.enqueue(entries)
+        audit_log.close()
+
+        assert audit_log.pending == 0
+        assert sorted(change.order_id for change in self._changes(db_session)) == list(range(5))
+        assert metrics.get('audit.written') == 5
+
+    def test_full_queue_writes_synchronously(self, app, db_session):
+        metrics = MetricsRegistry()
+        audit_log = AuditLog(db.engine, metrics, queue_size=1, flush_interval=60)
+        audit_log._ensure_thread = lambda: None  # 書き込みスレッドを起動せず、キューを満杯にする
+        entries = [
+            {'order_id': i, 'action': 'update', 'user_id': None, 'changes': '{}', 'changed_at': datetime.utcnow()}
+            for i in range(3)
+        ]
+        audit_log.enqueue(entries)
+
+        assert metrics.get('audit.overflow') == 2
+        assert audit_log.pending == 1
+        assert len(self._changes(db_session)) == 2
+
+        audit_log.flush()
+        assert len(self._changes(db_session)) == 3
+
+    def test_audit_log_is_registered(self, app):
+        assert isinstance(get_audit_log(app), AuditLog)
+        assert get_audit_log(app).background is False
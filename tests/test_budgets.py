@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from budgets import QueryBudget, QueryBudgetExceeded, budget_for, with_max_execution_time, within_budget
+from cache import app_single_flight, data_version
+from metrics import get_metrics
+
+# 終わらない再帰クエリ（プログレスハンドラーで中断させる）
+ENDLESS_QUERY = text(
+    'WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) SELECT count(*) FROM counter'
+)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestQueryBudget:
+
+    def test_max_execution_time_hint(self):
+        assert with_max_execution_time('SELECT orders.id FROM orders', 250) == \
+            'SELECT /*+ MAX_EXECUTION_TIME(250) */ orders.id FROM orders'
+        assert with_max_execution_time('\n  select 1', 10) == '\n  select /*+ MAX_EXECUTION_TIME(10) */ 1'
+        assert with_max_execution_time('UPDATE orders SET id = 1', 250) == 'UPDATE orders SET id = 1'
+
+    def test_budget_configuration(self, app):
+        with app.test_request_context():
+            assert budget_for('main.api_get_orders') == {
+                'timeout_ms': app.config['QUERY_TIMEOUT_MS'],
+                'max_statements': app.config['QUERY_MAX_STATEMENTS']
+            }
+            # @query_budget の値をさらに QUERY_BUDGETS で上書きできる
+            assert budget_for('main.api_get_profit_data')['timeout_ms'] == 8000
+            app.config['QUERY_BUDGETS'] = {'main.api_get_profit_data': {'timeout_ms': 0}}
+            assert budget_for('main.api_get_profit_data')['timeout_ms'] == 0
+
+    def test_sqlite_query_is_interrupted_at_deadline(self, app):
+        with app.test_request_context('/api/orders'):
+            g.query_budget = budget = QueryBudget(timeout_ms=50)
+            with pytest.raises(OperationalError, match='interrupted'):
+                db.session.execute(ENDLESS_QUERY)
+            db.session.rollback()
+            assert budget.exceeded == 'timeout'
+
+            # 予算のない実行ではプログレスハンドラーを残さない
+            g.query_budget = None
+            assert db.session.execute(text('SELECT 1')).scalar() == 1
+
+    def test_statement_cap_returns_503(self, client, authenticated_user, app):
+        app.config['QUERY_BUDGETS'] = {'main.api_get_orders': {'max_statements': 1}}
+        response = client.get('/api/orders')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(app.config['QUERY_BUDGET_RETRY_AFTER'])
+        assert response.get_json()['error']['code'] == 503
+        assert get_metrics(app).get('query_budget.statements') == 1
+
+        # 他のエンドポイントと次のリクエストには影響しない
+        app.config['QUERY_BUDGETS'] = {}
+        assert client.get('/api/orders').status_code == 200
+
+    def test_expired_budget_returns_503_page(self, client, authenticated_user, app):
+        app.config['QUERY_BUDGETS'] = {'main.orders': {'timeout_ms': 0.001}}
+        response = client.get('/orders')
+        assert response.status_code == 503
+        assert 'Retry-After' in response.headers
+        assert b'503' in response.data
+        assert get_metrics(app).get('query_budget.timeout') == 1
+
+    def test_requests_within_budget_are_unaffected(self, client, authenticated_user, app):
+        response = client.get('/api/orders')
+        assert response.status_code == 200
+        assert 'Retry-After' not in response.headers
+
+    def test_single_flight_waiters_share_exceeded_budget(self, client, authenticated_user, app):
+        release = threading.Event()
+        errors = []
+
+        def leader():
+            # 同じ条件の集計を実行中の先頭のリクエストが、DB側で中断されて予算を超える
+            with app.test_request_context():
+                g.query_budget = QueryBudget(8000, 100)
+
+                def interrupted():
+                    release.wait(5)
+                    g.query_budget.exceeded = 'timeout'
+                    raise OperationalError('SELECT', {}, sqlite3.OperationalError('interrupted'))
+
+                key = (data_version(), False, 'all', date(2024, 1, 1), date(2024, 1, 31))
+                try:
+                    app_single_flight('profit_data').do(key, within_budget(interrupted))
+                except QueryBudgetExceeded as e:
+                    errors.append(e)
+
+        def release_when_joined():
+            while get_metrics(app).get('singleflight.profit_data.shared') == 0:
+                time.sleep(0.001)
+            release.set()
+
+        threads = [threading.Thread(target=leader), threading.Thread(target=release_when_joined)]
+        try:
+            threads[0].start()
+            while get_metrics(app).get('singleflight.profit_data.executions') == 0:
+                time.sleep(0.001)
+            threads[1].start()
+            # 結果を待っていたリクエストも 500 ではなく 503（Retry-After 付き）を返す
+            response = client.get('/api/profit-data?project_name=all&start_date=2024-01-01&end_date=2024-01-31')
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == str(app.config['QUERY_BUDGET_RETRY_AFTER'])
+            assert get_metrics(app).get('query_budget.timeout') == 1
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join(timeout=5)
+        assert [error.reason for error in errors] == ['timeout']
@@ -0,0 +1,64 @@
+import gzip
+import json
+import brotli
+import pytest
+from datetime import date
+from models import Order
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def many_orders(db_session):
+    for index in range(30):
+        db_session.add(Order(
+            customer_name=f'株式会社テスト顧客 {index}',
+            project_name='圧縮テスト案件',
+            description='受注の説明文' * 10,
+            order_date=date(2024, 1, 1 + index % 28)
+        ))
+    db_session.commit()
+
+class TestCompression:
+
+    def test_large_json_is_gzipped(self, client, authenticated_user, many_orders):
+        response = client.get('/api/orders', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        data = json.loads(gzip.decompress(response.data))
+        assert data['total'] == 30
+        assert int(response.headers['Content-Length']) == len(response.data)
+
+    def test_brotli_is_preferred(self, client, authenticated_user, many_orders):
+        response = client.get('/api/orders', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert json.loads(brotli.decompress(response.data))['total'] == 30
+
+    def test_refused_encoding_is_not_used(self, client, authenticated_user, many_orders):
+        response = client.get('/api/orders', headers={'Accept-Encoding': 'br;q=0, gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+
+    def test_uncompressed_without_accept_encoding(self, client, authenticated_user, many_orders):
+        response = client.get('/api/orders')
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_json()['total'] == 30
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    def test_small_json_is_not_compressed(self, client, authenticated_user):
+        response = client.get('/api/orders', headers={'Accept-Encoding': 'gzip, br'})
+        assert len(response.data) < 1024
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_json()['total'] == 0
+
+    def test_threshold_is_configurable(self, app, client, authenticated_user):
+        app.config['COMPRESS_MIN_SIZE'] = 1
+        response = client.get('/api/orders', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+
+    def test_html_is_not_compressed(self, client, authenticated_user, many_orders):
+        response = client.get('/orders', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,82 @@
+import pytest
+from datetime import date
+from bs4 import BeautifulSoup
+from sqlalchemy import event
+from app import db
+from models import Customer, Order, Project
+from dimensions import lookup_id
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+class TestDimensions:
+
+    def _get_csrf_token(self, client):
+        """Helper to get CSRF token from the orders page."""
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        csrf_token = soup.find('input', {'name': 'csrf_token'})
+        if csrf_token:
+            return csrf_token.get('value')
+        return None
+
+    def _order_data(self, csrf_token, customer_name, project_name):
+        return {
+            'customer_name': customer_name,
+            'project_name': project_name,
+            'order_date': str(date.today()),
+            'csrf_token': csrf_token
+        }
+
+    def test_create_order_resolves_dimension_keys(self, client, authenticated_user, db_session):
+        csrf_token = self._get_csrf_token(client)
+        for _ in range(2):
+            response = client.post('/api/orders', data=self._order_data(csrf_token, 'Customer A', 'Project A'))
+            assert response.status_code == 201
+
+        assert db_session.query(Customer).count() == 1
+        assert db_session.query(Project).count() == 1
+        project = db_session.query(Project).one()
+        assert {order.project_id for order in db_session.query(Order)} == {project.id}
+
+    def test_update_order_moves_to_new_project(self, client, authenticated_user, db_session):
+        order = Order(customer_name='Customer A', project_name='Project A', order_date=date.today())
+        db_session.add(order)
+        db_session.commit()
+        order_id = order.id
+
+        csrf_token = self._get_csrf_token(client)
+        response = client.put(f'/api/orders/{order_id}', data=self._order_data(csrf_token, 'Customer A', 'Project B'))
+        assert response.status_code == 200
+
+        db_session.expire_all()
+        project_b = db_session.query(Project).filter_by(name='Project B').one()
+        assert db_session.get(Order, order_id).project_id == project_b.id
+
+    def test_lookup_is_cached(self, app, db_session):
+        db_session.add(Project(name='Cached Project'))
+        db_session.commit()
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            first = lookup_id(db_session.connection(), Project, 'Cached Project')
+            second = lookup_id(db_session.connection(), Project, 'Cached Project')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert first == second
+        assert len(statements) == 1
+
+    def test_profit_data_for_unknown_project(self, client, authenticated_user, db_session):
+        db_session.add(Order(customer_name='Customer A', project_name='Project A', sales_amount=100, order_date=date(2023, 1, 1)))
+        db_session.commit()
+
+        response = client.get('/api/profit-data?project_name=Unknown&start_date=2023-01-01&end_date=2023-01-31')
+        assert response.status_code == 200
+        assert response.get_json()['total_sales_amount'] == 0
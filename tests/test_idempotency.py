@@ -0,0 +1,151 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from bs4 import BeautifulSoup
+from sqlalchemy import event
+
+import idempotency
+from app import db
+from idempotency import purge_expired
+from metrics import get_metrics
+from models import IdempotencyKey, Order
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestIdempotencyKey:
+
+    def _get_csrf_token(self, client):
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        return soup.find('input', {'name': 'csrf_token'}).get('value')
+
+    def _post(self, client, key, **values):
+        data = {
+            'customer_name': 'Idempotent Customer',
+            'project_name': 'Idempotent Project',
+            'sales_amount': '1000',
+            'order_amount': '1000',
+            'invoiced_amount': '0',
+            'order_date': str(date.today()),
+            'contract_type': 'Type A',
+            'sales_stage': 'Stage 1',
+            'billing_month': str(date.today()),
+            'work_in_progress': 'n',
+            'description': 'idempotency',
+            # 再送ごとにトークンを取り直しても同じリクエストとして扱う
+            'csrf_token': self._get_csrf_token(client)
+        }
+        data.update(values)
+        headers = {'Idempotency-Key': key} if key is not None else {}
+        return client.post('/api/orders', data=data, headers=headers)
+
+    def test_retry_replays_stored_response(self, client, authenticated_user, db_session, app):
+        first = self._post(client, 'key-1')
+        assert first.status_code == 201
+        assert 'Idempotent-Replayed' not in first.headers
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            second = self._post(client, 'key-1')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert second.status_code == 201
+        assert second.headers['Idempotent-Replayed'] == 'true'
+        assert second.get_json() == first.get_json()
+        assert db_session.query(Order).count() == 1
+        # 再送はキーの主キー検索のみ（検証や登録を行わない）
+        key_queries = [statement for statement in statements if 'idempotency_keys' in statement]
+        assert len(key_queries) == 1
+        assert not any(statement.lstrip().upper().startswith(('INSERT', 'UPDATE')) for statement in statements)
+        assert get_metrics(app).get('idempotency.replayed') == 1
+
+    def test_different_body_with_same_key_is_rejected(self, client, authenticated_user, db_session):
+        assert self._post(client, 'key-2').status_code == 201
+        response = self._post(client, 'key-2', sales_amount='2000')
+        assert response.status_code == 422
+        assert db_session.query(Order).count() == 1
+
+    def test_without_key_creates_each_time(self, client, authenticated_user, db_session):
+        assert self._post(client, None).status_code == 201
+        assert self._post(client, None).status_code == 201
+        assert db_session.query(Order).count() == 2
+        assert db_session.query(IdempotencyKey).count() == 0
+
+    def test_failed_request_can_be_retried_with_same_key(self, client, authenticated_user, db_session):
+        response = self._post(client, 'key-3', customer_name='')
+        assert response.status_code == 400
+        assert db_session.query(IdempotencyKey).count() == 0
+
+        response = self._post(client, 'key-3')
+        assert response.status_code == 201
+        assert db_session.query(Order).count() == 1
+
+    def test_in_progress_key_returns_conflict(self, client, authenticated_user, db_session):
+        db_session.add(IdempotencyKey(
+            user_id=authenticated_user.id, key='key-4', request_hash='x' * 32,
+            expires_at=datetime.utcnow() + timedelta(hours=1)
+        ))
+        db_session.commit()
+        response = self._post(client, 'key-4')
+        # 本文のハッシュが異なるため先に不一致を判定する
+        assert response.status_code == 422
+
+        record = db_session.get(IdempotencyKey, (authenticated_user.id, 'key-4'))
+        db_session.delete(record)
+        db_session.commit()
+        assert self._post(client, 'key-4').status_code == 201
+        record = db_session.get(IdempotencyKey, (authenticated_user.id, 'key-4'))
+        record.status_code = None
+        db_session.commit()
+        assert self._post(client, 'key-4').status_code == 409
+
+    def test_key_reserved_concurrently_returns_conflict(self, client, authenticated_user, db_session, monkeypatch):
+        reserve = idempotency._reserve
+
+        def reserved_by_other_request(record, fingerprint, expires_at):
+            # 同じキーの別のリクエストが先に登録をコミットした状態にする
+            other = IdempotencyKey(user_id=record.user_id, key=record.key, request_hash=fingerprint,
+                                   expires_at=expires_at)
+            db.session.add(other)
+            db.session.commit()
+            db.session.expunge(other)
+            monkeypatch.setattr(idempotency, '_reserve', reserve)
+            reserve(record, fingerprint, expires_at)
+
+        monkeypatch.setattr(idempotency, '_reserve', reserved_by_other_request)
+        response = self._post(client, 'key-6')
+        assert response.status_code == 409
+        assert db_session.query(Order).count() == 0
+
+    def test_expired_key_is_reused(self, client, authenticated_user, db_session):
+        assert self._post(client, 'key-5').status_code == 201
+        record = db_session.get(IdempotencyKey, (authenticated_user.id, 'key-5'))
+        record.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db_session.commit()
+
+        response = self._post(client, 'key-5')
+        assert response.status_code == 201
+        assert 'Idempotent-Replayed' not in response.headers
+        assert db_session.query(Order).count() == 2
+
+    def test_key_too_long_is_rejected(self, client, authenticated_user, db_session):
+        response = self._post(client, 'k' * 65)
+        assert response.status_code == 400
+        assert db_session.query(Order).count() == 0
+
+    def test_purge_expired(self, app, db_session):
+        now = datetime.utcnow()
+        db_session.add_all([
+            IdempotencyKey(user_id=1, key='old', request_hash='a' * 32, expires_at=now - timedelta(minutes=1)),
+            IdempotencyKey(user_id=1, key='new', request_hash='b' * 32, expires_at=now + timedelta(minutes=1)),
+        ])
+        db_session.commit()
+        assert purge_expired(db.engine, now=now) == 1
+        assert [record.key for record in db_session.query(IdempotencyKey)] == ['new']
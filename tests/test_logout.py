@@ -16,6 +16,13 @@ class TestLogout:
         assert 'ログアウトしました' in soup.find('div', class_='alert').text
         assert '/login' in response.request.path
 
+    def test_logout_clears_browser_storage(self, client, db_session, authenticated_user):
+        # 受注のキャッシュ（IndexedDB）を次の利用者に残さない
+        response = client.get('/logout')
+        assert response.headers['Clear-Site-Data'] == '"storage"'
+        assert any(header.startswith('order_cache=;') and 'Path=/orders' in header
+                   for header in response.headers.getlist('Set-Cookie'))
+
     def test_redirect_to_login_after_logout(self, client, db_session, authenticated_user):
         # authenticated_userフィクスチャがユーザーをログイン済み状態にするため、追加のログインは不要
         # self._login_user_for_test(client, authenticated_user)
@@ -0,0 +1,125 @@
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+import migrations
+from migrations import MIGRATIONS, applied_versions, upgrade
+from app import Base
+
+
+LEGACY_SCHEMA = (
+    'CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(64) NOT NULL, email VARCHAR(120) NOT NULL, '
+    'password_hash VARCHAR(256), is_admin BOOLEAN, is_active BOOLEAN, created_at DATETIME)',
+    'CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_name TEXT NOT NULL, project_name TEXT NOT NULL, '
+    'sales_amount NUMERIC, order_amount NUMERIC, invoiced_amount NUMERIC, order_date DATE NOT NULL, '
+    'contract_type VARCHAR(16), sales_stage VARCHAR(16), billing_month DATE, work_in_progress BOOLEAN, '
+    'description TEXT, created_at DATETIME, updated_at DATETIME)',
+    'CREATE TABLE project_costs (id INTEGER PRIMARY KEY, project_name VARCHAR(255) NOT NULL, '
+    'cost_month DATE NOT NULL, employee_cost NUMERIC(14, 2), bp_cost NUMERIC(14, 2), updated_at DATETIME)',
+    'CREATE UNIQUE INDEX uq_project_costs_project_month ON project_costs (project_name, cost_month)',
+    "INSERT INTO orders (customer_name, project_name, order_date) VALUES "
+    "('Customer A', 'Project A', '2024-01-10'), ('Customer A', 'Project B', '2024-02-10'), "
+    "('Customer B', 'Project A', '2024-03-10')",
+    "INSERT INTO project_costs (project_name, cost_month, employee_cost, bp_cost) VALUES "
+    "('Project A', '2024-01-01', 100, 50), ('Project C', '2024-01-01', 10, 0)",
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    yield engine
+    engine.dispose()
+
+
+class TestMigrations:
+
+    def _create_legacy_schema(self, engine):
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+
+    def test_upgrade_legacy_schema(self, engine):
+        self._create_legacy_schema(engine)
+
+        applied = upgrade(engine)
+        assert applied == [version for version, _, _ in MIGRATIONS]
+
+        inspector = inspect(engine)
+        assert {'customer_id', 'project_id'} <= {c['name'] for c in inspector.get_columns('orders')}
+        assert {
+            'ix_orders_customer_id', 'ix_orders_project_id', 'ix_orders_order_date_project_id',
+            'ix_orders_created_at_id', 'ix_orders_updated_at', 'ix_orders_billing_month'
+        } <= {index['name'] for index in inspector.get_indexes('orders')}
+        assert 'project_name' not in {c['name'] for c in inspector.get_columns('project_costs')}
+
+        with engine.connect() as connection:
+            missing = connection.execute(text(
+                'SELECT COUNT(*) FROM orders WHERE customer_id IS NULL OR project_id IS NULL'
+            )).scalar()
+            assert missing == 0
+            assert connection.execute(text('SELECT COUNT(*) FROM customers')).scalar() == 2
+            projects = dict(connection.execute(text('SELECT name, id FROM projects')).all())
+            assert set(projects) == {'Project A', 'Project B', 'Project C'}
+            costs = connection.execute(text(
+                'SELECT project_id FROM project_costs ORDER BY project_id'
+            )).scalars().all()
+            assert sorted(costs) == sorted([projects['Project A'], projects['Project C']])
+
+    def test_upgrade_is_idempotent(self, engine):
+        self._create_legacy_schema(engine)
+        upgrade(engine)
+
+        assert upgrade(engine) == []
+        with engine.connect() as connection:
+            assert applied_versions(connection) == {version for version, _, _ in MIGRATIONS}
+
+    def test_upgrade_to_target(self, engine):
+        self._create_legacy_schema(engine)
+
+        assert upgrade(engine, target=2) == [1, 2]
+        assert 'ix_orders_created_at_id' not in {index['name'] for index in inspect(engine).get_indexes('orders')}
+        assert upgrade(engine) == [version for version, _, _ in MIGRATIONS if version > 2]
+
+    def test_upgrade_fresh_database(self, engine):
+        applied = upgrade(engine)
+
+        assert applied == [version for version, _, _ in MIGRATIONS]
+        assert {'orders', 'customers', 'projects', 'project_costs', 'schema_migrations'} <= set(
+            inspect(engine).get_table_names()
+        )
+
+    def test_fresh_database_has_every_model_table(self, engine):
+        import models  # noqa: F401
+        upgrade(engine)
+
+        assert set(Base.metadata.tables) <= set(inspect(engine).get_table_names())
+
+    def test_first_migration_does_not_follow_models(self, engine):
+        # 移行1のテーブル定義は固定されており、後の移行で追加した列を含まない
+        upgrade(engine, target=1)
+
+        columns = {column['name'] for column in inspect(engine).get_columns('orders')}
+        assert 'customer_id' not in columns
+        assert 'idempotency_keys' not in inspect(engine).get_table_names()
+
+    def test_backfill_runs_in_id_batches(self, engine, monkeypatch):
+        self._create_legacy_schema(engine)
+        monkeypatch.setattr(migrations, 'BACKFILL_BATCH_SIZE', 2)
+
+        updates = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE orders'):
+                updates.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            upgrade(engine, target=2)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        # 受注3件を2件ずつ、customer_id と project_id それぞれに埋め戻す
+        assert len(updates) == 4
+        assert all('id >= ?' in statement for statement in updates)
+        with engine.connect() as connection:
+            assert connection.execute(text(
+                'SELECT COUNT(*) FROM orders WHERE customer_id IS NULL OR project_id IS NULL'
+            )).scalar() == 0
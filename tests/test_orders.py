@@ -1,4 +1,8 @@
+import json
 import pytest
+from datetime import date, datetime
+from bs4 import BeautifulSoup
+from models import Order
 from flask_login import current_user
 from routes import main_bp
 from forms import OrderForm
@@ -57,4 +61,63 @@ class TestOrdersPage:
     def test_login_required_decorator(self, client):
         response = client.get('/orders')
         assert response.status_code == 302
-        assert '/login' in response.headers['Location']
\ No newline at end of file
+        assert '/login' in response.headers['Location']
+
+    def test_orders_page_embeds_first_sync_page(self, client, authenticated_user, db_session):
+        db_session.add(Order(customer_name='Inline Customer', project_name='Inline Project', order_date=date(2023, 1, 1),
+                             updated_at=datetime(2023, 1, 1, 9, 0, 0)))
+        db_session.commit()
+
+        response = client.get('/orders')
+        script = BeautifulSoup(response.data, 'html.parser').find('script', {'id': 'initialOrderChanges'})
+        assert script is not None
+        initial = json.loads(script.string)
+        assert [order['customer_name'] for order in initial['orders']] == ['Inline Customer']
+        assert initial['has_more'] is False
+
+        # 埋め込んだトークンから続きを同期できる
+        response = client.get(f"/api/orders/changes?since={initial['next']}")
+        assert response.get_json()['orders'] == []
+
+    def test_orders_page_escapes_embedded_json(self, client, authenticated_user, db_session):
+        db_session.add(Order(customer_name='</script><script>alert(1)</script>', project_name='P',
+                             order_date=date(2023, 1, 1), updated_at=datetime(2023, 1, 1, 9, 0, 0)))
+        db_session.commit()
+
+        response = client.get('/orders')
+        assert b'</script><script>alert(1)' not in response.data
+        script = BeautifulSoup(response.data, 'html.parser').find('script', {'id': 'initialOrderChanges'})
+        assert json.loads(script.string)['orders'][0]['customer_name'] == '</script><script>alert(1)</script>'
+
+    def test_orders_page_without_inline_data(self, client, authenticated_user, app):
+        app.config['INLINE_INITIAL_DATA'] = False
+        response = client.get('/orders')
+        assert response.status_code == 200
+        assert b'initialOrderChanges' not in response.data
+
+    def test_orders_page_scopes_cache_by_user(self, client, authenticated_user):
+        response = client.get('/orders')
+        meta = BeautifulSoup(response.data, 'html.parser').find('meta', {'name': 'user-id'})
+        assert meta.get('content') == str(authenticated_user.id)
+
+    def test_orders_page_embeds_small_first_page(self, client, authenticated_user, db_session):
+        for index in range(routes.INLINE_ORDERS_LIMIT + 1):
+            db_session.add(Order(customer_name=f'Customer {index}', project_name='P', order_date=date(2023, 1, 1),
+                                 updated_at=datetime(2023, 1, 1, 9, 0, index % 60)))
+        db_session.commit()
+
+        response = client.get('/orders')
+        script = BeautifulSoup(response.data, 'html.parser').find('script', {'id': 'initialOrderChanges'})
+        initial = json.loads(script.string)
+        assert len(initial['orders']) == routes.INLINE_ORDERS_LIMIT
+        assert initial['has_more'] is True
+
+    def test_orders_page_skips_embed_when_browser_cache_is_ready(self, client, authenticated_user):
+        client.set_cookie(routes.ORDER_CACHE_COOKIE, str(authenticated_user.id), path='/orders')
+        response = client.get('/orders')
+        assert response.status_code == 200
+        assert b'initialOrderChanges' not in response.data
+
+        # 別のユーザーのキャッシュを示すCookieでは省かない
+        client.set_cookie(routes.ORDER_CACHE_COOKIE, str(authenticated_user.id + 1), path='/orders')
+        assert b'initialOrderChanges' in client.get('/orders').data
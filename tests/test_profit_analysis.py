@@ -1,7 +1,10 @@
 import pytest
 from flask_login import current_user
 from routes import main_bp
-from models import User
+from models import User, Order
+import json
+from datetime import date
+from bs4 import BeautifulSoup
 
 @pytest.fixture
 def client(app):
@@ -50,4 +53,19 @@ class TestProfitAnalysisPage:
     def test_login_required_decorator(self, client):
         response = client.get('/profit-analysis')
         assert response.status_code == 302
-        assert '/login' in response.headers['Location']
\ No newline at end of file
+        assert '/login' in response.headers['Location']
+
+    def test_profit_analysis_embeds_projects(self, client, authenticated_user, db_session):
+        db_session.add(Order(customer_name='Customer', project_name='Embedded Project', order_date=date(2024, 1, 1)))
+        db_session.commit()
+
+        response = client.get('/profit-analysis')
+        script = BeautifulSoup(response.data, 'html.parser').find('script', {'id': 'initialProjects'})
+        assert json.loads(script.string) == client.get('/api/projects').get_json()
+        assert json.loads(script.string) == {'projects': ['Embedded Project']}
+
+    def test_profit_analysis_without_inline_data(self, client, authenticated_user, app):
+        app.config['INLINE_INITIAL_DATA'] = False
+        response = client.get('/profit-analysis')
+        assert response.status_code == 200
+        assert b'initialProjects' not in response.data
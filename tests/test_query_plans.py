@@ -0,0 +1,172 @@
+import json
+import os
+import re
+from datetime import date
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, event
+from app import db
+from models import Order
+
+SNAPSHOT_DIR = Path(__file__).parent / 'query_plans'
+
+# UPDATE_QUERY_PLANS=1 で実行するとスナップショットを書き換える
+UPDATE_SNAPSHOTS = os.environ.get('UPDATE_QUERY_PLANS') == '1'
+
+# 設定するとMySQL互換DB（TiDB等）でもEXPLAINを確認する（スキーマは移行で作成される）
+MYSQL_EXPLAIN_URI = os.environ.get('QUERY_PLAN_MYSQL_URI')
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def _normalize_plan_line(detail):
+    # SQLiteのバージョン差（"SCAN TABLE orders" と "SCAN orders"）を吸収する
+    detail = re.sub(r'^(SCAN|SEARCH) TABLE ', r'\1 ', detail)
+    # 件数取得の全件走査はどの被覆索引でも同等で、索引の作成順によって選ばれる索引が変わる
+    return re.sub(r'^SCAN (\w+) USING COVERING INDEX \w+$', r'SCAN \1 USING COVERING INDEX *', detail)
+
+
+def _touches_orders(statement):
+    return re.search(r'\bFROM orders\b|\bJOIN orders\b', statement) is not None
+
+
+class TestQueryPlans:
+
+    def _seed_orders(self, db_session):
+        for index, project_name in enumerate(['Project A', 'Project B', 'Project A']):
+            db_session.add(Order(
+                customer_name='Customer A',
+                project_name=project_name,
+                sales_amount=1000,
+                order_amount=800,
+                invoiced_amount=500,
+                order_date=date(2024, 1, 10 + index),
+                billing_month=date(2024, 2, 1)
+            ))
+        db_session.commit()
+
+    def _capture(self, run):
+        """run() の間に発行されたSQLとCore文を記録する"""
+        cursor_statements = []
+        core_statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            cursor_statements.append((statement, parameters))
+
+        def before_execute(conn, clauseelement, multiparams, params, execution_options):
+            core_statements.append(clauseelement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(db.engine, 'before_execute', before_execute)
+        try:
+            run()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+            event.remove(db.engine, 'before_execute', before_execute)
+        return cursor_statements, core_statements
+
+    def _explain_sqlite(self, statements):
+        connection = db.session.connection()
+        plans = []
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+            plans.append({
+                'orders': _touches_orders(statement),
+                'plan': [_normalize_plan_line(row[3]) for row in rows]
+            })
+        return plans
+
+    def _assert_indexed(self, plans):
+        for entry in plans:
+            if not entry['orders']:
+                continue
+            for line in entry['plan']:
+                assert line != 'SCAN orders', f"full scan of orders: {entry['plan']}"
+                assert 'USE TEMP B-TREE' not in line, f"sort without index over orders: {entry['plan']}"
+
+    def _assert_snapshot(self, name, plans):
+        path = SNAPSHOT_DIR / f'{name}.json'
+        snapshot = [entry['plan'] for entry in plans]
+        if UPDATE_SNAPSHOTS or not path.exists():
+            path.write_text(json.dumps(snapshot, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+        assert snapshot == json.loads(path.read_text(encoding='utf-8')), \
+            f"query plan changed for {name}; rerun with UPDATE_QUERY_PLANS=1 if intended"
+
+    def _assert_mysql_plans(self, core_statements):
+        if not MYSQL_EXPLAIN_URI:
+            return
+        from migrations import upgrade
+        engine = create_engine(MYSQL_EXPLAIN_URI)
+        try:
+            upgrade(engine)
+            with engine.connect() as connection:
+                for statement in core_statements:
+                    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    for row in connection.exec_driver_sql(f'EXPLAIN {sql}').mappings():
+                        if row.get('table') != 'orders':
+                            continue
+                        assert row.get('type') != 'ALL', f"full scan of orders: {sql}"
+                        assert 'filesort' not in (row.get('Extra') or ''), f"filesort over orders: {sql}"
+        finally:
+            engine.dispose()
+
+    def _check(self, name, run):
+        cursor_statements, core_statements = self._capture(run)
+        plans = self._explain_sqlite(cursor_statements)
+        assert plans, f"no SELECT captured for {name}"
+        self._assert_indexed(plans)
+        self._assert_snapshot(name, plans)
+        self._assert_mysql_plans(core_statements)
+
+    def test_api_get_orders_plan(self, client, authenticated_user, db_session):
+        self._seed_orders(db_session)
+
+        def run():
+            response = client.get('/api/orders?page=1&per_page=50')
+            assert response.status_code == 200
+
+        self._check('api_get_orders', run)
+
+    def test_api_get_profit_data_plan(self, client, authenticated_user, db_session):
+        self._seed_orders(db_session)
+
+        def run():
+            response = client.get('/api/profit-data?project_name=Project A&start_date=2024-01-01&end_date=2024-01-31')
+            assert response.status_code == 200
+
+        self._check('api_get_profit_data', run)
+
+    def test_api_get_profit_data_all_projects_plan(self, client, authenticated_user, db_session):
+        self._seed_orders(db_session)
+
+        def run():
+            response = client.get('/api/profit-data?project_name=all&start_date=2024-01-01&end_date=2024-01-31')
+            assert response.status_code == 200
+
+        self._check('api_get_profit_data_all_projects', run)
+
+    def test_api_get_projects_plan(self, client, authenticated_user, db_session):
+        self._seed_orders(db_session)
+
+        def run():
+            response = client.get('/api/projects')
+            assert response.status_code == 200
+
+        self._check('api_get_projects', run)
+
+    def test_load_user_plan(self, app, authenticated_user, db_session):
+        user_id = authenticated_user.id
+        db_session.expunge_all()
+
+        def run():
+            assert app.login_manager._user_callback(str(user_id)) is not None
+
+        self._check('load_user', run)
@@ -0,0 +1,119 @@
+import shutil
+import pytest
+from datetime import date
+from bs4 import BeautifulSoup
+from app import create_app, db
+from models import User, Order
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    primary_path = tmp_path / 'primary.db'
+    replica_path = tmp_path / 'replica.db'
+    flask_app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{primary_path}",
+        "SQLALCHEMY_REPLICA_URIS": [f"sqlite:///{replica_path}"],
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SESSION_COOKIE_SECURE": False
+    })
+    flask_app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    with flask_app.app_context():
+        db.create_all()
+        user = User(username='testuser', email='test@example.com', is_active=True)
+        user.set_password('password')
+        db.session.add(user)
+        db.session.add(Order(customer_name='Customer A', project_name='Shared Project', order_date=date(2024, 1, 10)))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+    # レプリカはプライマリの複製から始め、以降の書き込みは反映しない（反映遅れの再現）
+    shutil.copy(primary_path, replica_path)
+    with flask_app.app_context():
+        with db.engines['replica_0'].begin() as connection:
+            connection.exec_driver_sql("INSERT INTO projects (name) VALUES ('Replica Only')")
+            connection.exec_driver_sql(
+                "INSERT INTO orders (customer_name, project_name, project_id, order_date, "
+                "sales_amount, order_amount, invoiced_amount) "
+                "SELECT 'Customer R', name, id, '2024-01-11', 0, 0, 0 FROM projects WHERE name = 'Replica Only'"
+            )
+
+    yield flask_app
+
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+@pytest.fixture
+def replica_client(replica_app):
+    client = replica_app.test_client()
+    response = client.get('/login')
+    csrf_token = BeautifulSoup(response.data, 'html.parser').find('input', {'name': 'csrf_token'}).get('value')
+    client.post('/login', data={'username': 'testuser', 'password': 'password', 'csrf_token': csrf_token})
+    return client
+
+class TestReplicaRouting:
+
+    def _get_csrf_token(self, client):
+        """Helper to get CSRF token from the orders page."""
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        csrf_token = soup.find('input', {'name': 'csrf_token'})
+        if csrf_token:
+            return csrf_token.get('value')
+        return None
+
+    def _project_names(self, client):
+        response = client.get('/api/projects')
+        assert response.status_code == 200
+        return response.get_json()['projects']
+
+    def _create_order(self, client):
+        csrf_token = self._get_csrf_token(client)
+        return client.post('/api/orders', data={
+            'customer_name': 'Customer B',
+            'project_name': 'Primary Only',
+            'order_date': '2024-02-01',
+            'csrf_token': csrf_token
+        })
+
+    def test_read_only_endpoints_use_replica(self, replica_client):
+        assert self._project_names(replica_client) == ['Replica Only', 'Shared Project']
+
+    def test_writes_go_to_primary(self, replica_app, replica_client):
+        replica_app.config['REPLICA_STICKY_SECONDS'] = 0
+        assert self._create_order(replica_client).status_code == 201
+
+        with replica_app.app_context():
+            assert db.session.query(Order).filter_by(project_name='Primary Only').count() == 1
+            with db.engines['replica_0'].connect() as connection:
+                count = connection.exec_driver_sql(
+                    "SELECT COUNT(*) FROM orders WHERE project_name = 'Primary Only'"
+                ).scalar()
+            assert count == 0
+
+        # 追従期間を過ぎるとレプリカから読む
+        assert 'Primary Only' not in self._project_names(replica_client)
+
+    def test_reads_stick_to_primary_after_own_write(self, replica_client):
+        assert self._create_order(replica_client).status_code == 201
+
+        assert self._project_names(replica_client) == ['Primary Only', 'Shared Project']
+
+    def test_other_users_still_read_replica(self, replica_app, replica_client):
+        assert self._create_order(replica_client).status_code == 201
+
+        other_client = replica_app.test_client()
+        response = other_client.get('/login')
+        csrf_token = BeautifulSoup(response.data, 'html.parser').find('input', {'name': 'csrf_token'}).get('value')
+        other_client.post('/login', data={'username': 'testuser', 'password': 'password', 'csrf_token': csrf_token})
+
+        assert self._project_names(other_client) == ['Replica Only', 'Shared Project']
+
+    def test_without_replicas_everything_uses_primary(self, client, authenticated_user, db_session):
+        db_session.add(Order(customer_name='Customer A', project_name='Project A', order_date=date(2024, 1, 10)))
+        db_session.commit()
+
+        assert self._project_names(client) == ['Project A']
@@ -0,0 +1,209 @@
+import sqlite3
+from datetime import date
+
+import pytest
+from bs4 import BeautifulSoup
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+import retry
+from app import db
+from metrics import get_metrics
+from models import IdempotencyKey, Order
+from retry import retryable_error, run_in_transaction
+
+
+class MySQLError(Exception):
+    """pymysql の例外と同じく args[0] にエラーコードを持つ"""
+
+
+def mysql_error(code, message='error'):
+    return OperationalError('COMMIT', {}, MySQLError(code, message))
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(retry.time, 'sleep', delays.append)
+    return delays
+
+
+class TestRetryableError:
+
+    @pytest.mark.parametrize('code, kind', [
+        (9007, 'write_conflict'),
+        (8028, 'schema_changed'),
+        (8022, 'txn_retry'),
+        (1213, 'deadlock'),
+        (1205, 'lock_wait_timeout'),
+    ])
+    def test_transient_mysql_errors(self, code, kind):
+        assert retryable_error(mysql_error(code)) == kind
+
+    def test_sqlite_locked(self):
+        error = OperationalError('COMMIT', {}, sqlite3.OperationalError('database is locked'))
+        assert retryable_error(error) == 'sqlite_locked'
+
+    def test_other_errors_are_not_retried(self):
+        assert retryable_error(IntegrityError('INSERT', {}, MySQLError(1062, 'Duplicate entry'))) is None
+        assert retryable_error(OperationalError('SELECT', {}, sqlite3.OperationalError('no such table: x'))) is None
+        assert retryable_error(ValueError('x')) is None
+
+
+class TestRunInTransaction:
+
+    def test_retries_until_success(self, app, no_sleep):
+        attempts = []
+
+        def work():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise mysql_error(9007, 'Write conflict')
+            return 'done'
+
+        assert run_in_transaction(work) == 'done'
+        assert len(attempts) == 3
+        assert len(no_sleep) == 2
+        assert all(0 <= delay <= app.config['DB_RETRY_MAX_DELAY'] for delay in no_sleep)
+        metrics = get_metrics(app)
+        assert metrics.get('db_retry.retries') == 2
+        assert metrics.get('db_retry.write_conflict') == 2
+        assert metrics.get('db_retry.recovered') == 1
+
+    def test_gives_up_after_max_attempts(self, app, no_sleep):
+        app.config['DB_RETRY_MAX_ATTEMPTS'] = 3
+        attempts = []
+
+        def work():
+            attempts.append(1)
+            raise mysql_error(1213, 'Deadlock found')
+
+        with pytest.raises(OperationalError):
+            run_in_transaction(work)
+        assert len(attempts) == 3
+        assert get_metrics(app).get('db_retry.exhausted') == 1
+
+    def test_gives_up_when_budget_is_spent(self, app, no_sleep):
+        app.config['DB_RETRY_BUDGET'] = 0
+        app.config['DB_RETRY_BASE_DELAY'] = 0.01
+        attempts = []
+
+        def work():
+            attempts.append(1)
+            raise mysql_error(9007)
+
+        with pytest.raises(OperationalError):
+            run_in_transaction(work)
+        assert len(attempts) == 1
+        assert no_sleep == []
+
+    def test_non_retryable_error_is_raised_immediately(self, app, no_sleep):
+        attempts = []
+
+        def work():
+            attempts.append(1)
+            raise IntegrityError('INSERT', {}, MySQLError(1062, 'Duplicate entry'))
+
+        with pytest.raises(IntegrityError):
+            run_in_transaction(work)
+        assert len(attempts) == 1
+        assert get_metrics(app).get('db_retry.retries') == 0
+
+
+class TestWriteRetry:
+
+    def _get_csrf_token(self, client):
+        response = client.get('/orders')
+        soup = BeautifulSoup(response.data, 'html.parser')
+        return soup.find('input', {'name': 'csrf_token'}).get('value')
+
+    def _fail_first_commit(self, monkeypatch, code=9007):
+        commit = db.session.commit
+        calls = []
+
+        def flaky_commit():
+            calls.append(1)
+            if len(calls) == 1:
+                raise mysql_error(code, 'Write conflict')
+            return commit()
+
+        monkeypatch.setattr(db.session, 'commit', flaky_commit)
+        return calls
+
+    def test_create_order_retries_write_conflict(self, client, authenticated_user, db_session, monkeypatch, no_sleep):
+        csrf_token = self._get_csrf_token(client)
+        self._fail_first_commit(monkeypatch)
+        response = client.post(
+            '/api/orders',
+            data={
+                'customer_name': 'Retry Customer',
+                'project_name': 'Retry Project',
+                'sales_amount': '1000',
+                'order_amount': '1000',
+                'invoiced_amount': '0',
+                'order_date': str(date.today()),
+                'contract_type': 'Type A',
+                'sales_stage': 'Stage 1',
+                'billing_month': str(date.today()),
+                'work_in_progress': 'n',
+                'description': 'retry',
+                'csrf_token': csrf_token
+            },
+            headers={'Idempotency-Key': 'retry-key'}
+        )
+        assert response.status_code == 201
+        assert db_session.query(Order).count() == 1
+        # ロールバックされたキーの登録も応答とともに保存し直す
+        record = db_session.get(IdempotencyKey, (authenticated_user.id, 'retry-key'))
+        assert record.status_code == 201
+        assert len(no_sleep) == 1
+
+    def test_idempotency_key_commits_with_retried_order(self, client, authenticated_user, db_session, monkeypatch,
+                                                        no_sleep):
+        csrf_token = self._get_csrf_token(client)
+        commit = db.session.commit
+        calls = []
+
+        def flaky_commit():
+            # 1回目は書き込み競合、やり直しはコミットし、応答の保存は失敗させる
+            calls.append(1)
+            if len(calls) == 1:
+                raise mysql_error(9007, 'Write conflict')
+            if len(calls) == 3:
+                raise mysql_error(2013, 'Lost connection')
+            return commit()
+
+        monkeypatch.setattr(db.session, 'commit', flaky_commit)
+        response = client.post(
+            '/api/orders',
+            data={
+                'customer_name': 'Retry Customer',
+                'project_name': 'Retry Project',
+                'order_date': str(date.today()),
+                'csrf_token': csrf_token
+            },
+            headers={'Idempotency-Key': 'retry-key-2'}
+        )
+        assert response.status_code == 201
+        assert db_session.query(Order).count() == 1
+        # やり直した受注と同じコミットでキーが処理中として登録されている
+        record = db_session.get(IdempotencyKey, (authenticated_user.id, 'retry-key-2'))
+        assert record is not None
+        assert record.status_code is None
+
+    def test_delete_order_retries_write_conflict(self, client, authenticated_user, db_session, monkeypatch, no_sleep):
+        order = Order(customer_name='Retry Customer', project_name='Retry Project', order_date=date.today())
+        db_session.add(order)
+        db_session.commit()
+        order_id = order.id
+
+        csrf_token = self._get_csrf_token(client)
+        self._fail_first_commit(monkeypatch, code=8028)
+        response = client.delete(f'/api/orders/{order_id}', headers={'X-CSRFToken': csrf_token})
+        assert response.status_code == 200
+        assert db_session.get(Order, order_id) is None
+        assert get_metrics().get('db_retry.schema_changed') == 1
@@ -0,0 +1,89 @@
+import threading
+from cache import SingleFlight
+from metrics import get_metrics
+
+
+class TestSingleFlight:
+
+    def _run_concurrently(self, app, flight, key, func, count):
+        results = []
+        errors = []
+
+        def call():
+            with app.app_context():
+                try:
+                    results.append(flight.do(key, func))
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def _wait_for_waiters(self, app, name, count):
+        # 後続の呼び出しがすべて待機に入るまで待つ
+        for _ in range(500):
+            if get_metrics(app).get(f'singleflight.{name}.shared') >= count:
+                return
+            threading.Event().wait(0.01)
+        raise AssertionError('waiters did not join the flight')
+
+    def test_concurrent_calls_share_one_execution(self, app):
+        flight = SingleFlight('test')
+        release = threading.Event()
+        calls = []
+
+        def expensive():
+            calls.append(1)
+            release.wait(5)
+            return {'total': 42}
+
+        threads, results, errors = self._run_concurrently(app, flight, ('key',), expensive, 5)
+        self._wait_for_waiters(app, 'test', 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert calls == [1]
+        assert errors == []
+        assert results == [{'total': 42}] * 5
+        assert get_metrics(app).get('singleflight.test.executions') == 1
+        assert get_metrics(app).get('singleflight.test.shared') == 4
+
+    def test_error_is_shared_with_waiters(self, app):
+        flight = SingleFlight('failing')
+        release = threading.Event()
+
+        def failing():
+            release.wait(5)
+            raise RuntimeError('db down')
+
+        threads, results, errors = self._run_concurrently(app, flight, ('key',), failing, 3)
+        self._wait_for_waiters(app, 'failing', 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == []
+        assert len(errors) == 3
+        assert all(str(error) == 'db down' for error in errors)
+
+    def test_sequential_calls_execute_again(self, app):
+        flight = SingleFlight('sequential')
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        assert flight.do(('key',), compute) == 1
+        assert flight.do(('key',), compute) == 2
+        assert get_metrics(app).get('singleflight.sequential.shared') == 0
+
+    def test_different_keys_do_not_share(self, app):
+        flight = SingleFlight('keys')
+
+        assert flight.do(('a',), lambda: 'a') == 'a'
+        assert flight.do(('b',), lambda: 'b') == 'b'
+        assert get_metrics(app).get('singleflight.keys.executions') == 2
@@ -0,0 +1,135 @@
+import threading
+import pytest
+from datetime import date
+from bs4 import BeautifulSoup
+from sqlalchemy import event
+from app import create_app, db
+from models import User, Order
+
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    flask_app = create_app({
+        "TESTING": True,
+        "SQLITE_PATH": str(tmp_path / 'orders.db'),
+        "RATELIMIT_ENABLED": False,
+        "SESSION_COOKIE_SECURE": False
+    })
+    flask_app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    with flask_app.app_context():
+        user = User(username='testuser', email='test@example.com', is_active=True)
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+        db.session.remove()
+
+    yield flask_app
+
+    with flask_app.app_context():
+        db.engine.dispose()
+
+def _login(flask_app):
+    client = flask_app.test_client()
+    response = client.get('/login')
+    csrf_token = BeautifulSoup(response.data, 'html.parser').find('input', {'name': 'csrf_token'}).get('value')
+    client.post('/login', data={'username': 'testuser', 'password': 'password', 'csrf_token': csrf_token})
+    return client, csrf_token
+
+def _order_form(csrf_token, customer_name):
+    return {
+        'customer_name': customer_name,
+        'project_name': 'SQLite Project',
+        'sales_amount': '1000',
+        'order_amount': '900',
+        'invoiced_amount': '800',
+        'order_date': '2024-05-01',
+        'csrf_token': csrf_token
+    }
+
+class TestSqliteMode:
+
+    def test_uses_file_database_with_pragmas(self, sqlite_app, tmp_path):
+        assert sqlite_app.config['SQLALCHEMY_DATABASE_URI'] == f"sqlite:///{tmp_path / 'orders.db'}"
+        with sqlite_app.app_context():
+            with db.engine.connect() as connection:
+                assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+                assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+                assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+                assert connection.exec_driver_sql('PRAGMA cache_size').scalar() == -65536
+
+    def test_pragmas_can_be_overridden(self, tmp_path):
+        flask_app = create_app({
+            "TESTING": True,
+            "SQLITE_PATH": str(tmp_path / 'custom.db'),
+            "SQLITE_PRAGMAS": {'busy_timeout': 1000}
+        })
+        with flask_app.app_context():
+            with db.engine.connect() as connection:
+                assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 1000
+                assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+            db.engine.dispose()
+
+    def test_production_mode_does_not_require_mysql(self, tmp_path, monkeypatch):
+        for name in ('MYSQL_USER', 'MYSQL_PASSWORD', 'MYSQL_HOST', 'MYSQL_DATABASE'):
+            monkeypatch.delenv(name, raising=False)
+        monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'production.db'))
+
+        flask_app = create_app()
+
+        assert flask_app.config['SQLALCHEMY_DATABASE_URI'] == f"sqlite:///{tmp_path / 'production.db'}"
+        assert flask_app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] == {'check_same_thread': False}
+
+    def test_writes_begin_immediate_and_reads_do_not(self, sqlite_app):
+        client, csrf_token = _login(sqlite_app)
+        statements = []
+        with sqlite_app.app_context():
+            engine = db.engine
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('BEGIN'):
+                statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            response = client.post('/api/orders', data=_order_form(csrf_token, 'Customer A'))
+            assert response.status_code == 201
+            assert 'BEGIN IMMEDIATE' in statements
+
+            statements.clear()
+            response = client.get('/api/orders')
+            assert response.status_code == 200
+            assert statements and 'BEGIN IMMEDIATE' not in statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+
+    def test_concurrent_writes_are_serialized(self, sqlite_app):
+        clients = [_login(sqlite_app) for _ in range(4)]
+        statuses = []
+
+        def write(client, csrf_token, index):
+            for number in range(5):
+                response = client.post('/api/orders', data=_order_form(csrf_token, f'Customer {index}-{number}'))
+                statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=write, args=(client, token, index))
+                   for index, (client, token) in enumerate(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert statuses == [201] * 20
+        with sqlite_app.app_context():
+            assert db.session.query(Order).count() == 20
+            assert sqlite_app.extensions['sqlite_write_lock'].locked() is False
+
+    def test_failed_write_releases_lock(self, sqlite_app):
+        client, csrf_token = _login(sqlite_app)
+        response = client.post('/api/orders', data={'csrf_token': csrf_token})
+        assert response.status_code == 400
+        assert sqlite_app.extensions['sqlite_write_lock'].locked() is False
+
+        response = client.post('/api/orders', data=_order_form(csrf_token, 'Customer B'))
+        assert response.status_code == 201
+        with sqlite_app.app_context():
+            assert db.session.query(Order).filter_by(customer_name='Customer B').one().order_date == date(2024, 5, 1)
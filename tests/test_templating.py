@@ -0,0 +1,87 @@
+import os
+import pytest
+import jinja2
+from jinja2.bccache import Bucket
+from app import create_app
+from templating import PortableBytecodeCache, precompile_templates
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def _create_app(directory, **config):
+    return create_app({
+        "TESTING": True,
+        "TEMPLATE_BYTECODE_DIR": str(directory),
+        "SESSION_COOKIE_SECURE": False,
+        **config
+    })
+
+class TestTemplateBytecodeCache:
+
+    def test_precompile_writes_bytecode_for_all_templates(self, app, tmp_path):
+        app.config['TEMPLATE_BYTECODE_DIR'] = str(tmp_path / 'cache')
+        names = precompile_templates(app)
+
+        assert {'base.html', 'orders.html', 'profit_analysis.html', '404.html', 'admin/users.html'} <= set(names)
+        assert len(os.listdir(tmp_path / 'cache')) == len(names)
+
+    def test_startup_loads_templates_without_compiling(self, app, tmp_path, monkeypatch):
+        app.config['TEMPLATE_BYTECODE_DIR'] = str(tmp_path / 'cache')
+        precompile_templates(app)
+
+        def fail_compile(*args, **kwargs):
+            raise AssertionError('template compiled from source')
+        monkeypatch.setattr(jinja2.Environment, 'compile', fail_compile)
+
+        cached_app = _create_app(tmp_path / 'cache')
+        assert isinstance(cached_app.jinja_env.bytecode_cache, PortableBytecodeCache)
+        # 起動時に全テンプレートが読み込まれている
+        assert len(cached_app.jinja_env.cache) == len(cached_app.jinja_env.list_templates())
+
+        response = cached_app.test_client().get('/login')
+        assert response.status_code == 200
+
+    def test_without_precompiled_directory_templates_compile_lazily(self, tmp_path):
+        plain_app = _create_app(tmp_path / 'missing')
+        assert plain_app.jinja_env.bytecode_cache is None
+        assert len(plain_app.jinja_env.cache) == 0
+
+    def test_bytecode_key_does_not_depend_on_path(self, tmp_path):
+        cache = PortableBytecodeCache(str(tmp_path))
+        assert cache.get_cache_key('orders.html', '/build/templates/orders.html') == \
+            cache.get_cache_key('orders.html', '/var/task/templates/orders.html')
+
+    def test_unwritable_directory_is_ignored(self, tmp_path):
+        cache = PortableBytecodeCache(str(tmp_path / 'missing'))
+        bucket = Bucket(jinja2.Environment(), 'key', 'checksum')
+        bucket.code = compile('x = 1', '<template>', 'exec')
+        cache.dump_bytecode(bucket)
+        assert not (tmp_path / 'missing').exists()
+
+class TestErrorTemplates:
+
+    def test_error_page_uses_code_template(self, client):
+        response = client.get('/no-such-page')
+        assert response.status_code == 404
+        assert b'404' in response.data
+
+    def test_error_page_falls_back_to_generic_template(self, client, app):
+        app.config['PROPAGATE_EXCEPTIONS'] = False
+        response = client.post('/health')
+        assert response.status_code == 405
+        assert b'Method Not Allowed' in response.data
+
+    def test_error_template_lookup_is_memoized(self, client, app, monkeypatch):
+        calls = []
+        select_template = app.jinja_env.select_template
+
+        def counting_select_template(names, *args, **kwargs):
+            calls.append(list(names))
+            return select_template(names, *args, **kwargs)
+        monkeypatch.setattr(app.jinja_env, 'select_template', counting_select_template)
+
+        for _ in range(3):
+            assert client.get('/no-such-page').status_code == 404
+        assert calls == [['404.html', 'error.html']]